@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "embedding_indexes" ADD COLUMN "precision" TEXT NOT NULL DEFAULT 'float32';
+
+-- Quantized HNSW indexes (halfvec / bit) are created on demand by
+-- scripts/embeddings/generate.py --precision, since they require pgvector >= 0.7
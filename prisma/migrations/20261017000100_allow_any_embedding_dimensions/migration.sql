@@ -0,0 +1,20 @@
+-- Allow embedding indexes of any dimension (text-embedding-3 models can be
+-- shortened with the `dimensions` request parameter). HNSW needs a fixed
+-- dimension, so each dimension gets a partial expression index instead of an
+-- index on the bare column; the size of each index version is recorded in
+-- embedding_indexes.dimensions.
+
+-- Indexes on the typed column must go before the type changes
+DROP INDEX IF EXISTS "embedding_documents_embedding_idx";
+DROP INDEX IF EXISTS "embedding_documents_embedding_half_idx";
+DROP INDEX IF EXISTS "embedding_documents_embedding_bit_idx";
+
+-- AlterTable
+ALTER TABLE "embedding_documents" ALTER COLUMN "embedding" TYPE vector;
+
+-- Recreate the default 1536-dimension index. Indexes for other dimensions and
+-- quantized precisions are created on demand by scripts/embeddings/generate.py
+CREATE INDEX embedding_documents_embedding_idx ON embedding_documents
+USING hnsw ((embedding::vector(1536)) vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+WHERE vector_dims(embedding) = 1536;
@@ -0,0 +1,3 @@
+-- AlterTable
+-- Existing indexes were chunked by LlamaIndex's default sentence splitter
+ALTER TABLE "embedding_indexes" ADD COLUMN "chunker" TEXT NOT NULL DEFAULT 'sentence-1024';
@@ -0,0 +1,18 @@
+-- scripts/embeddings/generate.py now writes full rebuilds straight into
+-- embedding_documents. The LlamaIndex PGVectorStore staging tables it used to
+-- fill first (data_llamaindex_embeddings, plus data_llamaindex_embeddings_<N>
+-- per shortened dimension) only held copies of those rows and were never
+-- cleaned up.
+DO $$
+DECLARE
+    staging_table TEXT;
+BEGIN
+    FOR staging_table IN
+        SELECT tablename FROM pg_tables
+        WHERE schemaname = current_schema()
+            AND (tablename = 'data_llamaindex_embeddings'
+                OR tablename ~ '^data_llamaindex_embeddings_[0-9]+$')
+    LOOP
+        EXECUTE format('DROP TABLE IF EXISTS %I', staging_table);
+    END LOOP;
+END $$;
@@ -0,0 +1,5 @@
+-- AlterTable
+-- Rows of index versions replaced by a newer active version. HNSW indexes
+-- built with generate.py --vector-index-scope active only cover rows that are
+-- not retired; existing rows are marked when such an index is first built.
+ALTER TABLE "embedding_documents" ADD COLUMN "retired" BOOLEAN NOT NULL DEFAULT false;
@@ -0,0 +1,13 @@
+-- AlterTable
+-- User indexes become overlays: only the user's own chunks are stored, on top
+-- of the global index version in "baseIndexId". "overlayFiles" maps each of
+-- the user's source files to its hash; global rows from files of the same
+-- name are replaced by the overlay's.
+ALTER TABLE "embedding_indexes" ADD COLUMN "baseIndexId" TEXT,
+ADD COLUMN "overlayFiles" JSONB;
+
+-- CreateIndex
+CREATE INDEX "embedding_indexes_baseIndexId_idx" ON "embedding_indexes"("baseIndexId");
+
+-- AddForeignKey
+ALTER TABLE "embedding_indexes" ADD CONSTRAINT "embedding_indexes_baseIndexId_fkey" FOREIGN KEY ("baseIndexId") REFERENCES "embedding_indexes"("id") ON DELETE RESTRICT ON UPDATE CASCADE;
@@ -0,0 +1,5 @@
+-- AlterTable
+-- Global rows a user overlay's chunks were deduplicated against, and so are
+-- served from the base instead of being stored. An in-place update of the
+-- global index can replace them; the overlay is rebuilt once any is missing.
+ALTER TABLE "embedding_indexes" ADD COLUMN "sharedRowIds" TEXT[] DEFAULT ARRAY[]::TEXT[];
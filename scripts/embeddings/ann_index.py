@@ -0,0 +1,333 @@
+"""
+Approximate nearest-neighbour (IVF) index for the JSON backend.
+
+The LlamaIndex JSON store can only be searched by parsing every vector and
+scoring all of them. Next to it, persist_index() writes `ann.npz`, an
+inverted-file index built with NumPy:
+
+- centroids: `lists` unit vectors trained with spherical k-means (k-means++
+  seeding, on a sample of the chunks for large roadmaps)
+- vectors: every chunk's unit vector, grouped by nearest centroid, with
+  `offsets` marking where each inverted list starts
+- ids: the docstore node id of each row
+
+A query scores the centroids, then only the rows of the `probes` closest
+lists, so it touches about probes / lists of the vectors. Scores within the
+probed lists are exact cosine similarities.
+
+`probes` is tuned at build time: the roadmap's own chunks are used as queries,
+and the smallest number of probes whose recall@10 against an exact scan
+reaches the target recall is stored. The build parameters and measured recall
+are recorded under "ann" in metadata.json, with a format version, so readers
+can reject artifacts they do not understand:
+
+    from ann_index import load_ann_index
+
+    ann = load_ann_index(persist_dir)
+    if ann is not None:
+        for node_id, score in ann.search(query_vector, k=5):
+            ...
+"""
+
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+from quantization import DEFAULT_RECALL_K, DEFAULT_RECALL_QUERIES, top_k
+
+ANN_FILE = "ann.npz"
+ANN_FORMAT_VERSION = 1
+ANN_TYPES = ("ivf", "none")
+
+DEFAULT_ANN_RECALL = 0.95
+
+# Below this many chunks a single list (an exact scan) is as fast as probing
+MIN_ANN_ROWS = 256
+
+KMEANS_ITERATIONS = 20
+# Training sample size per list; k-means needs far fewer rows than the index holds
+TRAINING_ROWS_PER_LIST = 64
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length, so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def default_lists(count: int) -> int:
+    """About sqrt(count) lists, which balances centroid and list scanning."""
+    if count < MIN_ANN_ROWS:
+        return 1
+    return int(round(math.sqrt(count)))
+
+
+def train_centroids(
+    vectors: np.ndarray,
+    lists: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """Spherical k-means over unit vectors; returns `lists` unit centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > lists * TRAINING_ROWS_PER_LIST:
+        sample = vectors[rng.choice(len(vectors), lists * TRAINING_ROWS_PER_LIST, replace=False)]
+
+    # k-means++ seeding, with cosine distance
+    centroids = np.empty((lists, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = sample[rng.integers(len(sample))]
+    distance = 1.0 - sample @ centroids[0]
+    for i in range(1, lists):
+        weights = np.maximum(distance, 0.0)
+        total = weights.sum()
+        chosen = rng.choice(len(sample), p=weights / total) if total > 0 else rng.integers(len(sample))
+        centroids[i] = sample[chosen]
+        distance = np.minimum(distance, 1.0 - sample @ centroids[i])
+
+    assignment = None
+    for _ in range(iterations):
+        similarity = sample @ centroids.T
+        new_assignment = similarity.argmax(axis=1)
+        if assignment is not None and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+
+        counts = np.bincount(assignment, minlength=lists)
+        order = np.argsort(assignment, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        centroids[filled] = normalize(sums[filled])
+
+        # Re-seed empty lists with the rows that fit their centroid worst
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            worst = np.argsort(similarity[np.arange(len(sample)), assignment])[: len(empty)]
+            centroids[empty[: len(worst)]] = sample[worst]
+
+    return centroids
+
+
+@dataclass
+class IvfIndex:
+    """An inverted-file index over unit vectors."""
+
+    centroids: np.ndarray  # (lists, dimensions)
+    offsets: np.ndarray  # (lists + 1,) start row of each list in `vectors`
+    vectors: np.ndarray  # (count, dimensions), grouped by list
+    ids: list[str]  # Docstore node id of each row
+    probes: int = 1
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        lists: Optional[int] = None,
+        iterations: int = KMEANS_ITERATIONS,
+        seed: int = 0,
+    ) -> "IvfIndex":
+        """Cluster the vectors into `lists` inverted lists (default: default_lists())."""
+        matrix = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        lists = max(1, min(lists or default_lists(len(ids)), len(ids)))
+
+        if lists == 1:
+            centroids = normalize(matrix.sum(axis=0, keepdims=True))
+            assignment = np.zeros(len(ids), dtype=np.int64)
+        else:
+            centroids = train_centroids(matrix, lists, iterations, seed)
+            assignment = (matrix @ centroids.T).argmax(axis=1)
+
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=lists))
+        return cls(centroids, offsets, np.ascontiguousarray(matrix[order]), [ids[i] for i in order])
+
+    def tune_probes(
+        self,
+        target_recall: float = DEFAULT_ANN_RECALL,
+        k: int = DEFAULT_RECALL_K,
+        sample: int = DEFAULT_RECALL_QUERIES,
+        seed: int = 0,
+    ) -> float:
+        """Set `probes` to the fewest lists that reach target_recall@k.
+
+        Up to `sample` stored vectors are used as queries, excluding their own
+        row. Rows in probed lists are scored exactly, so a true neighbour is
+        found exactly when its list is among the probed ones: recall for every
+        probe count comes from one ranking of the centroids.
+
+        Returns:
+            The recall@k reached with the chosen number of probes
+        """
+        count = len(self.ids)
+        if self.lists == 1 or count < 2:
+            self.probes = 1
+            return 1.0
+        k = min(k, count - 1)
+
+        rng = np.random.default_rng(seed)
+        query_rows = rng.choice(count, size=min(sample, count), replace=False)
+        queries = self.vectors[query_rows]
+
+        exact = queries @ self.vectors.T
+        exact[np.arange(len(query_rows)), query_rows] = -np.inf
+        neighbours = top_k(exact, k)
+
+        # rank[q, l]: position of list l in query q's centroid ranking
+        centroid_order = np.argsort(-(queries @ self.centroids.T), axis=1)
+        rank = np.empty_like(centroid_order)
+        np.put_along_axis(rank, centroid_order, np.arange(self.lists)[None, :], axis=1)
+        row_list = np.repeat(np.arange(self.lists), np.diff(self.offsets))
+        needed = np.take_along_axis(rank, row_list[neighbours], axis=1) + 1
+
+        needed = np.sort(needed.ravel())
+        self.probes = int(needed[max(0, math.ceil(target_recall * len(needed)) - 1)])
+        return float((needed <= self.probes).mean())
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int = DEFAULT_RECALL_K,
+        probes: Optional[int] = None,
+    ) -> list[tuple[str, float]]:
+        """The k most similar rows to a query vector, best first.
+
+        Returns:
+            (node id, cosine similarity) pairs
+        """
+        query = normalize(np.asarray(query, dtype=np.float32))
+        probes = max(1, min(probes or self.probes, self.lists))
+
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, probes - 1)[:probes]
+        selected = np.zeros(self.lists, dtype=bool)
+        selected[probed] = True
+        rows = np.flatnonzero(np.repeat(selected, np.diff(self.offsets)))
+        if len(rows) == 0:
+            return []
+
+        scores = self.vectors[rows] @ query
+        best = top_k(scores[None, :], k)[0]
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def save(self, path: Path) -> int:
+        """Write the index atomically; returns its size in bytes."""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                offsets=self.offsets,
+                vectors=self.vectors,
+                ids=np.asarray(self.ids, dtype=np.str_),
+            )
+        os.replace(tmp_path, path)
+        return path.stat().st_size
+
+    @classmethod
+    def load(cls, path: Path, probes: int = 1) -> "IvfIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["centroids"],
+                data["offsets"],
+                data["vectors"],
+                data["ids"].tolist(),
+                probes,
+            )
+
+
+def resolve_ann_params(requested: dict[str, Any], previous: Optional[dict[str, Any]]) -> dict[str, Any]:
+    """Build parameters for a roadmap: command-line values, else the ones its
+    last index was built with, else the defaults.
+
+    `lists` 0 means default_lists(); `probes` None means tune for targetRecall.
+    """
+    params = {"type": "ivf", "lists": 0, "probes": None, "targetRecall": DEFAULT_ANN_RECALL}
+    if previous:
+        params.update(previous.get("params", {}))
+    params.update({key: value for key, value in requested.items() if value is not None})
+    return params
+
+
+def build_ann_artifact(
+    persist_dir: Path,
+    ids: Sequence[str],
+    vectors: Sequence[Sequence[float]],
+    params: dict[str, Any],
+) -> dict[str, Any]:
+    """Build and write ann.npz for a persisted index.
+
+    Returns:
+        The "ann" entry for metadata.json. With params["type"] "none" it only
+        records the parameters, and any previous artifact is removed.
+    """
+    ann_path = persist_dir / ANN_FILE
+    if params["type"] == "none" or not ids:
+        ann_path.unlink(missing_ok=True)
+        return {"type": "none", "params": params}
+
+    started = time.perf_counter()
+    index = IvfIndex.build(ids, vectors, lists=params["lists"] or None)
+    if params["probes"]:
+        index.probes = min(params["probes"], index.lists)
+        recall = None
+    else:
+        recall = index.tune_probes(params["targetRecall"])
+    size = index.save(ann_path)
+    elapsed = time.perf_counter() - started
+
+    recall_note = f", recall@{DEFAULT_RECALL_K} {recall:.3f}" if recall is not None else ""
+    print(
+        f"  ANN index (ivf): {index.lists} lists, {index.probes} probes{recall_note}, "
+        f"{size / 1024 / 1024:.2f} MB in {elapsed:.2f}s"
+    )
+    return {
+        "type": "ivf",
+        "version": ANN_FORMAT_VERSION,
+        "file": ANN_FILE,
+        "params": params,
+        "count": len(index.ids),
+        "dimensions": int(index.vectors.shape[1]),
+        "lists": index.lists,
+        "probes": index.probes,
+        "recall": round(recall, 4) if recall is not None else None,
+        "recallK": DEFAULT_RECALL_K,
+        "iterations": KMEANS_ITERATIONS,
+        "seed": 0,
+        "buildSeconds": round(elapsed, 3),
+    }
+
+
+def load_ann_index(persist_dir: Path) -> Optional[IvfIndex]:
+    """Load a roadmap's ANN index, using the probes it was tuned for.
+
+    Returns:
+        The index, or None when metadata.json records none, or one in a format
+        version this reader does not support
+    """
+    metadata_file = persist_dir / "metadata.json"
+    if not metadata_file.exists():
+        return None
+    with metadata_file.open("r", encoding="utf-8") as f:
+        ann = json.load(f).get("ann")
+
+    if not ann or ann.get("type") != "ivf" or ann.get("version") != ANN_FORMAT_VERSION:
+        return None
+    ann_path = persist_dir / ann["file"]
+    if not ann_path.exists():
+        return None
+    return IvfIndex.load(ann_path, probes=ann["probes"])
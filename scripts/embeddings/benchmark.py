@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval benchmark for stored embedding indexes.
+
+Runs a labelled query set against a roadmap's stored index and reports
+recall@k, MRR and p50/p95/p99 search latency, so a change to chunking, model,
+quantization or HNSW parameters can be measured instead of guessed.
+
+The query set is a JSON array or JSONL file of objects:
+
+    {"query": "how do I become an apprentice?", "expected": ["apprenticeship"]}
+
+`expected` lists the roadmap node ids (content file stems) a good answer comes
+from. A chunk counts as a hit when its node id is expected; recall@k is the
+fraction of expected node ids among the top-k chunks, and MRR uses the rank of
+the first hit within the largest k.
+
+Query vectors come from the chunk embedding cache (keyed by model, dimensions
+and text) or an inline "vector" field, so repeat runs never call the API.
+Missing vectors are embedded once and cached, unless --offline is given.
+
+Targets:
+- exact:    NumPy brute-force cosine over the index's float32 vectors
+- store:    NumPy search of vectors.npy at its stored precision
+- json:     the LlamaIndex JSON index's own retriever
+- ann:      the IVF index (ann.npz), at its tuned probes or each --ann-probes value
+- postgres: the active pgvector index, once per --ef-search value
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from embedding_cache import EmbeddingCache
+from embedding_engine import shortened_dimensions
+from embedding_providers import make_embed_fn, provider_for_model
+from ann_index import load_ann_index
+from generate import (
+    DEFAULT_CACHE_DIR,
+    collect_binary_store,
+    find_project_root,
+    index_settings,
+    load_existing_metadata,
+    load_postgres_metadata,
+)
+from postgres_session import create_pool, get_database_url, transaction
+from quantization import BINARY_RERANK_FACTOR, cosine_scores, sign_scores, top_k
+from vector_store_binary import ROWS_FILE, VECTORS_FILE, load_binary_store
+
+TARGETS = ("exact", "store", "json", "ann", "postgres")
+DEFAULT_KS = (1, 5, 10)
+
+# pgvector's default hnsw.ef_search is 40
+DEFAULT_EF_SEARCH = (40, 100, 200)
+
+# A search returns the node ids of its top chunks, best first
+SearchFn = Callable[[str, np.ndarray, int], list[str]]
+
+
+def load_query_set(path: Path) -> list[dict[str, Any]]:
+    """Load a labelled query set from a JSON array or JSONL file."""
+    text = path.read_text(encoding="utf-8")
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    queries = []
+    for number, entry in enumerate(entries, start=1):
+        expected = entry.get("expected")
+        if isinstance(expected, str):
+            expected = [expected]
+        if not entry.get("query") or not expected:
+            raise ValueError(f"{path}: entry {number} needs a query and expected node ids")
+        queries.append({"query": entry["query"], "expected": expected, "vector": entry.get("vector")})
+    return queries
+
+
+def embed_queries(
+    queries: list[dict[str, Any]],
+    model_name: str,
+    dimensions: int,
+    cache_dir: Path,
+    offline: bool = False,
+) -> np.ndarray:
+    """Return one query vector per entry, from the entry, the cache or the API.
+
+    Queries are embedded by the provider of the index's model. Vectors fetched
+    from the API are written to the cache, so only the first run of a query
+    set needs network access.
+    """
+    texts = [entry["query"] for entry in queries]
+    cache = EmbeddingCache(cache_dir, model_name, shortened_dimensions(model_name, dimensions))
+    try:
+        vectors = cache.get_many(texts)
+        for i, entry in enumerate(queries):
+            if entry["vector"] is not None:
+                vectors[i] = entry["vector"]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and offline:
+            raise ValueError(
+                f"{len(missing)} queries have no cached vector for {model_name} "
+                f"({dimensions} dimensions); run once without --offline"
+            )
+        if missing:
+            print(f"Embedding {len(missing)} uncached queries...")
+            embed = make_embed_fn(provider_for_model(model_name), model_name, dimensions)
+            fetched = embed([texts[i] for i in missing])
+            cache.put_many([texts[i] for i in missing], fetched)
+            for i, vector in zip(missing, fetched):
+                vectors[i] = vector
+    finally:
+        cache.close()
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.shape[1] != dimensions:
+        raise ValueError(f"Query vectors have {matrix.shape[1]} dimensions, index has {dimensions}")
+    return matrix
+
+
+def score_query(retrieved: list[str], expected: list[str], ks: list[int]) -> tuple[dict[int, float], float]:
+    """Compute recall@k for each k and the reciprocal rank of one query.
+
+    Returns:
+        ({k: recall}, reciprocal rank of the first hit, or 0 if none)
+    """
+    expected_ids = set(expected)
+    recall = {k: len(set(retrieved[:k]) & expected_ids) / len(expected_ids) for k in ks}
+    reciprocal_rank = next(
+        (1.0 / rank for rank, node_id in enumerate(retrieved, start=1) if node_id in expected_ids),
+        0.0,
+    )
+    return recall, reciprocal_rank
+
+
+def latency_summary(latencies: list[float]) -> dict[str, float]:
+    """p50/p95/p99 of per-query latencies, in milliseconds."""
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+
+def run_target(
+    search: SearchFn,
+    queries: list[dict[str, Any]],
+    query_vectors: np.ndarray,
+    ks: list[int],
+) -> dict[str, Any]:
+    """Run every query against one search function and aggregate the metrics."""
+    limit = max(ks)
+    # One untimed query, so connection setup and page faults are not counted
+    search(queries[0]["query"], query_vectors[0], limit)
+
+    recall_sums = {k: 0.0 for k in ks}
+    reciprocal_rank_sum = 0.0
+    latencies = []
+    for entry, vector in zip(queries, query_vectors):
+        start = time.perf_counter()
+        retrieved = search(entry["query"], vector, limit)
+        latencies.append(time.perf_counter() - start)
+
+        recall, reciprocal_rank = score_query(retrieved, entry["expected"], ks)
+        for k in ks:
+            recall_sums[k] += recall[k]
+        reciprocal_rank_sum += reciprocal_rank
+
+    return {
+        "recall": {str(k): round(recall_sums[k] / len(queries), 4) for k in ks},
+        "mrr": round(reciprocal_rank_sum / len(queries), 4),
+        "latencyMs": latency_summary(latencies),
+    }
+
+
+def matrix_search(
+    matrix: np.ndarray,
+    node_ids: list[str],
+    precision: str = "float32",
+    dimensions: Optional[int] = None,
+) -> SearchFn:
+    """Brute-force search over a vector matrix, scored like the TS binary store."""
+
+    def search(_query: str, vector: np.ndarray, k: int) -> list[str]:
+        queries = vector[None, :]
+        if precision == "binary":
+            scores = sign_scores(matrix, queries, dimensions or len(vector))
+        elif precision == "float16":
+            scores = cosine_scores(matrix, queries.astype(np.float16))
+        else:
+            scores = cosine_scores(matrix, queries)
+        return [node_ids[row] for row in top_k(scores, k)[0]]
+
+    return search
+
+
+def docstore_node_ids(persist_dir: Path) -> dict[str, Optional[str]]:
+    """Map docstore node ids to the roadmap node ids in their metadata."""
+    with (persist_dir / "docstore.json").open("r", encoding="utf-8") as f:
+        docs = json.load(f)["docstore/data"]
+    return {
+        row_id: doc["__data__"].get("metadata", {}).get("node_id")
+        for row_id, doc in docs.items()
+    }
+
+
+def load_json_index(persist_dir: Path, dimensions: int):
+    """Load the LlamaIndex JSON index without creating an OpenAI client."""
+    from llama_index.core import MockEmbedding, StorageContext, load_index_from_storage
+
+    # Queries carry their own vectors, so the index's embed model is never called
+    storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
+    return load_index_from_storage(storage_context, embed_model=MockEmbedding(embed_dim=dimensions))
+
+
+def json_index_search(index) -> SearchFn:
+    """Search through the JSON index's LlamaIndex retriever."""
+    from llama_index.core.schema import QueryBundle
+
+    def search(query: str, vector: np.ndarray, k: int) -> list[str]:
+        retriever = index.as_retriever(similarity_top_k=k)
+        results = retriever.retrieve(QueryBundle(query_str=query, embedding=vector.tolist()))
+        return [result.node.metadata.get("node_id") for result in results]
+
+    return search
+
+
+def ann_search(ann, node_ids: dict[str, str], probes: Optional[int] = None) -> SearchFn:
+    """Search the IVF index; node_ids maps docstore ids to roadmap node ids."""
+
+    def search(_query: str, vector: np.ndarray, k: int) -> list[str]:
+        return [node_ids[node_id] for node_id, _ in ann.search(vector, k, probes)]
+
+    return search
+
+
+def postgres_nearest_sql(
+    precision: str,
+    dimensions: int,
+    index_param: str = "index_id",
+    overlay_param: Optional[str] = None,
+) -> str:
+    """The nearest rows of one index version with their distances, as in
+    nearestRowsSql() in embeddings-postgres.ts.
+
+    With overlay_param, rows from the global files that overlay replaces are
+    left out. Binary searches fetch BINARY_RERANK_FACTOR candidates per result
+    and re-rank them at full precision.
+    """
+    where = (
+        f'"indexId" = %({index_param})s AND vector_dims(embedding) = {dimensions} AND NOT retired'
+    )
+    if overlay_param:
+        where += f"""
+            AND NOT EXISTS (
+                SELECT 1 FROM embedding_indexes o
+                WHERE o.id = %({overlay_param})s
+                    AND (o."overlayFiles" -> (metadata->>'file_name')) IS NOT NULL
+            )"""
+    if precision == "float16":
+        cast = f"halfvec({dimensions})"
+        return f"""
+            SELECT "nodeId", embedding::{cast} <=> %(embedding)s::{cast} AS distance
+            FROM embedding_documents
+            WHERE {where}
+            ORDER BY embedding::{cast} <=> %(embedding)s::{cast}
+            LIMIT %(limit)s
+        """
+    if precision == "binary":
+        return f"""
+            SELECT "nodeId", embedding <=> %(embedding)s::vector AS distance FROM (
+                SELECT "nodeId", embedding FROM embedding_documents
+                WHERE {where}
+                ORDER BY binary_quantize(embedding)::bit({dimensions}) <~> binary_quantize(%(embedding)s::vector)
+                LIMIT %(limit)s * {BINARY_RERANK_FACTOR}
+            ) candidates
+            ORDER BY distance
+            LIMIT %(limit)s
+        """
+    cast = f"vector({dimensions})"
+    return f"""
+        SELECT "nodeId", embedding::{cast} <=> %(embedding)s::{cast} AS distance
+        FROM embedding_documents
+        WHERE {where}
+        ORDER BY embedding::{cast} <=> %(embedding)s::{cast}
+        LIMIT %(limit)s
+    """
+
+
+def postgres_search_sql(precision: str, dimensions: int, overlay: bool = False) -> str:
+    """The query searchSimilarDocuments() runs in embeddings-postgres.ts.
+
+    Takes named parameters embedding, index_id and limit, and for a user
+    overlay base_index_id: the overlay's and its global index's top results
+    are merged.
+    """
+    if not overlay:
+        return postgres_nearest_sql(precision, dimensions)
+    return f"""
+        SELECT "nodeId", distance FROM (
+            ({postgres_nearest_sql(precision, dimensions)})
+            UNION ALL
+            ({postgres_nearest_sql(precision, dimensions, "base_index_id", "index_id")})
+        ) merged
+        ORDER BY distance
+        LIMIT %(limit)s
+    """
+
+
+def postgres_search(
+    conn,
+    index_id: str,
+    precision: str,
+    dimensions: int,
+    base_index_id: Optional[str] = None,
+) -> SearchFn:
+    """Search the active Postgres index (merged with its global index, for a
+    user overlay) on a connection with ef_search already set."""
+    sql = postgres_search_sql(precision, dimensions, overlay=base_index_id is not None)
+    cursor = conn.cursor()
+
+    def search(_query: str, vector: np.ndarray, k: int) -> list[str]:
+        embedding = "[" + ",".join(repr(float(value)) for value in vector) + "]"
+        cursor.execute(
+            sql,
+            {"index_id": index_id, "base_index_id": base_index_id, "embedding": embedding, "limit": k},
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    return search
+
+
+def print_report(results: list[dict[str, Any]], ks: list[int]) -> None:
+    """Print one line of metrics per target."""
+    header = f"{'target':<22}" + "".join(f"{f'R@{k}':>8}" for k in ks)
+    header += f"{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(f"\n{header}")
+    print("-" * len(header))
+    for result in results:
+        name = result["target"]
+        if "efSearch" in result:
+            name += f" (ef={result['efSearch']})"
+        if "probes" in result:
+            name += f" (probes={result['probes']})"
+        latency = result["latencyMs"]
+        print(
+            f"{name:<22}"
+            + "".join(f"{result['recall'][str(k)]:>8.3f}" for k in ks)
+            + f"{result['mrr']:>8.3f}{latency['p50']:>10.2f}{latency['p95']:>10.2f}{latency['p99']:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark recall, MRR and latency of a roadmap's stored embedding index"
+    )
+    parser.add_argument("--roadmap", required=True, help="Roadmap ID (e.g., electrician-bc)")
+    parser.add_argument(
+        "--queries",
+        type=Path,
+        required=True,
+        help="Labelled query set: JSON array or JSONL of {query, expected}",
+    )
+    parser.add_argument(
+        "--target",
+        nargs="+",
+        choices=TARGETS,
+        default=None,
+        help="Targets to benchmark (default: exact, store, json, ann when present; postgres with --use-postgres)",
+    )
+    parser.add_argument(
+        "--use-postgres",
+        action="store_true",
+        help="Benchmark the active Postgres index (requires DATABASE_URL)",
+    )
+    parser.add_argument(
+        "--user-id",
+        default=None,
+        help="User ID of a user-specific Postgres index (optional)",
+    )
+    parser.add_argument(
+        "--k",
+        nargs="+",
+        type=int,
+        default=list(DEFAULT_KS),
+        help=f"Cutoffs for recall@k (default: {' '.join(map(str, DEFAULT_KS))})",
+    )
+    parser.add_argument(
+        "--ef-search",
+        nargs="+",
+        type=int,
+        default=list(DEFAULT_EF_SEARCH),
+        help=f"hnsw.ef_search values for the postgres target (default: {' '.join(map(str, DEFAULT_EF_SEARCH))})",
+    )
+    parser.add_argument(
+        "--ann-probes",
+        nargs="+",
+        type=int,
+        default=None,
+        help="IVF lists probed per query for the ann target (default: the tuned value)",
+    )
+    parser.add_argument(
+        "--base-path",
+        type=Path,
+        default=None,
+        help="Base project path (default: auto-detect project root)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Embedding cache holding the query vectors (default: scripts/embeddings/.cache)",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Fail instead of calling the embedding API for uncached queries",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Also write the results as JSON to this file",
+    )
+
+    args = parser.parse_args()
+    if min(args.k) < 1:
+        parser.error("--k values must be at least 1")
+    if args.ann_probes and min(args.ann_probes) < 1:
+        parser.error("--ann-probes values must be at least 1")
+    ks = sorted(set(args.k))
+
+    if args.base_path is None:
+        args.base_path = find_project_root()
+    env_path = args.base_path / ".env"
+    if env_path.exists():
+        load_dotenv(env_path)
+
+    persist_dir = args.base_path / "src/data/embeddings" / args.roadmap / "index"
+    has_metadata = (persist_dir / "metadata.json").exists()
+    has_json_index = (persist_dir / "docstore.json").exists()
+    has_store = (persist_dir / VECTORS_FILE).exists() and (persist_dir / ROWS_FILE).exists()
+    ann = load_ann_index(persist_dir) if has_json_index else None
+
+    targets = args.target
+    if targets is None:
+        targets = (["exact", "json"] if has_json_index else []) + (["store"] if has_store else [])
+        if ann is not None:
+            targets.append("ann")
+        if args.use_postgres:
+            targets.append("postgres")
+    if "postgres" in targets and not args.use_postgres:
+        parser.error("the postgres target requires --use-postgres")
+    if any(target in ("exact", "json") for target in targets) and not has_json_index:
+        parser.error(f"No JSON index at {persist_dir}")
+    if "ann" in targets and ann is None:
+        parser.error(f"No ANN index at {persist_dir}")
+    if "store" in targets and not has_store:
+        parser.error(f"No binary vector store at {persist_dir}")
+    if not targets:
+        parser.error(f"No stored index found for {args.roadmap}")
+
+    pool = None
+    postgres_index = None
+    if "postgres" in targets:
+        pool = create_pool(get_database_url(), max_connections=1)
+        with transaction(pool) as conn:
+            postgres_index = load_postgres_metadata(conn, args.roadmap, args.user_id)
+        if not postgres_index:
+            parser.error(f"No active Postgres index for {args.roadmap}")
+
+    # Every target must be embedded with the same model, since the queries are
+    # embedded once
+    settings = {}
+    if has_metadata and targets != ["postgres"]:
+        settings["JSON index"] = index_settings(load_existing_metadata(persist_dir))[:2]
+    if postgres_index:
+        settings["Postgres index"] = index_settings(postgres_index)[:2]
+    if len(set(settings.values())) > 1:
+        raise ValueError(f"Indexes were embedded with different models: {settings}")
+    model_name, dimensions = next(iter(settings.values()))
+
+    queries = load_query_set(args.queries)
+    print(f"Benchmarking {args.roadmap}: {len(queries)} queries, {model_name} ({dimensions} dimensions)")
+    query_vectors = embed_queries(queries, model_name, dimensions, args.cache_dir, args.offline)
+
+    results = []
+    try:
+        if "exact" in targets or "json" in targets or "ann" in targets:
+            index = load_json_index(persist_dir, dimensions)
+            if "exact" in targets:
+                vectors, ids = collect_binary_store(index)
+                search = matrix_search(
+                    np.asarray(vectors, dtype=np.float32),
+                    [index.docstore.docs[node_id].metadata.get("node_id") for node_id in ids],
+                )
+                results.append({"target": "exact", **run_target(search, queries, query_vectors, ks)})
+                print("✓ exact")
+            if "json" in targets:
+                search = json_index_search(index)
+                results.append({"target": "json", **run_target(search, queries, query_vectors, ks)})
+                print("✓ json")
+            if "ann" in targets:
+                node_ids = {
+                    node_id: node.metadata.get("node_id")
+                    for node_id, node in index.docstore.docs.items()
+                }
+                for probes in args.ann_probes or [ann.probes]:
+                    search = ann_search(ann, node_ids, probes)
+                    result = run_target(search, queries, query_vectors, ks)
+                    results.append({
+                        "target": "ann",
+                        "lists": ann.lists,
+                        "probes": min(probes, ann.lists),
+                        **result,
+                    })
+                    print(f"✓ ann (probes={probes})")
+
+        if "store" in targets:
+            matrix, sidecar = load_binary_store(persist_dir)
+            # The sidecar only holds docstore ids; roadmap node ids come from
+            # the docstore, as the app reads text and metadata
+            node_ids = docstore_node_ids(persist_dir)
+            search = matrix_search(
+                matrix,
+                [node_ids.get(row_id) for row_id in sidecar["ids"]],
+                sidecar.get("dtype", "float32"),
+                sidecar.get("dimensions"),
+            )
+            result = run_target(search, queries, query_vectors, ks)
+            results.append({"target": "store", "precision": sidecar.get("dtype", "float32"), **result})
+            print("✓ store")
+
+        if "postgres" in targets:
+            _, _, precision, _ = index_settings(postgres_index)
+            for ef_search in args.ef_search:
+                with transaction(pool) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+                    search = postgres_search(
+                        conn,
+                        postgres_index["indexId"],
+                        precision,
+                        dimensions,
+                        base_index_id=postgres_index.get("baseIndexId"),
+                    )
+                    result = run_target(search, queries, query_vectors, ks)
+                results.append({
+                    "target": "postgres",
+                    "precision": precision,
+                    "efSearch": ef_search,
+                    **result,
+                })
+                print(f"✓ postgres (ef_search={ef_search})")
+    finally:
+        if pool is not None:
+            pool.closeall()
+
+    print_report(results, ks)
+
+    if args.output:
+        report = {
+            "roadmapId": args.roadmap,
+            "userId": args.user_id,
+            "model": model_name,
+            "dimensions": dimensions,
+            "queries": len(queries),
+            "k": ks,
+            "results": results,
+        }
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
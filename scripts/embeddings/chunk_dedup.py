@@ -0,0 +1,228 @@
+"""
+Exact and near-duplicate chunk detection before embedding.
+
+The source PDFs repeat boilerplate (headers, legal text, competency tables
+that barely change between levels), so many chunks say the same thing. Each
+chunk is compared against the representatives kept so far:
+
+- exact: SHA-256 of the chunk text with case and whitespace normalized
+- near: MinHash signatures over word shingles, bucketed with LSH, and a
+  candidate is a duplicate when its estimated Jaccard similarity reaches the
+  threshold
+
+Only representatives are embedded and stored. Each duplicate is recorded in
+its representative's `duplicates` metadata, so the sources it came from stay
+discoverable and incremental updates know which files depend on which chunks.
+"""
+
+import hashlib
+import re
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+# Exact duplicates only: near-duplicate detection at 0.9 also merges chunks
+# that differ only in a level or a number (e.g. wage tables per level), so it
+# is opt-in
+DEFAULT_DEDUP_THRESHOLD = 1.0
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+
+# Metadata key listing the chunks a representative stands in for
+DUPLICATES_KEY = "duplicates"
+
+# Prime just above 2**32 for the universal hash family (a * x + b) mod p
+_HASH_PRIME = np.uint64(4294967311)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace, so layout differences do not matter."""
+    return " ".join(text.lower().split())
+
+
+def shingles(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> set[str]:
+    """Word n-grams of normalized text (the whole text if it is shorter)."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def lsh_bands(threshold: float, num_perm: int, false_negative_weight: float = 0.9) -> tuple[int, int]:
+    """Pick (bands, rows) for LSH so pairs at `threshold` are rarely missed.
+
+    Candidates are verified against the threshold afterwards, so false
+    positives only cost a comparison and false negatives are weighted higher.
+    """
+    similarities = np.linspace(0.0, 1.0, 201)
+    below = similarities < threshold
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            probability = 1 - (1 - similarities**rows) ** bands
+            false_positive = probability[below].mean() * threshold if below.any() else 0.0
+            false_negative = (1 - probability[~below]).mean() * (1 - threshold)
+            error = (
+                (1 - false_negative_weight) * false_positive
+                + false_negative_weight * false_negative
+            )
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """MinHash signatures from a fixed, seeded family of hash functions."""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # Below 2**32, so a * x fits in 64 bits for 32-bit shingle hashes
+        self.a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                for s in shingle_set
+            ),
+            dtype=np.uint64,
+        )
+        permuted = ((self.a[:, None] * hashes[None, :]) % _HASH_PRIME + self.b[:, None]) % _HASH_PRIME
+        return permuted.min(axis=1)
+
+
+class ChunkDeduplicator:
+    """Keeps one representative per group of exact or near-duplicate chunks.
+
+    One deduplicator covers one index, so duplicates are found across files
+    and across pipeline windows. A threshold of 1.0 only removes exact
+    duplicates (the default).
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_DEDUP_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Dedup threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.near = threshold < 1.0
+        if self.near:
+            self.hasher = MinHasher(num_perm)
+            self.bands, self.rows = lsh_bands(threshold, num_perm)
+
+        self._exact: dict[str, str] = {}
+        self._signatures: dict[str, np.ndarray] = {}
+        self._buckets: list[dict[bytes, list[str]]] = (
+            [{} for _ in range(self.bands)] if self.near else []
+        )
+
+        # representative id -> duplicate records found in this run
+        self.duplicates: dict[str, list[dict[str, Any]]] = {}
+        self.exact_count = 0
+        self.near_count = 0
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def _find(self, text: str) -> tuple[Optional[str], str, Optional[np.ndarray]]:
+        """Return (representative id or None, exact key, signature) for a text."""
+        exact_key = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        if exact_key in self._exact:
+            return self._exact[exact_key], exact_key, None
+        if not self.near:
+            return None, exact_key, None
+
+        signature = self.hasher.signature(shingles(text, self.shingle_size))
+        seen = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            for candidate in bucket.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    return candidate, exact_key, signature
+        return None, exact_key, signature
+
+    def _register(self, chunk_id: str, exact_key: str, signature: Optional[np.ndarray]) -> None:
+        self._exact[exact_key] = chunk_id
+        if signature is not None:
+            self._signatures[chunk_id] = signature
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                bucket.setdefault(key, []).append(chunk_id)
+
+    def add(self, chunk_id: str, text: str) -> Optional[str]:
+        """Register a chunk, returning its representative's id if it is a duplicate."""
+        representative, exact_key, signature = self._find(text)
+        if representative is not None:
+            if signature is None:
+                self.exact_count += 1
+            else:
+                self.near_count += 1
+            return representative
+
+        self._register(chunk_id, exact_key, signature)
+        return None
+
+    def seed(self, chunk_id: str, text: str) -> None:
+        """Register a chunk that is already stored, so new chunks can match it."""
+        representative, exact_key, signature = self._find(text)
+        if representative is None:
+            self._register(chunk_id, exact_key, signature)
+
+    def filter_nodes(self, nodes: list, texts: list[str]) -> list:
+        """Drop duplicate nodes, recording each one under its representative.
+
+        `texts[i]` is the content of `nodes[i]` that is compared.
+        """
+        kept = []
+        for node, text in zip(nodes, texts):
+            representative = self.add(node.node_id, text)
+            if representative is None:
+                kept.append(node)
+                continue
+            self.duplicates.setdefault(representative, []).append({
+                "id": node.node_id,
+                "node_id": node.metadata.get("node_id"),
+                "file_name": node.metadata.get("file_name"),
+            })
+        return kept
+
+
+def duplicate_dependents(
+    duplicates_by_file: Iterable[tuple[Optional[str], list[dict[str, Any]]]],
+    removed_files: set[str],
+) -> set[str]:
+    """Files whose duplicate chunks are represented by a chunk of a removed file.
+
+    Those files must be re-processed, or their content would leave the index
+    along with the representative. Re-processing a file re-embeds its own
+    representatives too, dropping their duplicate records, so the files
+    depending on those are included as well, up to a fixed point.
+
+    Args:
+        duplicates_by_file: (representative's file name, its duplicates) pairs
+        removed_files: files being deleted or re-embedded
+    """
+    dependents_by_file: dict[str, set[str]] = {}
+    for file_name, duplicates in duplicates_by_file:
+        if file_name:
+            dependents_by_file.setdefault(file_name, set()).update(
+                duplicate["file_name"] for duplicate in duplicates if duplicate.get("file_name")
+            )
+
+    reprocessed = set(removed_files)
+    pending = list(reprocessed)
+    while pending:
+        for dependent in dependents_by_file.get(pending.pop(), ()):
+            if dependent not in reprocessed:
+                reprocessed.add(dependent)
+                pending.append(dependent)
+    return reprocessed - removed_files
@@ -0,0 +1,211 @@
+"""
+Structure-aware, token-budgeted chunking for roadmap documents.
+
+Markdown documents keep their body as text and are split on their heading
+hierarchy; PDFs are split on page boundaries (pages are joined with
+PAGE_BREAK). Within those boundaries, paragraphs are packed greedily up to
+`chunk_tokens`, counting the embedded metadata header. A section that fits in
+the budget is never split; only oversized sections fall back to paragraph,
+line, sentence and finally word boundaries.
+
+Metadata follows an explicit policy: EMBED_METADATA_KEYS are embedded with
+each chunk and LLM_METADATA_KEYS are shown to the LLM. Every other key
+(frontmatter, file bookkeeping) is stored but never embedded, so it does not
+cost tokens or dilute the vectors.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Sequence
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from markdown_parser import split_markdown_sections
+
+# Same size as the sentence splitter it replaces, which also overlapped chunks by 200 tokens
+DEFAULT_CHUNK_TOKENS = 1024
+
+# Separates PDF pages in a document's text
+PAGE_BREAK = "\f"
+
+# Chunker of indexes built before structured chunking: LlamaIndex's default
+# SentenceSplitter with 1024-token chunks
+LEGACY_CHUNKER = "sentence-1024"
+
+EMBED_METADATA_KEYS = ("title", "type", "section")
+LLM_METADATA_KEYS = ("title", "type", "section", "file_name", "page_start", "page_end")
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunker_name(chunk_tokens: int) -> str:
+    """Identify a chunker configuration, so indexes built with another one are rebuilt."""
+    return f"structured-{chunk_tokens}"
+
+
+def apply_metadata_policy(node: BaseNode) -> None:
+    """Exclude every metadata key outside the embed and LLM policies."""
+    node.excluded_embed_metadata_keys = [k for k in node.metadata if k not in EMBED_METADATA_KEYS]
+    node.excluded_llm_metadata_keys = [k for k in node.metadata if k not in LLM_METADATA_KEYS]
+
+
+def split_to_budget(text: str, budget: int, count_tokens: Callable[[str], int]) -> list[str]:
+    """Split text into pieces of at most `budget` tokens at the coarsest boundary possible."""
+    if count_tokens(text) <= budget:
+        return [text]
+
+    for separator in ("\n\n", "\n", SENTENCE_PATTERN, " "):
+        if isinstance(separator, str):
+            pieces, joiner = text.split(separator), separator
+        else:
+            pieces, joiner = separator.split(text), " "
+        pieces = [piece for piece in pieces if piece.strip()]
+        if len(pieces) > 1:
+            return pack_pieces(pieces, joiner, budget, count_tokens)
+
+    # A single word longer than the budget: cut it by characters
+    size = max(1, len(text) * budget // count_tokens(text))
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def pack_pieces(
+    pieces: Sequence[str],
+    joiner: str,
+    budget: int,
+    count_tokens: Callable[[str], int],
+) -> list[str]:
+    """Greedily join consecutive pieces while they fit in the budget."""
+    chunks: list[str] = []
+    current: list[str] = []
+    for piece in pieces:
+        for part in split_to_budget(piece, budget, count_tokens):
+            if current and count_tokens(joiner.join(current + [part])) > budget:
+                chunks.append(joiner.join(current))
+                current = []
+            current.append(part)
+    if current:
+        chunks.append(joiner.join(current))
+    return chunks
+
+
+@dataclass
+class _Block:
+    """A unit of text that is packed whole, with where it came from."""
+
+    text: str
+    label: Optional[str]  # Heading path of a markdown section
+    page: Optional[int]  # 1-based PDF page
+    starts_group: bool  # First block of a section or page
+
+
+class StructuredNodeParser(NodeParser):
+    """Chunk markdown by heading and PDFs by page, packed to a token budget."""
+
+    chunk_tokens: int = Field(
+        default=DEFAULT_CHUNK_TOKENS, gt=0, description="Target chunk size in tokens."
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StructuredNodeParser"
+
+    def _parse_nodes(
+        self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any
+    ) -> list[BaseNode]:
+        from embedding_engine import count_tokens_default
+
+        count_tokens = count_tokens_default()
+        parsed: list[BaseNode] = []
+        for document in nodes:
+            text = document.get_content(metadata_mode=MetadataMode.NONE)
+            if document.metadata.get("file_type") == "pdf":
+                blocks = self._pdf_blocks(text)
+            else:
+                blocks = self._markdown_blocks(text)
+
+            # The embedded metadata header counts against every chunk's budget
+            header = {k: v for k, v in document.metadata.items() if k in EMBED_METADATA_KEYS}
+            longest_label = max((len(b.label or "") for b in blocks), default=0)
+            header_tokens = count_tokens(
+                "\n".join(f"{k}: {v}" for k, v in header.items()) + "\nsection: " + "x" * longest_label
+            )
+            budget = max(self.chunk_tokens - header_tokens, self.chunk_tokens // 4)
+
+            for chunk_blocks in self._pack(blocks, budget, count_tokens):
+                for piece in pack_pieces(
+                    [block.text for block in chunk_blocks], "\n\n", budget, count_tokens
+                ):
+                    node = build_nodes_from_splits([piece], document, id_func=self.id_func)[0]
+                    node.metadata = {**document.metadata, **self._location(chunk_blocks)}
+                    apply_metadata_policy(node)
+                    parsed.append(node)
+        return parsed
+
+    def _markdown_blocks(self, text: str) -> list[_Block]:
+        blocks = []
+        for section in split_markdown_sections(text):
+            # The document title is already embedded as metadata
+            label = " > ".join(section.path[1:] if section.level > 1 else ()) or None
+            heading = f"{'#' * section.level} {section.title}" if section.level > 1 else ""
+            paragraphs = section.paragraphs
+            # Keep headings with their first paragraph
+            if heading:
+                paragraphs = [f"{heading}\n\n{paragraphs[0]}" if paragraphs else heading] + paragraphs[1:]
+            for i, paragraph in enumerate(paragraphs):
+                blocks.append(_Block(paragraph.strip(), label, None, i == 0))
+        return blocks
+
+    def _pdf_blocks(self, text: str) -> list[_Block]:
+        blocks = []
+        for page_number, page in enumerate(text.split(PAGE_BREAK), start=1):
+            paragraphs = [p for p in re.split(r"\n\s*\n", page) if p.strip()]
+            for i, paragraph in enumerate(paragraphs):
+                blocks.append(_Block(paragraph.strip(), None, page_number, i == 0))
+        return blocks
+
+    def _pack(
+        self, blocks: list[_Block], budget: int, count_tokens: Callable[[str], int]
+    ) -> list[list[_Block]]:
+        """Group blocks into chunks, starting a new chunk at a section or page
+        boundary whenever the whole section or page would not fit."""
+        groups: list[list[_Block]] = []
+        for block in blocks:
+            if block.starts_group or not groups:
+                groups.append([])
+            groups[-1].append(block)
+
+        def tokens(group_blocks: list[_Block]) -> int:
+            return count_tokens("\n\n".join(block.text for block in group_blocks))
+
+        chunks: list[list[_Block]] = []
+        current: list[_Block] = []
+        for group in groups:
+            if current and tokens(current + group) > budget:
+                chunks.append(current)
+                current = []
+            if tokens(group) <= budget:
+                current.extend(group)
+                continue
+            # Oversized section or page: pack its paragraphs on their own
+            for block in group:
+                if current and tokens(current + [block]) > budget:
+                    chunks.append(current)
+                    current = []
+                current.append(block)
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _location(blocks: list[_Block]) -> dict[str, Any]:
+        """Section (where the chunk starts) or page range metadata of a chunk."""
+        location: dict[str, Any] = {}
+        if blocks[0].label:
+            location["section"] = blocks[0].label
+        pages = [block.page for block in blocks if block.page is not None]
+        if pages:
+            location["page_start"], location["page_end"] = min(pages), max(pages)
+        return location
@@ -0,0 +1,113 @@
+"""
+Persistent, content-addressed cache for chunk embeddings.
+
+Entries are keyed by (model, dimensions, SHA-256 of the chunk text), so a chunk
+is only ever sent to the embedding API once per model configuration, no matter
+which file it came from or which storage backend is being written. The cache is
+a single SQLite file, which keeps lookups cheap and writes atomic without
+adding any dependencies. One cache may be shared by concurrent targets of a
+run; access to the connection is serialized with a lock.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Sequence
+
+
+def hash_text(text: str) -> str:
+    """Compute the SHA-256 hash of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    """Serialize an embedding as little-endian float32 bytes."""
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> list[float]:
+    """Deserialize float32 bytes produced by pack_vector()."""
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache scoped to one (model, dimensions) pair."""
+
+    def __init__(self, cache_dir: Path, model_name: str, dimensions: Optional[int] = None):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / "embeddings.sqlite3"
+        self.model_name = model_name
+        # 0 means "the model's native dimension"
+        self.dimensions = dimensions or 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, texts: Sequence[str]) -> list[Optional[list[float]]]:
+        """Look up embeddings for texts, returning None for cache misses."""
+        hashes = [hash_text(text) for text in texts]
+        found: dict[str, list[float]] = {}
+
+        # Stay well below SQLite's bound-parameter limit
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start : start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                rows = self._conn.execute(
+                    f"""
+                    SELECT text_hash, vector FROM embeddings
+                    WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})
+                    """,
+                    (self.model_name, self.dimensions, *chunk),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = unpack_vector(blob)
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hits = sum(1 for vector in results if vector is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Store embeddings for texts (existing entries are left untouched)."""
+        now = datetime.now(timezone.utc).isoformat()
+        entries = [
+            (self.model_name, self.dimensions, hash_text(text), pack_vector(vector), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO embeddings (model, dimensions, text_hash, vector, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                entries,
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,342 @@
+"""
+Concurrent, token-packed, rate-limited embedding engine.
+
+Texts are packed into request batches up to a token budget and sent through a
+thread pool, while a shared limiter keeps the whole run under the provider's
+requests-per-minute and tokens-per-minute quotas. Rate-limit (429) and
+server (5xx) errors are retried with exponential backoff; a 429 also pauses
+every worker and temporarily lowers the request rate.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional, Sequence
+
+# OpenAI embedding limits: 2048 inputs and 300k tokens per request
+MAX_BATCH_SIZE = 2048
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_TOKENS = 100_000
+DEFAULT_TPM = 1_000_000
+DEFAULT_RPM = 3_000
+DEFAULT_MAX_RETRIES = 8
+
+EmbedFn = Callable[[list[str]], list[list[float]]]
+# Called with each completed request's texts and vectors
+BatchCallback = Callable[[list[str], list[list[float]]], None]
+
+# Native output dimensions of OpenAI, common local (fastembed) and fake models
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "BAAI/bge-small-en-v1.5": 384,
+    "BAAI/bge-base-en-v1.5": 768,
+    "BAAI/bge-large-en-v1.5": 1024,
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "fake-hashing": 1536,
+}
+
+# Models that accept a `dimensions` parameter (Matryoshka truncation); the
+# fake hashing model produces any size directly
+SHORTENABLE_MODELS = ("text-embedding-3-small", "text-embedding-3-large", "fake-hashing")
+
+
+class RetryableError(Exception):
+    """Raised by an embed function when a request may succeed if retried."""
+
+    def __init__(self, message: str, rate_limited: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+
+
+def count_tokens_default() -> Callable[[str], int]:
+    """Return a token counter using LlamaIndex's bundled cl100k tokenizer."""
+    from llama_index.core.utils import get_tokenizer
+
+    tokenizer = get_tokenizer()
+    return lambda text: len(tokenizer(text))
+
+
+def pack_batches(
+    token_counts: Sequence[int],
+    batch_tokens: int,
+    max_batch_size: int = MAX_BATCH_SIZE,
+) -> list[list[int]]:
+    """Group text positions into batches that stay within a token budget.
+
+    A single text larger than the budget gets a batch of its own.
+    """
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+
+    for position, tokens in enumerate(token_counts):
+        if current and (
+            current_tokens + tokens > batch_tokens or len(current) >= max_batch_size
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(position)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+class RateLimiter:
+    """Shared token-bucket limiter for requests and tokens per minute.
+
+    `scale` shrinks on rate-limit errors and recovers gradually on success,
+    so sustained 429s reduce throughput instead of producing retry storms.
+    """
+
+    def __init__(self, rpm: Optional[int] = DEFAULT_RPM, tpm: Optional[int] = DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scale = 1.0
+        self._lock = threading.Lock()
+        self._request_allowance = float(rpm or 0)
+        self._token_allowance = float(tpm or 0)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.rpm:
+            self._request_allowance = min(
+                float(self.rpm), self._request_allowance + elapsed * self.rpm * self.scale / 60
+            )
+        if self.tpm:
+            self._token_allowance = min(
+                float(self.tpm), self._token_allowance + elapsed * self.tpm * self.scale / 60
+            )
+
+    def acquire(self, tokens: int) -> None:
+        """Block until one request of `tokens` tokens fits in both budgets."""
+        # A batch can never need more than a full minute's token budget
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self._paused_until - now
+                if wait <= 0:
+                    request_ok = not self.rpm or self._request_allowance >= 1
+                    tokens_ok = not self.tpm or self._token_allowance >= tokens
+                    if request_ok and tokens_ok:
+                        if self.rpm:
+                            self._request_allowance -= 1
+                        if self.tpm:
+                            self._token_allowance -= tokens
+                        return
+
+                    # Sleep roughly until the scarcer budget refills
+                    wait = 0.05
+                    if self.rpm and not request_ok:
+                        wait = max(wait, (1 - self._request_allowance) * 60 / (self.rpm * self.scale))
+                    if self.tpm and not tokens_ok:
+                        wait = max(
+                            wait, (tokens - self._token_allowance) * 60 / (self.tpm * self.scale)
+                        )
+            time.sleep(min(wait, 5.0))
+
+    def backoff(self, seconds: float) -> None:
+        """Pause all callers and halve the request rate after a rate-limit error."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.scale = max(0.1, self.scale / 2)
+
+    def recover(self) -> None:
+        """Gradually restore the request rate after a successful request."""
+        with self._lock:
+            self.scale = min(1.0, self.scale + 0.05)
+
+
+class EmbeddingEngine:
+    """Embed texts with concurrent, token-packed, rate-limited requests."""
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_tokens: int = DEFAULT_BATCH_TOKENS,
+        tpm: Optional[int] = DEFAULT_TPM,
+        rpm: Optional[int] = DEFAULT_RPM,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.concurrency = max(1, concurrency)
+        self.batch_tokens = batch_tokens
+        self.max_retries = max_retries
+        self.max_batch_size = max_batch_size
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self._count_tokens = count_tokens
+
+        # Run statistics
+        self.requests = 0
+        self.retries = 0
+        self.tokens = 0
+        # Seconds per successful request, for the run report's latency histogram
+        self.latencies: list[float] = []
+        self._stats_lock = threading.Lock()
+
+    def count_tokens(self, text: str) -> int:
+        if self._count_tokens is None:
+            self._count_tokens = count_tokens_default()
+        return self._count_tokens(text)
+
+    def _embed_batch(self, texts: list[str], tokens: int) -> list[list[float]]:
+        """Send one batch, retrying rate-limit and server errors with backoff."""
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            started = time.perf_counter()
+            try:
+                vectors = self.embed_fn(texts)
+            except RetryableError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = e.retry_after or min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                with self._stats_lock:
+                    self.retries += 1
+                if e.rate_limited:
+                    self.limiter.backoff(delay)
+                    print(f"  Rate limited, backing off {delay:.1f}s (attempt {attempt})")
+                else:
+                    print(f"  Retrying batch in {delay:.1f}s after error: {e} (attempt {attempt})")
+                    time.sleep(delay)
+                continue
+
+            self.limiter.recover()
+            with self._stats_lock:
+                self.requests += 1
+                self.tokens += tokens
+                self.latencies.append(time.perf_counter() - started)
+            return vectors
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        show_progress: bool = True,
+        on_batch: Optional[BatchCallback] = None,
+    ) -> list[list[float]]:
+        """Embed texts, returning vectors in input order.
+
+        `on_batch` is called from the calling thread as each request completes.
+        If a request fails for good, requests not yet started are cancelled,
+        but those already running still complete and reach `on_batch` before
+        the error is raised, so their tokens are not lost.
+        """
+        if not texts:
+            return []
+
+        token_counts = [self.count_tokens(text) for text in texts]
+        batches = pack_batches(token_counts, self.batch_tokens, self.max_batch_size)
+        results: list[Optional[list[float]]] = [None] * len(texts)
+
+        progress = None
+        if show_progress:
+            from tqdm import tqdm
+
+            progress = tqdm(total=len(texts), desc="Generating embeddings")
+
+        error: Optional[BaseException] = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {
+                    executor.submit(
+                        self._embed_batch,
+                        [texts[i] for i in batch],
+                        sum(token_counts[i] for i in batch),
+                    ): batch
+                    for batch in batches
+                }
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    batch = futures[future]
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                            for pending in futures:
+                                pending.cancel()
+                        continue
+                    for position, vector in zip(batch, vectors):
+                        results[position] = vector
+                    if on_batch is not None:
+                        on_batch([texts[i] for i in batch], vectors)
+                    if progress is not None:
+                        progress.update(len(batch))
+        finally:
+            if progress is not None:
+                progress.close()
+
+        if error is not None:
+            raise error
+        return results  # type: ignore[return-value]
+
+
+def resolve_dimensions(model_name: str, dimensions: Optional[int] = None) -> int:
+    """Return the output dimension for a model, validating a requested one."""
+    native = MODEL_DIMENSIONS.get(model_name)
+    if dimensions is None:
+        if native is None:
+            raise ValueError(f"Unknown dimensions for model {model_name}; pass --dimensions")
+        return native
+
+    if dimensions <= 0:
+        raise ValueError(f"Dimensions must be positive, got {dimensions}")
+    if native is not None and dimensions > native:
+        raise ValueError(f"{model_name} produces at most {native} dimensions, got {dimensions}")
+    if dimensions != native and model_name not in SHORTENABLE_MODELS:
+        raise ValueError(f"{model_name} does not support shortened embeddings")
+    return dimensions
+
+
+def shortened_dimensions(model_name: str, dimensions: int) -> Optional[int]:
+    """The `dimensions` request parameter: None when the model's native size is used."""
+    return None if dimensions == MODEL_DIMENSIONS.get(model_name) else dimensions
+
+
+def make_openai_embed_fn(model_name: str, dimensions: Optional[int] = None) -> EmbedFn:
+    """Create an embed function that calls the OpenAI embeddings API directly.
+
+    The client's own retries are disabled so that the engine's limiter sees
+    every 429 and can slow the whole run down.
+    """
+    import openai
+
+    client = openai.OpenAI(max_retries=0, timeout=60.0)
+    request_dimensions = shortened_dimensions(model_name, dimensions) if dimensions else None
+    kwargs = {"dimensions": request_dimensions} if request_dimensions else {}
+
+    def embed(texts: list[str]) -> list[list[float]]:
+        # Match LlamaIndex's OpenAIEmbedding input normalization
+        inputs = [text.replace("\n", " ") for text in texts]
+        try:
+            response = client.embeddings.create(input=inputs, model=model_name, **kwargs)
+        except openai.RateLimitError as e:
+            try:
+                retry_after = float(e.response.headers.get("retry-after", ""))
+            except ValueError:
+                retry_after = None
+            raise RetryableError(str(e), rate_limited=True, retry_after=retry_after) from e
+        except (openai.InternalServerError, openai.APIConnectionError) as e:
+            raise RetryableError(str(e)) from e
+        return [item.embedding for item in response.data]
+
+    return embed
@@ -0,0 +1,182 @@
+"""
+Embedding providers behind one embed-function interface.
+
+Every provider returns an EmbedFn (a batch of texts in, one vector per text
+out) that EmbeddingEngine batches, parallelizes and caches the same way:
+
+- openai: the OpenAI embeddings API (requires OPENAI_API_KEY)
+- local: ONNX models run on the CPU through fastembed (pip install fastembed);
+  one shared session with a single intra-op thread per call, so the engine's
+  worker threads spread batches across every core
+- fake: deterministic feature hashing of words, with no model and no network,
+  for tests and for benchmarking the rest of the pipeline. Texts sharing
+  words get similar vectors, so retrieval benchmarks still mean something.
+
+Local and fake models have no request quotas, so the engine runs them without
+rate limits and with smaller batches (see PROVIDER_DEFAULTS).
+"""
+
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from embedding_engine import (
+    DEFAULT_BATCH_TOKENS,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RPM,
+    DEFAULT_TPM,
+    EmbedFn,
+    make_openai_embed_fn,
+)
+
+PROVIDERS = ("openai", "local", "fake")
+
+DEFAULT_MODELS = {
+    "openai": "text-embedding-3-small",
+    "local": "BAAI/bge-small-en-v1.5",
+    "fake": "fake-hashing",
+}
+
+# Most local models truncate their input at 512 tokens
+LOCAL_MAX_TOKENS = 512
+
+# Engine settings when the command line does not override them:
+# (concurrency, batch_tokens, tpm, rpm), with None for "one per CPU" or "no limit"
+PROVIDER_DEFAULTS: dict[str, tuple[Optional[int], int, Optional[int], Optional[int]]] = {
+    "openai": (DEFAULT_CONCURRENCY, DEFAULT_BATCH_TOKENS, DEFAULT_TPM, DEFAULT_RPM),
+    "local": (None, 8_192, None, None),
+    "fake": (None, 8_192, None, None),
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def provider_for_model(model_name: str) -> str:
+    """The provider that produces a model's embeddings, for indexes built earlier."""
+    if model_name.startswith("fake-"):
+        return "fake"
+    if model_name.startswith("text-embedding-"):
+        return "openai"
+    return "local"
+
+
+def engine_settings(provider: str) -> dict[str, Any]:
+    """EmbeddingEngine keyword arguments suited to a provider."""
+    concurrency, batch_tokens, tpm, rpm = PROVIDER_DEFAULTS[provider]
+    return {
+        "concurrency": concurrency or os.cpu_count() or 1,
+        "batch_tokens": batch_tokens,
+        "tpm": tpm,
+        "rpm": rpm,
+    }
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_feature(word: str, dimensions: int) -> tuple[int, float]:
+    """Bucket and sign of a word; stable across processes, unlike hash()."""
+    digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest % dimensions, 1.0 if digest >> 63 else -1.0
+
+
+def make_fake_embed_fn(dimensions: int) -> EmbedFn:
+    """Create a deterministic embed function that hashes words into a unit vector."""
+
+    def embed(texts: list[str]) -> list[list[float]]:
+        matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = [_word_feature(word, dimensions) for word in WORD_PATTERN.findall(text.lower())]
+            if not features:
+                # Empty text still gets a valid, distinct unit vector
+                features = [_word_feature("", dimensions)]
+            buckets, signs = zip(*features)
+            np.add.at(matrix[row], list(buckets), signs)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    return embed
+
+
+def make_local_embed_fn(model_name: str, dimensions: Optional[int] = None) -> EmbedFn:
+    """Create an embed function that runs an ONNX model on the CPU.
+
+    The model is loaded (and downloaded, the first time) on the first call.
+    """
+    try:
+        from fastembed import TextEmbedding
+    except ImportError as e:
+        raise ImportError(
+            "The local provider requires fastembed: pip install fastembed"
+        ) from e
+
+    model = None
+    lock = threading.Lock()
+
+    def embed(texts: list[str]) -> list[list[float]]:
+        nonlocal model
+        with lock:
+            if model is None:
+                # ONNX Runtime sessions are thread-safe: concurrent batches run
+                # on separate cores with one thread each
+                model = TextEmbedding(model_name, threads=1)
+        vectors = np.asarray(list(model.embed(texts, batch_size=len(texts))), dtype=np.float32)
+        if dimensions is not None and vectors.shape[1] != dimensions:
+            raise ValueError(
+                f"{model_name} produced {vectors.shape[1]} dimensions, expected {dimensions}"
+            )
+        return vectors.tolist()
+
+    return embed
+
+
+def make_embed_fn(provider: str, model_name: str, dimensions: Optional[int] = None) -> EmbedFn:
+    """Create the embed function of a provider."""
+    if provider == "openai":
+        return make_openai_embed_fn(model_name, dimensions)
+    if provider == "local":
+        return make_local_embed_fn(model_name, dimensions)
+    if provider == "fake":
+        if dimensions is None:
+            raise ValueError("The fake provider needs a dimension")
+        return make_fake_embed_fn(dimensions)
+    raise ValueError(f"Unknown embedding provider {provider!r}; use one of {', '.join(PROVIDERS)}")
+
+
+class ProviderEmbedding(BaseEmbedding):
+    """LlamaIndex embedding model backed by a local or fake provider.
+
+    Index construction only needs it for nodes without a precomputed
+    embedding, so the embed function is created on first use.
+    """
+
+    provider: str
+    dimensions: Optional[int] = None
+    _embed_fn: Optional[EmbedFn] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ProviderEmbedding"
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        if self._embed_fn is None:
+            self._embed_fn = make_embed_fn(self.provider, self.model_name, self.dimensions)
+        return self._embed_fn(texts)
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts)
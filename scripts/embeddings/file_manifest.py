@@ -0,0 +1,75 @@
+"""
+Persisted hash manifest for stat-based change detection.
+
+The manifest remembers each content file's (size, mtime_ns, inode) next to its
+SHA-256 hash. On the next run a file whose stat signature is unchanged reuses
+the stored hash instead of being read again, so a run over an unchanged corpus
+costs one stat() per file. Files whose signature changed are re-hashed, and
+detect_changes() still compares hashes, so touching a file without editing it
+never triggers re-embedding.
+
+Manifests are machine-local (inodes and mtimes do not survive a checkout), so
+they live in the cache directory rather than next to the committed index.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+# Read files in large blocks; hashing small blocks is dominated by call overhead
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def compute_file_hash(file_path: Path) -> str:
+    """Compute SHA-256 hash of a file."""
+    sha256_hash = hashlib.sha256()
+    with open(file_path, "rb", buffering=0) as f:
+        buffer = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            sha256_hash.update(view[:read])
+    return sha256_hash.hexdigest()
+
+
+def stat_signature(stat: os.stat_result) -> dict[str, int]:
+    """The stat fields that must all match for a stored hash to be reused."""
+    return {"size": stat.st_size, "mtimeNs": stat.st_mtime_ns, "inode": stat.st_ino}
+
+
+def manifest_path(cache_dir: Path, roadmap_id: str, user_id: Optional[str] = None) -> Path:
+    """Location of a roadmap's (or a user overlay's) manifest inside the cache directory."""
+    name = roadmap_id if user_id is None else f"{roadmap_id}--{user_id}"
+    return cache_dir / "manifests" / f"{name}.json"
+
+
+def load_manifest(path: Path) -> dict[str, dict[str, Any]]:
+    """Load a manifest, treating a missing or unreadable file as empty."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: Path, files: dict[str, dict[str, Any]]) -> None:
+    """Write a manifest atomically, so concurrent runs never read a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump({"files": files}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def lookup_hash(
+    manifest: dict[str, dict[str, Any]], file_name: str, signature: dict[str, int]
+) -> Optional[str]:
+    """Return the stored hash if the file's stat signature is unchanged."""
+    entry = manifest.get(file_name)
+    if entry and all(entry.get(key) == value for key, value in signature.items()):
+        return entry.get("hash")
+    return None
@@ -3,7 +3,7 @@
 Generate embeddings for roadmap markdown content using LlamaIndex.
 
 This script reads markdown files from src/data/embeddings/{roadmap-id}/,
-generates a LlamaIndex VectorStoreIndex with OpenAI embeddings,
+generates a LlamaIndex VectorStoreIndex with OpenAI (or local) embeddings,
 and persists to either JSON files OR Postgres (pgvector).
 
 Supports incremental updates: only regenerates embeddings for new/modified files.
@@ -12,15 +12,21 @@ Use --use-postgres to store embeddings in Postgres instead of JSON files.
 """
 
 import argparse
-import hashlib
+import copy
+import io
 import json
+import multiprocessing
 import os
-import re
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional
+from itertools import islice
+from typing import Any, Iterable, Iterator, Optional
 
-import yaml
+import numpy as np
 from dotenv import load_dotenv
 from llama_index.core import (
     Document,
@@ -29,8 +35,86 @@ from llama_index.core import (
     VectorStoreIndex,
     load_index_from_storage,
 )
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.embeddings.openai import OpenAIEmbedding
 
+from ann_index import ANN_FILE, ANN_TYPES, build_ann_artifact, resolve_ann_params
+from chunking import (
+    DEFAULT_CHUNK_TOKENS,
+    LEGACY_CHUNKER,
+    PAGE_BREAK,
+    StructuredNodeParser,
+    chunker_name,
+)
+from chunk_dedup import (
+    DEFAULT_DEDUP_THRESHOLD,
+    DUPLICATES_KEY,
+    ChunkDeduplicator,
+    duplicate_dependents,
+)
+from embedding_cache import EmbeddingCache
+from index_retention import (
+    DEFAULT_GC_BATCH_ROWS,
+    DEFAULT_GC_PAUSE,
+    collect_index_versions,
+    format_megabytes,
+    print_version_report,
+    vector_index_sizes,
+    version_report,
+)
+from run_journal import DEFAULT_CHECKPOINT_EVERY, RunJournal, journal_path
+from watch import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, create_watcher
+from embedding_providers import (
+    DEFAULT_MODELS,
+    LOCAL_MAX_TOKENS,
+    PROVIDERS,
+    ProviderEmbedding,
+    engine_settings,
+    make_embed_fn,
+    provider_for_model,
+)
+from markdown_parser import parse_frontmatter, split_markdown_sections
+from file_manifest import (
+    compute_file_hash,
+    load_manifest,
+    lookup_hash,
+    manifest_path,
+    save_manifest,
+    stat_signature,
+)
+from embedding_engine import (
+    DEFAULT_BATCH_TOKENS,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RPM,
+    DEFAULT_TPM,
+    MODEL_DIMENSIONS,
+    EmbeddingEngine,
+    resolve_dimensions,
+    shortened_dimensions,
+)
+from postgres_session import autocommit, create_pool, get_database_url, transaction
+from quantization import (
+    DEFAULT_RECALL_K,
+    POSTGRES_PRECISIONS,
+    PRECISIONS,
+    recall_at_k,
+)
+from run_report import PROFILERS, RunReport, StageRecorder
+from vector_store_binary import (
+    BINARY_STORE_DTYPES,
+    has_current_binary_store,
+    remove_binary_store,
+    write_binary_store,
+)
+
+# Default location of the persistent chunk embedding cache (gitignored)
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".cache"
+
+# Number of files parsed, chunked and embedded together in one pipeline step
+DEFAULT_STREAM_WINDOW = 16
+
 
 def find_project_root() -> Path:
     """Find the project root by looking for package.json."""
@@ -43,83 +127,141 @@ def find_project_root() -> Path:
     return Path(__file__).parent.parent.parent
 
 
-def parse_frontmatter(content: str) -> tuple[dict[str, Any], str]:
-    """Parse YAML frontmatter from markdown content."""
-    frontmatter_pattern = re.compile(r"^---\s*\n(.*?)\n---\s*\n", re.DOTALL)
-    match = frontmatter_pattern.match(content)
+def get_file_metadata(file_path: Path, file_hash: Optional[str] = None) -> dict[str, Any]:
+    """Get metadata for a file (hash, size, modified time).
+
+    A known `file_hash` is reused instead of reading the file.
+    """
+    stat = file_path.stat()
+    return {
+        "hash": file_hash or compute_file_hash(file_path),
+        "size": stat.st_size,
+        "lastModified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat(),
+    }
 
-    if match:
-        frontmatter_text = match.group(1)
-        remaining_content = content[match.end() :]
-        frontmatter = yaml.safe_load(frontmatter_text)
-        return frontmatter, remaining_content
 
-    return {}, content
+def load_markdown_document(md_file: Path, roadmap_id: str) -> Document:
+    """Parse a markdown content file into a LlamaIndex Document.
 
+    The body keeps its heading structure for StructuredNodeParser; the title
+    comes from the frontmatter, else the first top-level heading.
+    """
+    node_id = md_file.stem
+    content_text = md_file.read_text(encoding="utf-8")
 
-def parse_markdown_sections(content: str) -> dict[str, Any]:
-    """Extract structured sections from markdown content."""
-    sections = {}
+    frontmatter, body = parse_frontmatter(content_text)
+    top_headings = [s.path[0] for s in split_markdown_sections(body) if s.level == 1]
 
-    # Extract description (first paragraph after title or Description section)
-    desc_pattern = re.compile(
-        r"^#[^#].*?\n\n(?:##\s+Description\s*\n\n)?(.*?)(?=\n##|\Z)", re.DOTALL
+    title = (
+        frontmatter.get("title")
+        or (top_headings[0] if top_headings else None)
+        or node_id.replace("-", " ").title()
     )
-    desc_match = desc_pattern.search(content)
-    if desc_match:
-        sections["description"] = desc_match.group(1).strip()
+    node_type = frontmatter.get("type") or frontmatter.get("nodeType")
 
-    # Extract list-based sections
-    section_patterns = {
-        "eligibility": r"##\s+Eligibility\s*\n(.*?)(?=\n##|\Z)",
-        "benefits": r"##\s+Benefits\s*\n(.*?)(?=\n##|\Z)",
-        "outcomes": r"##\s+Final Outcome\s*\n(.*?)(?=\n##|\Z)",
-        "resources": r"##\s+Resources\s*\n(.*?)(?=\n##|\Z)",
+    # Create LlamaIndex Document with metadata
+    doc = Document(
+        text=body.strip(),
+        doc_id=f"{roadmap_id}:{node_id}",
+    )
+    metadata = {
+        "node_id": node_id,
+        "roadmap_id": roadmap_id,
+        "title": title,
+        "type": node_type,
+        "file_name": md_file.name,
+        "file_type": "markdown",
+        **frontmatter,
     }
+    doc.metadata = {key: value for key, value in metadata.items() if value is not None}
+    return doc
 
-    for section_name, pattern in section_patterns.items():
-        section_match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
-        if section_match:
-            section_text = section_match.group(1)
-            # Extract bullet points
-            bullets = [
-                line.lstrip("- *").strip()
-                for line in section_text.split("\n")
-                if line.strip().startswith(("-", "*"))
-                and "TODO" not in line
-                and line.strip()
-            ]
-            if bullets:
-                sections[section_name] = bullets
 
-    return sections
+def iter_pdf_pages(pdf_file: Path) -> Iterator[str]:
+    """Yield the extracted text of each PDF page, one page at a time.
 
+    This is the same extraction LlamaIndex's PDFReader performs, without
+    building a Document per page.
+    """
+    import pypdf
 
-def compute_file_hash(file_path: Path) -> str:
-    """Compute SHA-256 hash of a file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+    with pdf_file.open("rb") as f:
+        reader = pypdf.PdfReader(f)
+        for page in reader.pages:
+            yield page.extract_text()
 
 
-def get_file_metadata(file_path: Path) -> dict[str, Any]:
-    """Get metadata for a file (hash, size, modified time)."""
-    stat = file_path.stat()
-    return {
-        "hash": compute_file_hash(file_path),
-        "size": stat.st_size,
-        "lastModified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).isoformat(),
+def load_pdf_document(pdf_file: Path, roadmap_id: str) -> Document:
+    """Extract a PDF's text into a single LlamaIndex Document."""
+    node_id = pdf_file.stem
+
+    # Combine all pages into a single document, keeping page boundaries
+    page_texts = list(iter_pdf_pages(pdf_file))
+    full_text = PAGE_BREAK.join(page_texts)
+
+    # Create LlamaIndex Document with metadata
+    doc = Document(
+        text=full_text,
+        doc_id=f"{roadmap_id}:{node_id}",
+    )
+    doc.metadata = {
+        "node_id": node_id,
+        "roadmap_id": roadmap_id,
+        "title": node_id.replace("-", " ").title(),
+        "file_name": pdf_file.name,
+        "file_type": "pdf",
+        "page_count": len(page_texts),
     }
+    return doc
 
 
-def load_roadmap_documents(roadmap_id: str, base_path: Path) -> tuple[list[Document], dict[str, dict[str, Any]]]:
-    """Load all markdown and PDF content files for a roadmap as LlamaIndex Documents.
-    
+def load_content_file(task: tuple[Path, str]) -> tuple[Optional[Document], Optional[str]]:
+    """Load one content file; runs in a worker process when --jobs > 1.
+
     Returns:
-        tuple of (documents, file_metadata) where file_metadata maps filename to file info
-    
+        tuple of (document, error); a failed PDF yields (None, message) so one
+        bad file does not abort the whole load
+    """
+    file_path, roadmap_id = task
+
+    if file_path.suffix == ".pdf":
+        try:
+            return load_pdf_document(file_path, roadmap_id), None
+        except Exception as e:
+            return None, f"Failed to process PDF {file_path.name}: {e}"
+
+    return load_markdown_document(file_path, roadmap_id), None
+
+
+def timed_load_content_file(
+    task: tuple[Path, str],
+) -> tuple[tuple[Optional[Document], Optional[str]], float, float]:
+    """load_content_file() plus the wall and CPU seconds it took in its worker.
+
+    Returns:
+        tuple of (load_content_file result, wall seconds, CPU seconds)
+    """
+    wall_started = time.perf_counter()
+    cpu_started = time.thread_time()
+    result = load_content_file(task)
+    return result, time.perf_counter() - wall_started, time.thread_time() - cpu_started
+
+
+def user_content_dir(roadmap_id: str, user_id: str, base_path: Path) -> Path:
+    """Directory of a user's own content, overlaid on the roadmap's."""
+    return base_path / "src/data/embeddings" / roadmap_id / "users" / user_id
+
+
+def list_content_files(
+    roadmap_id: str,
+    base_path: Path,
+    user_id: Optional[str] = None,
+) -> list[Path]:
+    """List a roadmap's content files: markdown, then PDFs, each sorted by name.
+
+    With user_id, lists the user's overlay content instead, which may not
+    exist (an overlay with no content of its own).
+
     Note: PDF support requires llama-index-readers-file package.
     Install via: pip install llama-index-readers-file
     """
@@ -128,118 +270,138 @@ def load_roadmap_documents(roadmap_id: str, base_path: Path) -> tuple[list[Docum
 
     if not content_dir.exists():
         raise ValueError(f"Content directory not found: {content_dir}")
+    if user_id is not None:
+        content_dir = user_content_dir(roadmap_id, user_id, base_path)
+        if not content_dir.exists():
+            return []
 
-    documents = []
-    file_metadata = {}
+    content_files = sorted(content_dir.glob("*.md"))
 
     # Check if PDF reader is available
-    pdf_reader = None
     try:
-        from llama_index.readers.file import PDFReader
-        pdf_reader = PDFReader()
+        import pypdf  # noqa: F401
+        content_files += sorted(content_dir.glob("*.pdf"))
     except ImportError:
         print("Warning: llama-index-readers-file not installed. PDF files will be skipped.")
         print("Install with: pip install llama-index-readers-file")
 
-    # Process markdown files
-    for md_file in sorted(content_dir.glob("*.md")):
-        node_id = md_file.stem
-        content_text = md_file.read_text(encoding="utf-8")
-
-        frontmatter, body = parse_frontmatter(content_text)
-        sections = parse_markdown_sections(body)
-
-        # Build rich text representation for embedding
-        text_parts = []
-
-        # Add title
-        title = frontmatter.get("title", node_id.replace("-", " ").title())
-        text_parts.append(f"Title: {title}")
-
-        # Add node type
-        node_type = frontmatter.get("type") or frontmatter.get("nodeType")
-        if node_type:
-            text_parts.append(f"Type: {node_type}")
+    return content_files
 
-        # Add subtitle if present
-        if "subtitle" in frontmatter:
-            text_parts.append(f"Subtitle: {frontmatter['subtitle']}")
 
-        # Add description
-        if "description" in sections:
-            text_parts.append(f"\nDescription:\n{sections['description']}")
+def scan_file_metadata(
+    content_files: list[Path],
+    manifest: Optional[dict[str, dict[str, Any]]] = None,
+) -> tuple[dict[str, dict[str, Any]], dict[str, dict[str, Any]], int]:
+    """Hash content files without parsing them, for change detection.
 
-        # Add structured sections
-        if "eligibility" in sections:
-            text_parts.append(
-                f"\nEligibility Requirements:\n"
-                + "\n".join(f"- {item}" for item in sections["eligibility"])
-            )
+    Files whose (size, mtime_ns, inode) match the manifest reuse its stored
+    hash; only the rest are read.
 
-        if "benefits" in sections:
-            text_parts.append(
-                f"\nBenefits:\n" + "\n".join(f"- {item}" for item in sections["benefits"])
-            )
+    Returns:
+        tuple of (file_metadata, updated_manifest, rehashed_count)
+    """
+    manifest = manifest or {}
+    file_metadata = {}
+    updated_manifest = {}
+    rehashed = 0
 
-        if "outcomes" in sections:
-            text_parts.append(
-                f"\nFinal Outcomes:\n"
-                + "\n".join(f"- {item}" for item in sections["outcomes"])
-            )
+    for file_path in content_files:
+        signature = stat_signature(file_path.stat())
+        file_hash = lookup_hash(manifest, file_path.name, signature)
+        if file_hash is None:
+            file_hash = compute_file_hash(file_path)
+            rehashed += 1
 
-        # Combine all parts
-        full_text = "\n".join(text_parts)
+        file_metadata[file_path.name] = get_file_metadata(file_path, file_hash)
+        updated_manifest[file_path.name] = {**signature, "hash": file_hash}
 
-        # Create LlamaIndex Document with metadata
-        doc = Document(
-            text=full_text,
-            doc_id=f"{roadmap_id}:{node_id}",
-        )
-        doc.metadata = {
-            "node_id": node_id,
-            "roadmap_id": roadmap_id,
-            "title": title,
-            "type": node_type,
-            "file_name": md_file.name,
-            "file_type": "markdown",
-            **frontmatter,
-        }
+    return file_metadata, updated_manifest, rehashed
 
-        documents.append(doc)
-        file_metadata[md_file.name] = get_file_metadata(md_file)
 
-    # Process PDF files if reader is available
-    if pdf_reader:
-        for pdf_file in sorted(content_dir.glob("*.pdf")):
-            node_id = pdf_file.stem
-            
-            try:
-                # Load PDF using LlamaIndex PDFReader
-                pdf_documents = pdf_reader.load_data(file=pdf_file)
-                
-                # Combine all pages into a single document
-                full_text = "\n\n".join(doc.text for doc in pdf_documents)
-                
-                # Create LlamaIndex Document with metadata
-                doc = Document(
-                    text=full_text,
-                    doc_id=f"{roadmap_id}:{node_id}",
-                )
-                doc.metadata = {
-                    "node_id": node_id,
-                    "roadmap_id": roadmap_id,
-                    "title": node_id.replace("-", " ").title(),
-                    "file_name": pdf_file.name,
-                    "file_type": "pdf",
-                    "page_count": len(pdf_documents),
-                }
+def iter_roadmap_documents(
+    content_files: list[Path],
+    roadmap_id: str,
+    file_metadata: Optional[dict[str, dict[str, Any]]] = None,
+    jobs: int = 1,
+    window: int = DEFAULT_STREAM_WINDOW,
+    executor: Optional[ProcessPoolExecutor] = None,
+    stages: Optional[StageRecorder] = None,
+) -> Iterator[Document]:
+    """Parse content files lazily, yielding Documents in file order.
+
+    With jobs > 1 (or a shared `executor`), files are parsed in a process pool
+    with at most `window` files in flight, so workers read ahead while earlier
+    documents are being embedded, and memory stays bounded by the window
+    rather than the corpus. Files that fail to parse are dropped from
+    `file_metadata` so they are retried on the next run. Parse times are
+    recorded as the pdf_extract and markdown_parse stages.
+    """
+    stages = stages or StageRecorder()
+
+    def handle(file_path: Path, timed_result):
+        (doc, error), wall, cpu = timed_result
+        stage = "pdf_extract" if file_path.suffix == ".pdf" else "markdown_parse"
+        stages.record(stage, wall, cpu, rows=0 if error else 1)
+        if error:
+            print(f"Warning: {error}")
+            if file_metadata is not None:
+                file_metadata.pop(file_path.name, None)
+        return doc
+
+    def iter_pooled(pool: ProcessPoolExecutor) -> Iterator[Document]:
+        pending: deque = deque()
+        remaining = iter(tasks)
+
+        for task in islice(remaining, max(window, jobs)):
+            pending.append((task[0], pool.submit(timed_load_content_file, task)))
+
+        while pending:
+            file_path, future = pending.popleft()
+            doc = handle(file_path, future.result())
+            next_task = next(remaining, None)
+            if next_task is not None:
+                pending.append((next_task[0], pool.submit(timed_load_content_file, next_task)))
+            if doc is not None:
+                yield doc
+
+    tasks = [(file_path, roadmap_id) for file_path in content_files]
+
+    if executor is not None:
+        yield from iter_pooled(executor)
+        return
+
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            doc = handle(task[0], timed_load_content_file(task))
+            if doc is not None:
+                yield doc
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as own_executor:
+        yield from iter_pooled(own_executor)
+
+
+def discover_roadmap_ids(base_path: Path) -> list[str]:
+    """Find every roadmap with content under src/data/embeddings/."""
+    embeddings_dir = base_path / "src/data/embeddings"
+    if not embeddings_dir.exists():
+        raise ValueError(f"Embeddings directory not found: {embeddings_dir}")
+
+    return sorted(
+        path.name
+        for path in embeddings_dir.iterdir()
+        if path.is_dir() and (any(path.glob("*.md")) or any(path.glob("*.pdf")))
+    )
 
-                documents.append(doc)
-                file_metadata[pdf_file.name] = get_file_metadata(pdf_file)
-            except Exception as e:
-                print(f"Warning: Failed to process PDF {pdf_file.name}: {e}")
 
-    return documents, file_metadata
+def read_user_ids(path: Path) -> list[str]:
+    """Read user IDs from a file, one per line (blank lines and # comments ignored)."""
+    user_ids = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            user_ids.append(line)
+    return user_ids
 
 
 def load_existing_metadata(persist_dir: Path) -> dict[str, Any]:
@@ -251,6 +413,23 @@ def load_existing_metadata(persist_dir: Path) -> dict[str, Any]:
     return {}
 
 
+def index_settings(metadata: dict[str, Any]) -> tuple[Optional[str], Optional[int], str, str]:
+    """Return the (model, dimensions, precision, chunker) an existing index was built with.
+
+    Indexes written before dimensions were recorded use the model's native
+    size, and those written before the chunker was recorded used LlamaIndex's
+    default sentence splitter.
+    """
+    model = metadata.get("model")
+    dimensions = metadata.get("dimensions") or MODEL_DIMENSIONS.get(model)
+    return (
+        model,
+        dimensions,
+        metadata.get("precision") or "float32",
+        metadata.get("chunker") or LEGACY_CHUNKER,
+    )
+
+
 def detect_changes(
     current_files: dict[str, dict[str, Any]], 
     previous_metadata: dict[str, Any]
@@ -273,27 +452,200 @@ def detect_changes(
     return new_files, modified_files, deleted_files
 
 
+def chunk_documents(documents: list[Document]) -> list[BaseNode]:
+    """Split documents into nodes with the same transformations from_documents() uses.
+
+    main() sets Settings.node_parser to a StructuredNodeParser, so this is
+    the structure-aware, token-budgeted chunker.
+    """
+    return run_transformations(documents, Settings.transformations)
+
+
+def embed_nodes_with_cache(
+    nodes: list[BaseNode],
+    engine: EmbeddingEngine,
+    cache: Optional[EmbeddingCache] = None,
+    journal: Optional[RunJournal] = None,
+) -> None:
+    """Attach embeddings to nodes, only calling the API for chunk text not in the cache.
+
+    Nodes that already carry an embedding are skipped by LlamaIndex when they
+    are added to an index, so this is the only place the embedding API is hit.
+    With `journal`, chunks checkpointed by an interrupted run are reused, and
+    every completed request is checkpointed.
+    """
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+
+    if cache is None and journal is None:
+        vectors = engine.embed(texts)
+    else:
+        vectors = cache.get_many(texts) if cache is not None else [None] * len(texts)
+        hits = len(texts) - sum(vector is None for vector in vectors)
+        resumed = 0
+        if journal is not None and journal.vectors:
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            for i, vector in zip(missing, journal.get_many([texts[i] for i in missing])):
+                vectors[i] = vector
+                resumed += vector is not None
+
+        # Embed each distinct text that is neither cached nor checkpointed once
+        missing_texts = list(
+            dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None)
+        )
+        if cache is not None:
+            print(f"  Embedding cache: {hits} hits, {len(missing_texts)} chunks to embed")
+        if resumed:
+            print(f"  Checkpoint: {resumed} chunks resumed")
+        if missing_texts:
+            try:
+                new_vectors = engine.embed(
+                    missing_texts, on_batch=journal.append if journal is not None else None
+                )
+            finally:
+                if journal is not None:
+                    journal.flush()
+            if cache is not None:
+                cache.put_many(missing_texts, new_vectors)
+            embedded = dict(zip(missing_texts, new_vectors))
+            vectors = [
+                vector if vector is not None else embedded[text]
+                for text, vector in zip(texts, vectors)
+            ]
+
+    for node, vector in zip(nodes, vectors):
+        node.embedding = vector
+
+    if engine.requests:
+        print(
+            f"  Embedding API: {engine.requests} requests, {engine.tokens} tokens, "
+            f"{engine.retries} retries"
+        )
+
+
+def iter_embedded_nodes(
+    documents: Iterable[Document],
+    engine: EmbeddingEngine,
+    cache: Optional[EmbeddingCache] = None,
+    window: int = DEFAULT_STREAM_WINDOW,
+    stages: Optional[StageRecorder] = None,
+    dedup: Optional[ChunkDeduplicator] = None,
+    journal: Optional[RunJournal] = None,
+) -> Iterator[tuple[list[Document], list[BaseNode]]]:
+    """Chunk and embed a document stream `window` documents at a time.
+
+    Yields (documents, nodes) per window so callers can write each step to
+    their sink and drop it, instead of holding every chunk of the corpus.
+    With `dedup`, duplicate chunks are dropped before embedding and recorded
+    in dedup.duplicates for the caller to attach to their representatives.
+    With `journal`, embeddings are checkpointed as requests complete.
+    """
+    stages = stages or StageRecorder()
+
+    def process(batch: list[Document]) -> list[BaseNode]:
+        with stages.stage("chunk") as stage:
+            nodes = chunk_documents(batch)
+            stage["rows"] = len(nodes)
+        if dedup is not None:
+            with stages.stage("dedup") as stage:
+                texts = [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+                kept = dedup.filter_nodes(nodes, texts)
+                stage["rows"] = len(nodes) - len(kept)
+                nodes = kept
+        with stages.stage("embed") as stage:
+            embed_nodes_with_cache(nodes, engine, cache, journal)
+            stage["rows"] = len(nodes)
+        return nodes
+
+    batch: list[Document] = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= window:
+            yield batch, process(batch)
+            batch = []
+
+    if batch:
+        yield batch, process(batch)
+
+
+def embed_ahead(
+    documents: Iterable[Document],
+    engine: EmbeddingEngine,
+    cache: EmbeddingCache,
+    window: int = DEFAULT_STREAM_WINDOW,
+    stages: Optional[StageRecorder] = None,
+    dedup: Optional[ChunkDeduplicator] = None,
+    journal: Optional[RunJournal] = None,
+) -> None:
+    """Embed a document stream into the cache, keeping nothing else.
+
+    Postgres writes run this before their transaction opens, so the
+    transaction's load finds every chunk in the cache and never holds locks
+    across embedding API calls. `dedup` must be a copy seeded like the load's,
+    so duplicates are skipped here too.
+    """
+    print("\n--- Embedding into the cache before writing ---")
+    for _ in iter_embedded_nodes(documents, engine, cache, window, stages, dedup, journal):
+        pass
+
+
 def create_index(
-    documents: list[Document], model_name: str = "text-embedding-3-small"
+    documents: Iterable[Document],
+    model_name: str = "text-embedding-3-small",
+    cache: Optional[EmbeddingCache] = None,
+    engine: Optional[EmbeddingEngine] = None,
+    window: int = DEFAULT_STREAM_WINDOW,
+    dimensions: Optional[int] = None,
+    stages: Optional[StageRecorder] = None,
+    dedup: Optional[ChunkDeduplicator] = None,
+    provider: str = "openai",
+    journal: Optional[RunJournal] = None,
 ) -> VectorStoreIndex:
-    """Create a LlamaIndex VectorStoreIndex with OpenAI embeddings."""
-    print(f"\nUsing OpenAI embedding model: {model_name}...")
+    """Create a LlamaIndex VectorStoreIndex with the provider's embeddings."""
+    print(f"\nUsing {provider} embedding model: {model_name}...")
 
     # Configure embedding model
-    embed_model = OpenAIEmbedding(model=model_name)
+    embed_model = make_embed_model(model_name, dimensions, provider)
 
     # Set global embedding model
     Settings.embed_model = embed_model
 
-    print(f"Creating index from {len(documents)} documents...")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        show_progress=True,
-    )
+    print("Creating index...")
+    storage_context = StorageContext.from_defaults()
+    index = VectorStoreIndex([], storage_context=storage_context)
 
+    engine = engine or EmbeddingEngine(make_embed_fn(provider, model_name, dimensions))
+    document_count = 0
+    for batch, nodes in iter_embedded_nodes(
+        documents, engine, cache, window, stages, dedup, journal
+    ):
+        index.insert_nodes(nodes)
+        for doc in batch:
+            storage_context.docstore.set_document_hash(doc.get_doc_id(), doc.hash)
+        document_count += len(batch)
+
+    if dedup is not None:
+        record_duplicates_in_docstore(index, dedup)
+
+    print(f"Indexed {document_count} documents")
     return index
 
 
+def make_embed_model(
+    model_name: str, dimensions: Optional[int] = None, provider: str = "openai"
+) -> BaseEmbedding:
+    """Create the LlamaIndex embedding model, shortened to `dimensions` if given."""
+    if provider != "openai":
+        return ProviderEmbedding(
+            model_name=model_name,
+            provider=provider,
+            dimensions=resolve_dimensions(model_name, dimensions),
+        )
+    request_dimensions = shortened_dimensions(model_name, dimensions) if dimensions else None
+    if request_dimensions:
+        return OpenAIEmbedding(model=model_name, dimensions=request_dimensions)
+    return OpenAIEmbedding(model=model_name)
+
+
 def load_existing_index(persist_dir: Path) -> VectorStoreIndex:
     """Load existing index from storage."""
     storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
@@ -302,49 +654,92 @@ def load_existing_index(persist_dir: Path) -> VectorStoreIndex:
 
 def update_index_incremental(
     index: VectorStoreIndex,
-    documents: list[Document],
+    changed_documents: Iterable[Document],
     new_files: set[str],
     modified_files: set[str],
     deleted_files: set[str],
     roadmap_id: str,
+    cache: Optional[EmbeddingCache] = None,
+    engine: Optional[EmbeddingEngine] = None,
+    window: int = DEFAULT_STREAM_WINDOW,
+    stages: Optional[StageRecorder] = None,
+    dedup: Optional[ChunkDeduplicator] = None,
+    journal: Optional[RunJournal] = None,
 ) -> None:
-    """Update index incrementally by adding/updating/deleting files."""
-    # Create mapping of doc_id to document
-    doc_map = {doc.doc_id: doc for doc in documents}
-    
-    # Delete removed files
-    for filename in deleted_files:
+    """Update index incrementally by adding/updating/deleting files.
+
+    `changed_documents` only needs to contain the new and modified files.
+    With `dedup`, new chunks are also compared against the chunks kept from
+    unchanged files.
+    """
+    # Delete removed files, and the old version of modified files
+    for filename in sorted(deleted_files | modified_files):
         # Extract node_id from filename
         node_id = Path(filename).stem
         doc_id = f"{roadmap_id}:{node_id}"
         try:
-            index.delete(doc_id)
-            print(f"  Deleted: {filename}")
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            if filename in deleted_files:
+                print(f"  Deleted: {filename}")
         except Exception as e:
             print(f"  Warning: Failed to delete {filename}: {e}")
-    
-    # Update modified files (delete old, insert new)
-    for filename in modified_files:
-        node_id = Path(filename).stem
-        doc_id = f"{roadmap_id}:{node_id}"
-        try:
-            index.delete(doc_id)
-            if doc_id in doc_map:
-                index.insert(doc_map[doc_id])
-            print(f"  Updated: {filename}")
-        except Exception as e:
-            print(f"  Warning: Failed to update {filename}: {e}")
-    
-    # Insert new files
-    for filename in new_files:
-        node_id = Path(filename).stem
-        doc_id = f"{roadmap_id}:{node_id}"
-        try:
-            if doc_id in doc_map:
-                index.insert(doc_map[doc_id])
-            print(f"  Added: {filename}")
-        except Exception as e:
-            print(f"  Warning: Failed to add {filename}: {e}")
+
+    if dedup is not None:
+        removed_files = deleted_files | modified_files
+        for node in list(index.docstore.docs.values()):
+            duplicates = node.metadata.get(DUPLICATES_KEY)
+            if duplicates:
+                # Duplicates from removed files are re-detected if they still exist
+                kept = [d for d in duplicates if d.get("file_name") not in removed_files]
+                if len(kept) != len(duplicates):
+                    node.metadata[DUPLICATES_KEY] = kept
+                    index.docstore.add_documents([node], allow_update=True)
+            dedup.seed(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE))
+
+    # Chunk and embed changed documents in windows so unchanged chunks are
+    # served from the cache and the rest share API batches
+    if engine is None:
+        model_name = Settings.embed_model.model_name
+        engine = EmbeddingEngine(make_embed_fn(provider_for_model(model_name), model_name))
+    for batch, nodes in iter_embedded_nodes(
+        changed_documents, engine, cache, window, stages, dedup, journal
+    ):
+        nodes_by_doc: dict[str, list[BaseNode]] = {doc.doc_id: [] for doc in batch}
+        for node in nodes:
+            nodes_by_doc[node.ref_doc_id].append(node)
+
+        for doc in batch:
+            filename = doc.metadata.get("file_name")
+            try:
+                index.insert_nodes(nodes_by_doc[doc.doc_id])
+                index.docstore.set_document_hash(doc.doc_id, doc.hash)
+                print(f"  {'Updated' if filename in modified_files else 'Added'}: {filename}")
+            except Exception as e:
+                print(f"  Warning: Failed to add {filename}: {e}")
+
+    if dedup is not None:
+        record_duplicates_in_docstore(index, dedup)
+
+
+def record_duplicates_in_docstore(index: VectorStoreIndex, dedup: ChunkDeduplicator) -> None:
+    """Attach the duplicates found in this run to their representatives' metadata."""
+    for representative_id, duplicates in dedup.duplicates.items():
+        node = index.docstore.get_node(representative_id)
+        node.metadata[DUPLICATES_KEY] = node.metadata.get(DUPLICATES_KEY, []) + duplicates
+        # Bookkeeping only: keep it out of embedding and LLM context
+        for keys in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+            if DUPLICATES_KEY not in keys:
+                keys.append(DUPLICATES_KEY)
+        index.docstore.add_documents([node], allow_update=True)
+    print_dedup_summary(dedup)
+
+
+def print_dedup_summary(dedup: ChunkDeduplicator) -> None:
+    if dedup.exact_count or dedup.near_count:
+        print(
+            f"  Dedup: skipped {dedup.exact_count} exact and {dedup.near_count} near-duplicate "
+            f"chunks (threshold {dedup.threshold})"
+        )
 
 
 def persist_index(
@@ -353,21 +748,50 @@ def persist_index(
     model_name: str,
     output_path: Path,
     file_metadata: dict[str, dict[str, Any]],
+    binary_store: Optional[str] = None,
+    min_recall: float = 0.0,
+    dimensions: Optional[int] = None,
+    chunker: str = LEGACY_CHUNKER,
+    ann: Optional[dict[str, Any]] = None,
+    precision: str = "float32",
 ):
-    """Persist the LlamaIndex index to disk with file tracking metadata."""
+    """Persist the LlamaIndex index to disk with file tracking metadata.
+
+    With binary_store set to a dtype, the vectors are also written as a
+    memory-mappable matrix (see vector_store_binary.py). Quantized dtypes are
+    checked against full precision first, and nothing is written if recall
+    falls below min_recall.
+
+    An ANN index (see ann_index.py) is rebuilt alongside. `ann` holds the
+    build parameters given on the command line; the others are kept from the
+    roadmap's previous index.
+    """
     # Save index to a subdirectory to keep source markdown files separate
     persist_dir = output_path / roadmap_id / "index"
     persist_dir.mkdir(parents=True, exist_ok=True)
+    ann_params = resolve_ann_params(ann or {}, load_existing_metadata(persist_dir).get("ann"))
+
+    if binary_store:
+        vectors, ids = collect_binary_store(index)
+        check_quantized_recall(vectors, binary_store, min_recall)
+    else:
+        vectors = [index.vector_store.get(node_id) for node_id in index.docstore.docs]
 
     print(f"\nPersisting index to {persist_dir}...")
     index.storage_context.persist(persist_dir=str(persist_dir))
+    ann_metadata = build_ann_artifact(persist_dir, list(index.docstore.docs), vectors, ann_params)
 
     # Save metadata about the index including file tracking
     metadata = {
         "model": model_name,
+        "dimensions": dimensions or resolve_dimensions(model_name),
+        "precision": precision,
+        "chunker": chunker,
         "roadmapId": roadmap_id,
         "generatedAt": datetime.now(timezone.utc).isoformat(),
         "documentCount": len(index.docstore.docs),
+        "binaryStore": binary_store,
+        "ann": ann_metadata,
         "files": file_metadata,
     }
 
@@ -375,298 +799,157 @@ def persist_index(
     with metadata_file.open("w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2)
 
+    if binary_store:
+        binary_size = write_binary_store(persist_dir, vectors, ids, binary_store)
+        print(f"  Binary vector store ({binary_store}): {binary_size / 1024 / 1024:.2f} MB")
+    else:
+        remove_binary_store(persist_dir)
+
     # Calculate total size
     total_size = sum(f.stat().st_size for f in persist_dir.rglob("*") if f.is_file())
 
     print(f"\n✓ Persisted index to {persist_dir}")
-    print(f"  Model: {model_name}")
+    print(f"  Model: {model_name} ({metadata['dimensions']} dimensions)")
+    print(f"  Chunker: {chunker}")
     print(f"  Documents: {metadata['documentCount']}")
     print(f"  Total size: {total_size / 1024 / 1024:.2f} MB")
 
 
-# ==================== Postgres-specific functions ====================
-
-def create_postgres_vector_store(
-    roadmap_id: str,
-    user_id: Optional[str] = None,
-    embed_dim: int = 1536,
-):
-    """Create a PGVectorStore for storing embeddings in Postgres."""
-    from llama_index.vector_stores.postgres import PGVectorStore
-    from urllib.parse import urlparse
+def stale_json_artifacts(
+    persist_dir: Path,
+    metadata: dict[str, Any],
+    binary_store: Optional[str] = None,
+    precision: str = "float32",
+    ann: Optional[dict[str, Any]] = None,
+) -> list[str]:
+    """Files derived from an index's stored vectors that do not match this
+    run's settings, or are missing.
 
-    # Get database URL from environment
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
+    They can be rewritten from the persisted vectors without embedding
+    anything again.
+    """
+    stale = []
+    # Also rewrites stores whose sidecar still carries every row's text
+    has_binary_store = has_current_binary_store(persist_dir)
+    if metadata.get("binaryStore") != binary_store or has_binary_store != (binary_store is not None):
+        stale.append(f"binary store ({binary_store or 'none'})")
+    if index_settings(metadata)[2] != precision:
+        stale.append(f"{precision} precision")
+
+    # `ann` holds the command-line values, resolved as persist_index() does
+    previous_ann = metadata.get("ann") or {}
+    ann_params = resolve_ann_params(ann or {}, previous_ann)
+    has_ann = (persist_dir / ANN_FILE).exists()
+    if (
+        previous_ann.get("params") != ann_params
+        or has_ann != (previous_ann.get("type") == "ivf")
+    ):
+        stale.append(f"ANN index ({ann_params['type']})")
+    return stale
+
+
+def collect_binary_store(index: VectorStoreIndex) -> tuple[list[list[float]], list[str]]:
+    """Gather the index's vectors and their node ids for a binary vector store."""
+    ids = list(index.docstore.docs)
+    vectors = [index.vector_store.get(node_id) for node_id in ids]
+    return vectors, ids
+
+
+def check_quantized_recall(
+    vectors,
+    precision: str,
+    min_recall: float = 0.0,
+    rerank: bool = False,
+    k: int = DEFAULT_RECALL_K,
+) -> Optional[float]:
+    """Measure recall@k of a quantized precision against float32 on the
+    roadmap's own chunks, and raise if it is below min_recall."""
+    if precision == "float32":
+        return None
+
+    recall = recall_at_k(np.asarray(vectors, dtype=np.float32), precision, k=k, rerank=rerank)
+    if recall is None:
+        print(f"  Recall check skipped for {precision}: fewer than 2 chunks")
+        return None
+
+    print(f"  Recall@{k} of {precision} vs float32: {recall:.3f}")
+    if recall < min_recall:
         raise ValueError(
-            "DATABASE_URL not found in environment. "
-            "Please add it to .env file at project root."
+            f"{precision} recall@{k} is {recall:.3f}, below --min-recall {min_recall}"
         )
+    return recall
 
-    # Parse the database URL to extract components
-    parsed = urlparse(database_url)
-
-    # Create vector store with connection parameters
-    # PGVectorStore.from_params expects individual components, not a full URL
-    vector_store = PGVectorStore.from_params(
-        host=parsed.hostname or "localhost",
-        port=parsed.port or 5432,
-        database=parsed.path.lstrip('/') if parsed.path else "postgres",
-        user=parsed.username,
-        password=parsed.password,
-        table_name="llamaindex_embeddings",  # Temporary table for LlamaIndex
-        embed_dim=embed_dim,
-        # hybrid_search=True,  # Enable if you want BM25 + vector hybrid search
-    )
-
-    return vector_store
-
-
-def create_index_with_postgres(
-    documents: list[Document],
-    roadmap_id: str,
-    user_id: Optional[str] = None,
-    model_name: str = "text-embedding-3-small",
-) -> VectorStoreIndex:
-    """Create a LlamaIndex VectorStoreIndex backed by Postgres."""
-    print(f"\nUsing OpenAI embedding model: {model_name}...")
-    print(f"Storing embeddings in Postgres for roadmap: {roadmap_id}")
-
-    # Configure embedding model
-    embed_model = OpenAIEmbedding(model=model_name)
-    Settings.embed_model = embed_model
-
-    # Create Postgres vector store
-    vector_store = create_postgres_vector_store(
-        roadmap_id=roadmap_id,
-        user_id=user_id,
-        embed_dim=1536,  # text-embedding-3-small dimension
-    )
-
-    # Create storage context with Postgres backend
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-    print(f"Creating index from {len(documents)} documents...")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        show_progress=True,
-    )
-
-    return index
 
+# ==================== Postgres-specific functions ====================
 
-def copy_embeddings_to_prisma_tables(
+def write_index_to_postgres(
+    conn,
+    documents: Iterable[Document],
     roadmap_id: str,
     index_id: str,
-    documents: list[Document],
     file_metadata: dict[str, dict[str, Any]],
     user_id: Optional[str] = None,
+    model_name: str = "text-embedding-3-small",
+    cache: Optional[EmbeddingCache] = None,
+    engine: Optional[EmbeddingEngine] = None,
+    window: int = DEFAULT_STREAM_WINDOW,
+    dimensions: Optional[int] = None,
+    stages: Optional[StageRecorder] = None,
+    dedup: Optional[ChunkDeduplicator] = None,
+    provider: str = "openai",
+    journal: Optional[RunJournal] = None,
 ) -> int:
-    """
-    Copy embeddings from LlamaIndex's temporary table to Prisma schema tables.
+    """Embed documents and write their chunks straight into embedding_documents.
 
-    This function:
-    1. Queries the llamaindex_embeddings table created by LlamaIndex
-    2. Copies vectors to embedding_documents table with proper metadata
-    3. Links each document to the parent embedding_indexes record via indexId
+    Each window is bulk-loaded under `index_id` as soon as it is embedded, so
+    every vector is written once and never read back into Python. Runs inside
+    the caller's transaction on `conn`.
 
     Returns:
-        Number of documents inserted
+        Number of rows written
     """
-    import psycopg2
-    from psycopg2.extras import execute_batch
-    import json
-
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment")
+    stages = stages or StageRecorder()
+    dimensions = dimensions or resolve_dimensions(model_name)
+    print(f"\nUsing {provider} embedding model: {model_name} ({dimensions} dimensions)...")
+    print(f"Storing embeddings in Postgres for roadmap: {roadmap_id}")
 
-    print("\nCopying embeddings from LlamaIndex table to Prisma schema tables...")
+    Settings.embed_model = make_embed_model(model_name, dimensions, provider)
+    engine = engine or EmbeddingEngine(make_embed_fn(provider, model_name, dimensions))
 
-    conn = psycopg2.connect(database_url)
     cursor = conn.cursor()
-
+    written_rows = 0
+    document_count = 0
     try:
-        # Query LlamaIndex's temporary table to get all vectors
-        # Note: We query ALL rows since LlamaIndex may have multiple roadmaps in the same table
-        # We filter by roadmap_id in the metadata to get only the current roadmap's embeddings
-        cursor.execute("""
-            SELECT node_id, text, metadata_, embedding
-            FROM data_llamaindex_embeddings
-            WHERE metadata_->>'roadmap_id' = %s
-        """, (roadmap_id,))
-
-        llamaindex_rows = cursor.fetchall()
-
-        # If no rows found with roadmap filter, try without filter (for fresh generations)
-        if not llamaindex_rows:
-            print(f"No rows found with roadmap_id filter, trying without filter...")
-            cursor.execute("""
-                SELECT node_id, text, metadata_, embedding
-                FROM data_llamaindex_embeddings
-            """)
-            llamaindex_rows = cursor.fetchall()
-
-        if not llamaindex_rows:
-            print(f"Warning: No embeddings found in LlamaIndex table for roadmap {roadmap_id}")
-            print("This may indicate the LlamaIndex vector store used a different table name.")
-            # Fallback: insert from documents directly
-            return insert_from_documents_directly(
-                cursor, roadmap_id, index_id, documents, file_metadata, user_id
-            )
-
-        print(f"Found {len(llamaindex_rows)} embeddings in LlamaIndex table")
-
-        # Prepare batch insert data
-        insert_data = []
-        now = datetime.now(timezone.utc)
-
-        for llamaindex_node_id, text, metadata, embedding in llamaindex_rows:
-            # metadata is already a dict if psycopg2 parsed it correctly
-            if isinstance(metadata, str):
-                import json as json_module
-                metadata = json_module.loads(metadata)
-
-            # Use the LlamaIndex node_id (UUID) as the unique document ID
-            # This ensures each chunk gets its own row
-            doc_id = llamaindex_node_id
-
-            # Extract the source node_id from metadata (e.g., "electrician-foundation-program")
-            source_node_id = metadata.get('node_id')
-
-            # Get file hash from file_metadata
-            file_name = metadata.get('file_name', '')
-            file_hash = file_metadata.get(file_name, {}).get('hash') if file_name else None
-
-            # Convert embedding to proper format
-            # pgvector expects the vector as is (already in correct format from query)
-            embedding_value = embedding
-
-            insert_data.append((
-                doc_id,                           # id (UUID from LlamaIndex)
-                roadmap_id,                       # roadmapId
-                source_node_id,                   # nodeId (source file identifier)
-                user_id,                          # userId
-                text,                             # content
-                embedding_value,                  # embedding (vector type)
-                json.dumps(metadata),             # metadata (JSONB)
-                file_hash,                        # hash
-                1,                                # version
-                now,                              # createdAt
-                now,                              # updatedAt
-                index_id,                         # indexId (foreign key)
-            ))
-
-        # Batch insert into embedding_documents
-        execute_batch(cursor, """
-            INSERT INTO embedding_documents (
-                id, "roadmapId", "nodeId", "userId", content, embedding,
-                metadata, hash, version, "createdAt", "updatedAt", "indexId"
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE SET
-                content = EXCLUDED.content,
-                embedding = EXCLUDED.embedding,
-                metadata = EXCLUDED.metadata,
-                hash = EXCLUDED.hash,
-                "updatedAt" = EXCLUDED."updatedAt"
-        """, insert_data)
-
-        conn.commit()
-
-        print(f"✓ Inserted {len(insert_data)} embeddings into embedding_documents table")
-        return len(insert_data)
-
-    except Exception as e:
-        conn.rollback()
-        print(f"Error copying embeddings: {e}")
-        print("Attempting fallback: inserting from documents directly...")
-
-        # Fallback: If LlamaIndex table structure is different, insert from documents
-        return insert_from_documents_directly(
-            cursor, roadmap_id, index_id, documents, file_metadata, user_id
-        )
+        for batch, nodes in iter_embedded_nodes(
+            documents, engine, cache, window, stages, dedup, journal
+        ):
+            with stages.stage("copy") as stage:
+                rows = build_embedding_document_rows(
+                    nodes, roadmap_id, index_id, file_metadata, user_id
+                )
+                bulk_upsert_embedding_documents(cursor, rows, update_existing=False)
+                stage["rows"] = len(rows)
+            written_rows += len(rows)
+            document_count += len(batch)
     finally:
         cursor.close()
-        conn.close()
-
-
-def insert_from_documents_directly(
-    cursor,
-    roadmap_id: str,
-    index_id: str,
-    documents: list[Document],
-    file_metadata: dict[str, dict[str, Any]],
-    user_id: Optional[str] = None,
-) -> int:
-    """
-    Fallback method: Insert documents directly when LlamaIndex table query fails.
-    Note: This won't include the actual embeddings - they remain in LlamaIndex table.
-    """
-    import json
-    from psycopg2.extras import execute_batch
-
-    print("Warning: Using fallback method - embeddings will reference LlamaIndex table")
-
-    insert_data = []
-    now = datetime.now(timezone.utc)
-
-    for doc in documents:
-        # Extract metadata
-        node_id = doc.metadata.get('node_id')
-        file_name = doc.metadata.get('file_name', '')
-        file_hash = file_metadata.get(file_name, {}).get('hash')
-
-        # Generate a placeholder embedding (zero vector) since we can't access the real one
-        # The actual embedding remains in llamaindex_embeddings table
-        placeholder_embedding = [0.0] * 1536  # text-embedding-3-small dimension
-
-        insert_data.append((
-            doc.doc_id,                       # id
-            roadmap_id,                       # roadmapId
-            node_id,                          # nodeId
-            user_id,                          # userId
-            doc.text,                         # content
-            str(placeholder_embedding),       # embedding (placeholder)
-            json.dumps(doc.metadata),         # metadata
-            file_hash,                        # hash
-            1,                                # version
-            now,                              # createdAt
-            now,                              # updatedAt
-            index_id,                         # indexId
-        ))
 
-    execute_batch(cursor, """
-        INSERT INTO embedding_documents (
-            id, "roadmapId", "nodeId", "userId", content, embedding,
-            metadata, hash, version, "createdAt", "updatedAt", "indexId"
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (id) DO NOTHING
-    """, insert_data)
+    print(f"✓ Wrote {written_rows} embeddings for {document_count} documents to embedding_documents")
+    return written_rows
 
-    cursor.connection.commit()
 
-    print(f"✓ Inserted {len(insert_data)} document records (with placeholder embeddings)")
-    return len(insert_data)
-
-
-def load_postgres_metadata(roadmap_id: str, user_id: Optional[str] = None) -> dict[str, Any]:
+def load_postgres_metadata(conn, roadmap_id: str, user_id: Optional[str] = None) -> dict[str, Any]:
     """Load existing metadata from Postgres embedding_indexes table."""
     try:
-        import psycopg2
         from psycopg2.extras import RealDictCursor
 
-        database_url = os.getenv("DATABASE_URL")
-        if not database_url:
-            return {}
-
-        conn = psycopg2.connect(database_url)
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         # Query for the latest active index for this roadmap/user
         cursor.execute(
             """
-            SELECT id, version, "modelName", dimensions, "documentCount", "createdAt"
+            SELECT id, version, "modelName", dimensions, "precision", chunker,
+                "documentCount", "createdAt", "baseIndexId", "overlayFiles"
             FROM embedding_indexes
             WHERE "roadmapId" = %s AND "userId" IS NOT DISTINCT FROM %s AND "isActive" = true
             ORDER BY version DESC
@@ -676,68 +959,104 @@ def load_postgres_metadata(roadmap_id: str, user_id: Optional[str] = None) -> di
         )
 
         result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if result:
-            # Load file metadata from embedding_documents table
-            conn = psycopg2.connect(database_url)
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+        if result and result['overlayFiles'] is not None:
+            # Overlays record their files, including ones whose chunks are
+            # all shared with the base index and so have no rows
+            cursor.close()
+            file_metadata = {
+                file_name: {'hash': file_hash, 'lastModified': None}
+                for file_name, file_hash in result['overlayFiles'].items()
+            }
+        elif result:
+            # Reconstruct file metadata from embedding_documents, one row per
+            # file rather than transferring every chunk's metadata
             cursor.execute(
                 """
-                SELECT metadata, hash, "updatedAt"
+                SELECT DISTINCT ON (metadata->>'file_name')
+                    metadata->>'file_name' AS file_name, hash, "updatedAt"
                 FROM embedding_documents
-                WHERE "indexId" = %s
+                WHERE "indexId" = %s AND metadata ? 'file_name'
+                ORDER BY metadata->>'file_name', "updatedAt" DESC
                 """,
                 (result['id'],)
             )
 
             docs = cursor.fetchall()
+
+            # Files whose chunks were all duplicates have no rows of their
+            # own; their hashes are kept in the duplicate records
+            cursor.execute(
+                f"""
+                SELECT DISTINCT ON (duplicate->>'file_name')
+                    duplicate->>'file_name' AS file_name, duplicate->>'hash' AS hash
+                FROM embedding_documents,
+                    jsonb_array_elements(metadata->'{DUPLICATES_KEY}') duplicate
+                WHERE "indexId" = %s AND metadata ? '{DUPLICATES_KEY}'
+                    AND duplicate ? 'file_name'
+                ORDER BY duplicate->>'file_name', duplicate->>'hash' NULLS LAST
+                """,
+                (result['id'],)
+            )
+            duplicate_files = cursor.fetchall()
             cursor.close()
-            conn.close()
 
-            # Reconstruct file metadata from documents
             file_metadata = {}
             for doc in docs:
-                if doc['metadata'] and 'file_name' in doc['metadata']:
-                    file_metadata[doc['metadata']['file_name']] = {
-                        'hash': doc['hash'],
-                        'lastModified': doc['updatedAt'].isoformat() if doc['updatedAt'] else None,
-                    }
+                file_metadata[doc['file_name']] = {
+                    'hash': doc['hash'],
+                    'lastModified': doc['updatedAt'].isoformat() if doc['updatedAt'] else None,
+                }
+            for doc in duplicate_files:
+                file_metadata.setdefault(doc['file_name'], {'hash': doc['hash'], 'lastModified': None})
 
+        if result:
             return {
+                'indexId': result['id'],
                 'model': result['modelName'],
+                'dimensions': result['dimensions'],
+                'precision': result['precision'],
+                'chunker': result['chunker'],
                 'roadmapId': roadmap_id,
                 'userId': user_id,
                 'version': result['version'],
                 'documentCount': result['documentCount'],
+                'baseIndexId': result['baseIndexId'],
                 'files': file_metadata,
             }
 
+        cursor.close()
         return {}
     except Exception as e:
+        conn.rollback()
         print(f"Warning: Failed to load Postgres metadata: {e}")
         return {}
 
 
 def persist_postgres_metadata(
+    conn,
     roadmap_id: str,
     model_name: str,
     document_count: int,
     file_metadata: dict[str, dict[str, Any]],
     user_id: Optional[str] = None,
+    activate: bool = True,
+    precision: str = "float32",
+    dimensions: int = 1536,
+    chunker: str = LEGACY_CHUNKER,
+    base_index_id: Optional[str] = None,
 ) -> str:
-    """Save metadata to Postgres embedding_indexes table and return index ID."""
-    import psycopg2
+    """Save metadata to Postgres embedding_indexes table and return index ID.
+
+    With activate=False the new version is created inactive, and previous
+    versions keep serving queries until activate_index_version() is called.
+    With base_index_id, the version is a user overlay on that global version,
+    and file_metadata (its own files) is recorded with it.
+    Nothing is visible to readers until the caller commits.
+    """
     from psycopg2.extras import RealDictCursor
     import uuid
 
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment")
-
-    conn = psycopg2.connect(database_url)
     cursor = conn.cursor(cursor_factory=RealDictCursor)
 
     # Get current version for this roadmap/user
@@ -754,23 +1073,25 @@ def persist_postgres_metadata(
     next_version = result['max_version'] + 1
 
     # Deactivate previous indexes
-    cursor.execute(
-        """
-        UPDATE embedding_indexes
-        SET "isActive" = false
-        WHERE "roadmapId" = %s AND "userId" IS NOT DISTINCT FROM %s
-        """,
-        (roadmap_id, user_id)
-    )
+    if activate:
+        cursor.execute(
+            """
+            UPDATE embedding_indexes
+            SET "isActive" = false
+            WHERE "roadmapId" = %s AND "userId" IS NOT DISTINCT FROM %s
+            """,
+            (roadmap_id, user_id)
+        )
 
     # Insert new index metadata
     index_id = str(uuid.uuid4())
     cursor.execute(
         """
         INSERT INTO embedding_indexes (
-            id, "roadmapId", "userId", version, "modelName", dimensions,
-            "documentCount", "isActive", "createdAt", "updatedAt"
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            id, "roadmapId", "userId", version, "modelName", dimensions, "precision",
+            chunker, "documentCount", "isActive", "baseIndexId", "overlayFiles",
+            "createdAt", "updatedAt"
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """,
         (
             index_id,
@@ -778,136 +1099,827 @@ def persist_postgres_metadata(
             user_id,
             next_version,
             model_name,
-            1536,  # text-embedding-3-small
+            dimensions,
+            precision,
+            chunker,
             document_count,
-            True,  # isActive
+            activate,  # isActive
+            base_index_id,
+            json.dumps({
+                file_name: metadata.get('hash') for file_name, metadata in file_metadata.items()
+            }) if base_index_id else None,  # overlayFiles
             datetime.now(timezone.utc),
             datetime.now(timezone.utc),
         )
     )
-
-    conn.commit()
     cursor.close()
-    conn.close()
 
-    print(f"\n✓ Persisted index metadata to Postgres")
+    print("\n✓ Persisted index metadata to Postgres")
     print(f"  Index ID: {index_id}")
     print(f"  Version: {next_version}")
     print(f"  Model: {model_name}")
+    print(f"  Dimensions: {dimensions}")
+    print(f"  Precision: {precision}")
+    print(f"  Chunker: {chunker}")
+    if base_index_id:
+        print(f"  Overlay on: {base_index_id}")
     print(f"  Documents: {document_count}")
+    if not activate:
+        print("  Status: inactive until loading finishes")
 
     return index_id
 
 
-def update_index_document_count(index_id: str, actual_count: int) -> None:
-    """Update the documentCount in embedding_indexes after copying embeddings."""
-    import psycopg2
-
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment")
+def activate_index_version(
+    conn,
+    index_id: str,
+    roadmap_id: str,
+    user_id: Optional[str] = None,
+    retire: bool = False,
+) -> None:
+    """Make index_id the only active version for its roadmap/user.
 
-    conn = psycopg2.connect(database_url)
+    With retire=True, the rows of the versions it replaces are marked retired,
+    which drops them from an active-scoped HNSW index. Rows of the activated
+    version itself (and of the global version it overlays) are always
+    unretired, so rolling back to a replaced version serves its rows again.
+    """
     cursor = conn.cursor()
-
     cursor.execute(
         """
         UPDATE embedding_indexes
-        SET "documentCount" = %s, "updatedAt" = %s
-        WHERE id = %s
+        SET "isActive" = (id = %s), "updatedAt" = %s
+        WHERE "roadmapId" = %s AND "userId" IS NOT DISTINCT FROM %s
         """,
-        (actual_count, datetime.now(timezone.utc), index_id)
+        (index_id, datetime.now(timezone.utc), roadmap_id, user_id)
     )
-
-    conn.commit()
+    cursor.execute(
+        """
+        UPDATE embedding_documents
+        SET retired = false
+        WHERE retired AND "indexId" IN (
+            SELECT id FROM embedding_indexes WHERE id = %(index_id)s
+            UNION
+            SELECT "baseIndexId" FROM embedding_indexes WHERE id = %(index_id)s
+        )
+        """,
+        {"index_id": index_id}
+    )
+    if cursor.rowcount:
+        print(f"  Restored {cursor.rowcount} retired rows")
+    if retire:
+        # Covers the roadmap's other targets too: a global version that a
+        # re-based overlay no longer uses is retired here
+        retired = retire_replaced_rows(cursor, roadmap_id)
+        if retired:
+            print(f"  Retired {retired} rows of replaced versions")
     cursor.close()
-    conn.close()
 
-    print(f"✓ Updated index document count: {actual_count}")
+    print(f"✓ Activated index {index_id}")
+
+
+# HNSW index from migration 20251107014014_add_vector_indexes
+# HNSW index per precision. The embedding column always keeps full-precision
+# vectors; lower precisions index a halfvec cast or binary_quantize() of it
+# (pgvector >= 0.7), which shrinks the graph kept in memory 2x or 32x.
+# The column has no fixed dimension, so each index casts to one dimension and
+# only covers rows of that size.
+VECTOR_INDEX_PREFIXES = {
+    "float32": "embedding_documents_embedding",
+    "float16": "embedding_documents_embedding_half",
+    "binary": "embedding_documents_embedding_bit",
+}
+VECTOR_INDEX_OPTIONS = "WITH (m = 16, ef_construction = 64)"
+
+# "all" indexes every row of a dimension; "active" skips retired rows (those of
+# versions replaced by a newer one), so the graph does not grow with every
+# rebuild that keeps old versions around
+VECTOR_INDEX_SCOPES = ("all", "active")
+
+# Largest dimension pgvector's HNSW can index for each precision
+HNSW_MAX_DIMENSIONS = {"float32": 2000, "float16": 4000, "binary": 64000}
+
+
+def vector_index_spec(
+    precision: str = "float32",
+    dimensions: int = 1536,
+    scope: str = "all",
+) -> tuple[str, str]:
+    """Return the (name, definition) of the HNSW index for a precision, dimension and scope."""
+    suffix = "" if dimensions == 1536 else f"_{dimensions}"
+    if scope == "active":
+        suffix += "_active"
+    name = f"{VECTOR_INDEX_PREFIXES[precision]}{suffix}_idx"
+
+    if precision == "float16":
+        expression = f"(embedding::halfvec({dimensions})) halfvec_cosine_ops"
+    elif precision == "binary":
+        expression = f"(binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops"
+    else:
+        expression = f"(embedding::vector({dimensions})) vector_cosine_ops"
+
+    definition = (
+        f"ON embedding_documents USING hnsw ({expression}) {VECTOR_INDEX_OPTIONS} "
+        f"WHERE vector_dims(embedding) = {dimensions}"
+    )
+    if scope == "active":
+        definition += " AND NOT retired"
+    return name, definition
+
+
+def current_vector_index_scope(
+    conn,
+    precision: str = "float32",
+    dimensions: int = 1536,
+) -> Optional[str]:
+    """Scope of the valid HNSW index for a precision and dimension, if one exists."""
+    names = {vector_index_spec(precision, dimensions, scope)[0]: scope for scope in VECTOR_INDEX_SCOPES}
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY(%s) AND i.indisvalid
+        """,
+        (list(names),)
+    )
+    found = [names[row[0]] for row in cursor.fetchall()]
+    cursor.close()
+    # Both exist only briefly while the scope changes; the new one is built first
+    return "active" if "active" in found else (found[0] if found else None)
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Generate LlamaIndex embeddings for roadmap content (with incremental updates)"
+def validate_embedding_dimensions(conn, dimensions: int, precision: str = "float32") -> None:
+    """Check that embedding_documents.embedding and HNSW can hold `dimensions`."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT a.atttypmod
+        FROM pg_attribute a
+        WHERE a.attrelid = 'embedding_documents'::regclass AND a.attname = 'embedding'
+        """
     )
-    parser.add_argument(
-        "--roadmap",
-        required=True,
-        help="Roadmap ID (e.g., electrician-bc)",
+    row = cursor.fetchone()
+    cursor.close()
+
+    # vector's typmod is its dimension, or -1 when the column is unconstrained
+    column_dimensions = row[0] if row and row[0] > 0 else None
+    if column_dimensions is not None and column_dimensions != dimensions:
+        raise ValueError(
+            f"embedding_documents.embedding is vector({column_dimensions}) but the index "
+            f"has {dimensions} dimensions; apply the Prisma migrations first"
+        )
+
+    max_dimensions = HNSW_MAX_DIMENSIONS[precision]
+    if dimensions > max_dimensions:
+        raise ValueError(
+            f"HNSW indexes {precision} vectors of at most {max_dimensions} dimensions, "
+            f"got {dimensions}; use --dimensions or a lower --precision"
+        )
+
+
+def drop_vector_index(conn, precision: str = "float32", dimensions: int = 1536) -> None:
+    """Drop the HNSW index (of either scope) so a bulk load skips per-row
+    graph maintenance.
+
+    Uses DROP INDEX CONCURRENTLY, so live queries are never blocked; they fall
+    back to exact scans until build_vector_index() finishes. That covers every
+    active version with this precision and dimensions, not only the one being
+    loaded. `conn` must be in autocommit mode.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM embedding_indexes
+        WHERE "isActive" AND "precision" = %s AND dimensions = %s
+        """,
+        (precision, dimensions)
     )
-    parser.add_argument(
-        "--model",
-        default="text-embedding-3-small",
-        help="OpenAI embedding model (default: text-embedding-3-small)",
+    served_versions = cursor.fetchone()[0]
+    for scope in VECTOR_INDEX_SCOPES:
+        index_name, _ = vector_index_spec(precision, dimensions, scope)
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+    cursor.close()
+
+    print(
+        f"  Dropped the {precision}/{dimensions} vector index for bulk load; queries of its "
+        f"{served_versions} active versions run as exact scans until it is rebuilt"
     )
-    parser.add_argument(
-        "--base-path",
-        type=Path,
-        default=None,
-        help="Base project path (default: auto-detect project root)",
+
+
+def retire_replaced_rows(cursor, roadmap_id: Optional[str] = None) -> int:
+    """Mark the rows of every version older than its target's active version
+    retired, for one roadmap or (before an active-scoped index is first
+    built) all of them.
+
+    Global versions that an active user overlay is based on stay unretired.
+
+    Returns:
+        Number of rows retired
+    """
+    cursor.execute(
+        """
+        UPDATE embedding_documents d
+        SET retired = true
+        FROM embedding_indexes i
+        WHERE d."indexId" = i.id AND NOT d.retired AND NOT i."isActive"
+            AND (%(roadmap_id)s::text IS NULL OR i."roadmapId" = %(roadmap_id)s)
+            AND i.version < (
+                SELECT a.version FROM embedding_indexes a
+                WHERE a."roadmapId" = i."roadmapId"
+                    AND a."userId" IS NOT DISTINCT FROM i."userId"
+                    AND a."isActive"
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM embedding_indexes o
+                WHERE o."baseIndexId" = i.id AND o."isActive"
+            )
+        """,
+        {"roadmap_id": roadmap_id}
     )
-    parser.add_argument(
-        "--force-rebuild",
-        action="store_true",
-        help="Force full rebuild of all embeddings (skip incremental update)",
+    return cursor.rowcount
+
+
+def build_vector_index(
+    conn,
+    maintenance_work_mem: str = "1GB",
+    parallel_workers: int = 4,
+    precision: str = "float32",
+    dimensions: int = 1536,
+    scope: str = "all",
+) -> float:
+    """Build the HNSW index for a precision, dimension and scope in one pass,
+    unless a valid one exists, then drop the index of the other scope.
+
+    `conn` must be in autocommit mode.
+
+    Returns:
+        Build time in seconds
+    """
+    index_name, index_definition = vector_index_spec(precision, dimensions, scope)
+    cursor = conn.cursor()
+
+    try:
+        # A failed concurrent build leaves an invalid index behind; replace it
+        cursor.execute(
+            """
+            SELECT i.indisvalid
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s
+            """,
+            (index_name,)
+        )
+        existing = cursor.fetchone()
+        elapsed = 0.0
+        if existing is not None and existing[0]:
+            print(f"  {index_name} already exists")
+        else:
+            if existing is not None:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+            if scope == "active":
+                retired = retire_replaced_rows(cursor)
+                if retired:
+                    print(f"  Retired {retired} rows of replaced versions")
+
+            cursor.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+            cursor.execute("SET max_parallel_maintenance_workers = %s", (parallel_workers,))
+
+            print(
+                f"  Building {index_name} "
+                f"(maintenance_work_mem={maintenance_work_mem}, workers={parallel_workers})..."
+            )
+            started = time.perf_counter()
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} {index_definition}")
+            elapsed = time.perf_counter() - started
+            print(f"  Built {index_name} in {elapsed:.2f}s")
+
+        # Queries match either scope's index; keeping both would double the
+        # maintenance of every insert
+        for other_scope in VECTOR_INDEX_SCOPES:
+            if other_scope != scope:
+                other_name, _ = vector_index_spec(precision, dimensions, other_scope)
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {other_name}")
+    finally:
+        # The connection goes back to the pool; don't leak build settings
+        cursor.execute("RESET maintenance_work_mem")
+        cursor.execute("RESET max_parallel_maintenance_workers")
+        cursor.close()
+
+    return elapsed
+
+
+def load_index_vectors(conn, index_id: str) -> np.ndarray:
+    """Fetch the full-precision vectors of one index version."""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT embedding::text FROM embedding_documents WHERE "indexId" = %s',
+        (index_id,)
     )
-    parser.add_argument(
-        "--dry-run",
-        action="store_true",
-        help="Show what would be changed without making changes",
+    vectors = [json.loads(embedding) for (embedding,) in cursor.fetchall()]
+    cursor.close()
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def load_postgres_duplicate_dependents(conn, index_id: str, removed_files: set[str]) -> set[str]:
+    """Files with duplicate chunks represented by rows of `removed_files`.
+
+    Reads every duplicate record of the index, as dependents of dependents
+    must be re-processed too.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT metadata->>'file_name', metadata->'{DUPLICATES_KEY}'
+        FROM embedding_documents
+        WHERE "indexId" = %s AND metadata ? '{DUPLICATES_KEY}'
+        """,
+        (index_id,)
     )
-    parser.add_argument(
-        "--use-postgres",
-        action="store_true",
-        help="Store embeddings in Postgres (pgvector) instead of JSON files",
+    dependents = duplicate_dependents(cursor.fetchall(), removed_files)
+    cursor.close()
+    return dependents
+
+
+def strip_postgres_duplicates(cursor, index_id: str, removed_files: list[str]) -> None:
+    """Drop duplicate records of removed files from their representatives' metadata."""
+    cursor.execute(
+        f"""
+        UPDATE embedding_documents
+        SET metadata = jsonb_set(metadata, '{{{DUPLICATES_KEY}}}', COALESCE((
+            SELECT jsonb_agg(duplicate)
+            FROM jsonb_array_elements(metadata->'{DUPLICATES_KEY}') duplicate
+            WHERE NOT (duplicate->>'file_name' = ANY(%s))
+        ), '[]'::jsonb))
+        WHERE "indexId" = %s AND metadata ? '{DUPLICATES_KEY}'
+        """,
+        (removed_files, index_id)
     )
-    parser.add_argument(
-        "--user-id",
-        type=str,
-        default=None,
-        help="User ID for user-specific indexes (optional, for multi-tenant support)",
+
+
+def seed_index_dedup(
+    cursor,
+    dedup: ChunkDeduplicator,
+    index_id: str,
+    excluded_files: set[str],
+) -> set[str]:
+    """Seed a deduplicator with an index's chunks, so new chunks that repeat
+    them are referenced, not stored.
+
+    A user overlay is seeded with its global index's chunks. Chunks of
+    `excluded_files` (the files being replaced) are left out.
+
+    Returns:
+        Ids of the seeded rows
+    """
+    cursor.execute(
+        """
+        SELECT id, content FROM embedding_documents
+        WHERE "indexId" = %s AND NOT (COALESCE(metadata->>'file_name', '') = ANY(%s))
+        """,
+        (index_id, sorted(excluded_files))
     )
+    shared_ids = set()
+    for row_id, content in cursor:
+        dedup.seed(row_id, content)
+        shared_ids.add(row_id)
+    return shared_ids
 
-    args = parser.parse_args()
 
-    # Auto-detect project root if not specified
-    if args.base_path is None:
-        args.base_path = find_project_root()
+def record_duplicates_in_postgres(
+    cursor,
+    dedup: ChunkDeduplicator,
+    shared_ids: frozenset = frozenset(),
+    file_metadata: Optional[dict[str, dict[str, Any]]] = None,
+) -> set[str]:
+    """Record the duplicates found in this run in their representatives' metadata.
+
+    They replace any records from the same files, which this run processed
+    in full. Each record carries its file's hash from `file_metadata`, so
+    files whose chunks were all duplicates are still known to
+    load_postgres_metadata(). Representatives in `shared_ids` belong to an
+    overlay's global index and are left untouched; their duplicates are only
+    counted.
 
-    # Load environment variables from .env at project root
-    env_path = args.base_path / ".env"
-    if env_path.exists():
-        load_dotenv(env_path)
-        print(f"Loaded environment from {env_path}")
-    
-    # Verify OpenAI API key is available
-    if not os.getenv("OPENAI_API_KEY"):
-        raise ValueError(
-            "OPENAI_API_KEY not found in environment. "
-            "Please add it to .env file at project root."
+    Returns:
+        The representatives in `shared_ids` that duplicates were found for
+    """
+    file_metadata = file_metadata or {}
+    records = []
+    for representative_id, duplicates in dedup.duplicates.items():
+        if representative_id in shared_ids:
+            continue
+        duplicates = [
+            {**duplicate, "hash": file_metadata.get(duplicate.get("file_name"), {}).get("hash")}
+            for duplicate in duplicates
+        ]
+        file_names = sorted({duplicate.get("file_name") or "" for duplicate in duplicates})
+        records.append((file_names, json.dumps(duplicates), representative_id))
+    if records:
+        cursor.executemany(
+            f"""
+            UPDATE embedding_documents
+            SET metadata = jsonb_set(metadata, '{{{DUPLICATES_KEY}}}', COALESCE((
+                SELECT jsonb_agg(duplicate)
+                FROM jsonb_array_elements(metadata->'{DUPLICATES_KEY}') duplicate
+                WHERE NOT (COALESCE(duplicate->>'file_name', '') = ANY(%s))
+            ), '[]'::jsonb) || %s::jsonb)
+            WHERE id = %s
+            """,
+            records,
         )
+    print_dedup_summary(dedup)
+    referenced = {
+        representative_id for representative_id in dedup.duplicates if representative_id in shared_ids
+    }
+    shared = sum(len(dedup.duplicates[representative_id]) for representative_id in referenced)
+    if shared:
+        print(f"  {shared} chunks reference the global index instead of being stored")
+    return referenced
 
-    print(f"=== Generating LlamaIndex Embeddings for {args.roadmap} ===")
-    print(f"Project root: {args.base_path}")
-    print(f"Storage backend: {'Postgres (pgvector)' if args.use_postgres else 'JSON files'}")
-    if args.user_id:
-        print(f"User-specific index for user: {args.user_id}")
 
-    # Load documents and get file metadata
-    print(f"\nLoading content from src/data/embeddings/{args.roadmap}/...")
-    documents, file_metadata = load_roadmap_documents(args.roadmap, args.base_path)
+def record_shared_rows(cursor, index_id: str, row_ids: set[str]) -> None:
+    """Store the global rows a user overlay's duplicate chunks are served from."""
+    cursor.execute(
+        'UPDATE embedding_indexes SET "sharedRowIds" = %s WHERE id = %s',
+        (sorted(row_ids), index_id)
+    )
+
+
+def overlays_missing_shared_rows(conn, base_index_id: str) -> dict[Optional[str], int]:
+    """Active overlays on a global version that reference rows it no longer
+    has, as user id -> number of missing rows.
+
+    An in-place update of the global index replaces the rows of changed
+    files, so overlay chunks deduplicated against them are not served until
+    the overlay is rebuilt.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT o."userId", COUNT(*)
+        FROM embedding_indexes o, unnest(o."sharedRowIds") AS shared(id)
+        WHERE o."baseIndexId" = %s AND o."isActive"
+            AND NOT EXISTS (
+                SELECT 1 FROM embedding_documents d
+                WHERE d.id = shared.id AND d."indexId" = o."baseIndexId"
+            )
+        GROUP BY o."userId"
+        """,
+        (base_index_id,)
+    )
+    missing = dict(cursor.fetchall())
+    cursor.close()
+    return missing
+
+
+def update_index_document_count(conn, index_id: str, actual_count: int) -> None:
+    """Update the documentCount in embedding_indexes after copying embeddings."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE embedding_indexes
+        SET "documentCount" = %s, "updatedAt" = %s
+        WHERE id = %s
+        """,
+        (actual_count, datetime.now(timezone.utc), index_id)
+    )
+    cursor.close()
+
+    print(f"✓ Updated index document count: {actual_count}")
+
+
+def build_embedding_document_rows(
+    nodes: list[BaseNode],
+    roadmap_id: str,
+    index_id: str,
+    file_metadata: dict[str, dict[str, Any]],
+    user_id: Optional[str] = None,
+) -> list[tuple]:
+    """Build embedding_documents rows from embedded nodes.
+
+    Metadata is serialized the way LlamaIndex vector stores do
+    (node_to_metadata_dict), the format existing rows already use.
+    """
+    from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+    rows = []
+    now = datetime.now(timezone.utc)
+
+    for node in nodes:
+        metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+        file_name = metadata.get('file_name', '')
+        file_hash = file_metadata.get(file_name, {}).get('hash') if file_name else None
+
+        rows.append((
+            node.node_id,                                   # id
+            roadmap_id,                                     # roadmapId
+            metadata.get('node_id'),                        # nodeId
+            user_id,                                        # userId
+            node.get_content(metadata_mode=MetadataMode.NONE),  # content
+            str(node.get_embedding()),                      # embedding
+            json.dumps(metadata),                           # metadata
+            file_hash,                                      # hash
+            1,                                              # version
+            now,                                            # createdAt
+            now,                                            # updatedAt
+            index_id,                                       # indexId
+        ))
+
+    return rows
+
+
+# Column order of the rows produced by build_embedding_document_rows()
+EMBEDDING_DOCUMENT_COLUMNS = (
+    'id', '"roadmapId"', '"nodeId"', '"userId"', 'content', 'embedding',
+    'metadata', 'hash', 'version', '"createdAt"', '"updatedAt"', '"indexId"',
+)
+
+# Rows buffered per COPY round-trip
+COPY_CHUNK_ROWS = 5000
+
+
+def format_copy_value(value: Any) -> str:
+    """Format a value for COPY's text format (tab-separated, \\N for NULL)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def bulk_upsert_embedding_documents(
+    cursor,
+    rows: Iterable[tuple],
+    update_existing: bool = True,
+) -> int:
+    """
+    Bulk-load embedding_documents rows with COPY and one set-based merge.
+
+    Rows are streamed into a temporary staging table with COPY ... FROM STDIN
+    and then merged with a single INSERT ... SELECT ... ON CONFLICT, instead of
+    one INSERT per row. Runs inside the caller's transaction.
+
+    Returns:
+        Number of rows inserted or updated
+    """
+    columns = ", ".join(EMBEDDING_DOCUMENT_COLUMNS)
+    started = time.perf_counter()
+
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS embedding_documents_staging
+            (LIKE embedding_documents INCLUDING DEFAULTS)
+            ON COMMIT DROP
+    """)
+    cursor.execute("TRUNCATE embedding_documents_staging")
+
+    copied = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(format_copy_value(value) for value in row))
+        buffer.write("\n")
+        copied += 1
+        if copied % COPY_CHUNK_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY embedding_documents_staging ({columns}) FROM STDIN", buffer
+            )
+            buffer = io.StringIO()
+    if buffer.tell():
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY embedding_documents_staging ({columns}) FROM STDIN", buffer
+        )
+
+    if update_existing:
+        conflict_action = """DO UPDATE SET
+                content = EXCLUDED.content,
+                embedding = EXCLUDED.embedding,
+                metadata = EXCLUDED.metadata,
+                hash = EXCLUDED.hash,
+                "updatedAt" = EXCLUDED."updatedAt"
+        """
+    else:
+        conflict_action = "DO NOTHING"
+
+    # DISTINCT ON keeps a duplicate id within one load from failing the merge
+    cursor.execute(f"""
+        INSERT INTO embedding_documents ({columns})
+        SELECT DISTINCT ON (id) {columns}
+        FROM embedding_documents_staging
+        ORDER BY id
+        ON CONFLICT (id) {conflict_action}
+    """)
+    merged = cursor.rowcount
+    cursor.execute("TRUNCATE embedding_documents_staging")
+
+    elapsed = time.perf_counter() - started
+    rate = copied / elapsed if elapsed > 0 else 0
+    print(f"  Bulk-loaded {copied} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return merged
+
+
+def update_postgres_index_incremental(
+    conn,
+    index_id: str,
+    roadmap_id: str,
+    changed_documents: Iterable[Document],
+    file_metadata: dict[str, dict[str, Any]],
+    new_files: set[str],
+    modified_files: set[str],
+    deleted_files: set[str],
+    user_id: Optional[str] = None,
+    model_name: str = "text-embedding-3-small",
+    cache: Optional[EmbeddingCache] = None,
+    engine: Optional[EmbeddingEngine] = None,
+    window: int = DEFAULT_STREAM_WINDOW,
+    dimensions: Optional[int] = None,
+    stages: Optional[StageRecorder] = None,
+    dedup: Optional[ChunkDeduplicator] = None,
+    provider: str = "openai",
+    journal: Optional[RunJournal] = None,
+) -> int:
+    """
+    Apply file-level changes to the active index in place.
+
+    Rows belonging to deleted and modified files are removed, and chunks for
+    new and modified files are embedded and appended to the same indexId one
+    window at a time. All writes happen in the caller's transaction on
+    `conn`, so readers never see a partial update. With `dedup`, new chunks
+    are also compared against the rows kept from unchanged files.
+
+    Returns:
+        Number of documents in the index after the update
+    """
+    print(f"\nUsing {provider} embedding model: {model_name}...")
+    embed_model = make_embed_model(model_name, dimensions, provider)
+    Settings.embed_model = embed_model
+    engine = engine or EmbeddingEngine(make_embed_fn(provider, model_name, dimensions))
+    stages = stages or StageRecorder()
+
+    cursor = conn.cursor()
+
+    try:
+        removed_files = sorted(deleted_files | modified_files)
+        # Indexes written before duplicate records carried file hashes list
+        # fully deduplicated files as new, with their old records still in place
+        reprocessed_files = sorted(deleted_files | modified_files | new_files)
+        if removed_files:
+            cursor.execute(
+                """
+                DELETE FROM embedding_documents
+                WHERE "indexId" = %s AND metadata->>'file_name' = ANY(%s)
+                """,
+                (index_id, removed_files)
+            )
+            print(f"  Removed {cursor.rowcount} rows for {len(removed_files)} deleted/modified files")
+
+        if dedup is not None:
+            if reprocessed_files:
+                strip_postgres_duplicates(cursor, index_id, reprocessed_files)
+            cursor.execute(
+                'SELECT id, content FROM embedding_documents WHERE "indexId" = %s',
+                (index_id,)
+            )
+            for row_id, content in cursor:
+                dedup.seed(row_id, content)
+
+        inserted_rows = 0
+        inserted_files = 0
+        for batch, nodes in iter_embedded_nodes(
+            changed_documents, engine, cache, window, stages, dedup, journal
+        ):
+            with stages.stage("copy") as stage:
+                rows = build_embedding_document_rows(
+                    nodes, roadmap_id, index_id, file_metadata, user_id
+                )
+                bulk_upsert_embedding_documents(cursor, rows)
+                stage["rows"] = len(rows)
+            inserted_rows += len(rows)
+            inserted_files += len(batch)
+        print(f"  Inserted {inserted_rows} rows for {inserted_files} new/modified files")
+        if dedup is not None:
+            record_duplicates_in_postgres(cursor, dedup, file_metadata=file_metadata)
+
+        with stages.stage("count_update"):
+            cursor.execute(
+                """
+                UPDATE embedding_indexes
+                SET "documentCount" = (
+                        SELECT COUNT(*) FROM embedding_documents WHERE "indexId" = %s
+                    ),
+                    "updatedAt" = %s
+                WHERE id = %s
+                RETURNING "documentCount"
+                """,
+                (index_id, datetime.now(timezone.utc), index_id)
+            )
+            document_count = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+    print(f"✓ Updated index {index_id} in place ({document_count} documents)")
+    return document_count
+
+
+def generate_roadmap_index(
+    args: argparse.Namespace,
+    roadmap_id: str,
+    user_id: Optional[str],
+    engine: EmbeddingEngine,
+    cache: Optional[EmbeddingCache] = None,
+    pool=None,
+    executor: Optional[ProcessPoolExecutor] = None,
+    stages: Optional[StageRecorder] = None,
+    indexes: Optional[dict[Path, VectorStoreIndex]] = None,
+    journal: Optional[RunJournal] = None,
+) -> None:
+    """Generate or incrementally update the index for one roadmap/user target.
+
+    The embedding engine (and its rate limiter), chunk cache, Postgres pool
+    and parse pool are shared by every target of a run. Stage timings go to
+    `stages`. With `indexes` (watch mode), JSON indexes stay loaded between
+    calls, keyed by their persist directory. Embeddings are checkpointed to
+    the target's `journal`.
+    """
+    stages = stages or StageRecorder()
+    print(f"\n=== Generating LlamaIndex Embeddings for {roadmap_id} ===")
+    if user_id:
+        print(f"User-specific index for user: {user_id}")
+
+    # Hash files up front; they are only parsed once a backend consumes the stream
+    content_path = f"src/data/embeddings/{roadmap_id}/" + (f"users/{user_id}/" if user_id else "")
+    print(f"\nLoading content from {content_path}...")
+    with stages.stage("discover") as stage:
+        content_files = list_content_files(roadmap_id, args.base_path, user_id)
+        stage["rows"] = len(content_files)
+    # Only files whose stat changed since the last run are read and hashed
+    manifest_file = manifest_path(args.cache_dir, roadmap_id, user_id)
+    previous_manifest = {} if args.force_rebuild else load_manifest(manifest_file)
+    with stages.stage("hash") as stage:
+        file_metadata, manifest, rehashed = scan_file_metadata(content_files, previous_manifest)
+        stage["rows"] = rehashed
+    print(f"Hashed {rehashed} of {len(content_files)} files (others unchanged since last scan)")
+    if not args.dry_run:
+        save_manifest(manifest_file, manifest)
 
     # Count file types
-    md_count = sum(1 for d in documents if d.metadata.get("file_type") == "markdown")
-    pdf_count = sum(1 for d in documents if d.metadata.get("file_type") == "pdf")
-    print(f"Found {len(documents)} files ({md_count} markdown, {pdf_count} PDF)")
+    md_count = sum(1 for f in content_files if f.suffix == ".md")
+    pdf_count = sum(1 for f in content_files if f.suffix == ".pdf")
+    print(f"Found {len(content_files)} files ({md_count} markdown, {pdf_count} PDF)")
+
+    jobs = args.jobs or os.cpu_count() or 1
+    chunker = chunker_name(args.chunk_tokens)
+    # One deduplicator per index, so duplicates are found across files and windows
+    dedup = None if args.no_dedup else ChunkDeduplicator(args.dedup_threshold)
+
+    def stream_documents(file_names: Optional[set[str]] = None) -> Iterator[Document]:
+        """Lazily parse all content files, or only the named ones."""
+        files = [f for f in content_files if file_names is None or f.name in file_names]
+        return iter_roadmap_documents(
+            files,
+            roadmap_id,
+            file_metadata,
+            jobs=jobs,
+            window=args.window,
+            executor=executor,
+            stages=stages,
+        )
 
     if args.use_postgres:
         # ========== Postgres backend ==========
+        base_metadata = {}
+        if user_id:
+            # A user's index is an overlay of their own content on the
+            # roadmap's active global index, sharing its rows
+            with transaction(pool) as conn:
+                base_metadata = load_postgres_metadata(conn, roadmap_id)
+            if not base_metadata:
+                raise ValueError(
+                    f"No active global index for {roadmap_id}; generate it without --user-id first"
+                )
+            base_settings = index_settings(base_metadata)
+            if base_settings != (args.model, args.dimensions, args.precision, chunker):
+                model, dimensions, precision, base_chunker = base_settings
+                raise ValueError(
+                    f"The global {roadmap_id} index uses {model} ({dimensions} dimensions, "
+                    f"{precision}, {base_chunker} chunks); overlays must use the same settings"
+                )
+            print(
+                f"Overlay on the global index {base_metadata['indexId']} "
+                f"(version {base_metadata['version']})"
+            )
+
         # Check for existing index in Postgres
         if not args.force_rebuild:
             print("\n--- Checking for file changes (incremental mode) ---")
-            existing_metadata = load_postgres_metadata(args.roadmap, args.user_id)
+            with transaction(pool) as conn:
+                existing_metadata = load_postgres_metadata(conn, roadmap_id, user_id)
 
             if existing_metadata:
                 new_files, modified_files, deleted_files = detect_changes(
@@ -915,24 +1927,121 @@ def main():
                 )
                 total_changes = len(new_files) + len(modified_files) + len(deleted_files)
 
-                if total_changes == 0:
+                existing_settings = index_settings(existing_metadata)
+                same_settings = existing_settings == (
+                    args.model, args.dimensions, args.precision, chunker
+                )
+                same_base = existing_metadata.get("baseIndexId") == base_metadata.get("indexId")
+                missing_shared = 0
+                if user_id and same_base:
+                    # In-place updates keep the global index's id but can
+                    # replace the rows this overlay's chunks are served from
+                    with transaction(pool) as conn:
+                        missing_shared = overlays_missing_shared_rows(
+                            conn, base_metadata["indexId"]
+                        ).get(user_id, 0)
+                    same_base = not missing_shared
+
+                if total_changes == 0 and same_settings and same_base:
                     print("✓ All files unchanged. No embeddings to regenerate.")
                     return
 
-                print(f"Changes detected:")
+                print("Changes detected:")
                 if new_files:
                     print(f"  New files: {', '.join(new_files)}")
                 if modified_files:
                     print(f"  Modified files: {', '.join(modified_files)}")
                 if deleted_files:
                     print(f"  Deleted files: {', '.join(deleted_files)}")
+                if missing_shared:
+                    print(f"  Global index: {missing_shared} shared rows were removed or replaced")
+                elif not same_base:
+                    print(f"  Global index: now {base_metadata['indexId']}")
 
                 if args.dry_run:
                     print("\n[DRY RUN] Would perform the above changes.")
                     return
 
-                print("\nNote: Incremental updates not yet implemented for Postgres backend.")
-                print("Performing full rebuild...")
+                if same_settings and not user_id:
+                    print("\n--- Updating active index in place ---")
+                    warm_dedup = None
+                    if dedup is not None:
+                        with transaction(pool) as conn:
+                            dependents = load_postgres_duplicate_dependents(
+                                conn, existing_metadata["indexId"], modified_files | deleted_files
+                            )
+                            if dependents:
+                                print(
+                                    "  Re-processing files that shared duplicate chunks: "
+                                    + ", ".join(sorted(dependents))
+                                )
+                                modified_files |= dependents
+                            if cache is not None:
+                                warm_dedup = ChunkDeduplicator(args.dedup_threshold)
+                                with conn.cursor() as cursor:
+                                    seed_index_dedup(
+                                        cursor,
+                                        warm_dedup,
+                                        existing_metadata["indexId"],
+                                        modified_files | deleted_files,
+                                    )
+                    if cache is not None:
+                        embed_ahead(
+                            stream_documents(new_files | modified_files),
+                            engine,
+                            cache,
+                            args.window,
+                            stages,
+                            warm_dedup,
+                            journal,
+                        )
+                    with transaction(pool) as conn:
+                        document_count = update_postgres_index_incremental(
+                            conn,
+                            index_id=existing_metadata["indexId"],
+                            roadmap_id=roadmap_id,
+                            changed_documents=stream_documents(new_files | modified_files),
+                            file_metadata=file_metadata,
+                            new_files=new_files,
+                            modified_files=modified_files,
+                            deleted_files=deleted_files,
+                            user_id=user_id,
+                            model_name=args.model,
+                            cache=cache,
+                            engine=engine,
+                            window=args.window,
+                            dimensions=args.dimensions,
+                            stages=stages,
+                            dedup=dedup,
+                            provider=args.provider,
+                            journal=journal,
+                        )
+                        stale_overlays = overlays_missing_shared_rows(
+                            conn, existing_metadata["indexId"]
+                        )
+
+                    print("\n✓ Embedding generation complete!")
+                    print(f"Embeddings stored in Postgres for roadmap: {roadmap_id}")
+                    print(f"Total embeddings: {document_count}")
+                    if stale_overlays:
+                        print(
+                            f"Note: {len(stale_overlays)} user overlays shared removed rows and are "
+                            "rebuilt on their next run: --user-id "
+                            + " ".join(sorted(stale_overlays))
+                        )
+                    return
+
+                if same_settings:
+                    # Overlays only hold the user's own chunks, so a new
+                    # version is cheap and re-checks them against the global index
+                    print("\nRebuilding the user overlay...")
+                else:
+                    model, dimensions, precision, existing_chunker = existing_settings
+                    print(
+                        f"\nNote: Active index uses {model} ({dimensions} dimensions, {precision}, "
+                        f"{existing_chunker} chunks), not {args.model} ({args.dimensions} dimensions, "
+                        f"{args.precision}, {chunker} chunks). Performing full rebuild..."
+                    )
 
         # Create index with Postgres backend
         if args.force_rebuild:
@@ -944,90 +2053,232 @@ def main():
             print("[DRY RUN] Would create new index with all documents in Postgres.")
             return
 
-        # Step 1: Create index with Postgres backend (generates embeddings in LlamaIndex table)
-        index = create_index_with_postgres(
-            documents,
-            roadmap_id=args.roadmap,
-            user_id=args.user_id,
-            model_name=args.model,
+        # Fail before any embedding requests if the table can't hold this size
+        with transaction(pool) as conn:
+            validate_embedding_dimensions(conn, args.dimensions, args.precision)
+            current_scope = current_vector_index_scope(conn, args.precision, args.dimensions)
+        # Keep the scope the existing index has unless another one is asked for
+        scope = args.vector_index_scope or current_scope or "all"
+        retire = scope == "active"
+
+        # Overlays are small, and their global index already has its vector
+        # index and passed the recall check, so they load inline
+        deferred = args.index_strategy == "deferred" and not user_id
+        if deferred and cache is None:
+            # Every chunk must be embedded before the shared index is dropped
+            raise ValueError("--index-strategy deferred needs an embedding cache")
+        # Versions served by any index other than the default float32/1536 one
+        # are activated only once that index exists (and, when quantized,
+        # their recall has been checked)
+        activate_later = deferred or (
+            not user_id and (args.precision, args.dimensions) != ("float32", 1536)
         )
+        shared_ids = set()
+        if base_metadata and dedup is not None and content_files:
+            with transaction(pool) as conn, conn.cursor() as cursor:
+                shared_ids = seed_index_dedup(
+                    cursor, dedup, base_metadata["indexId"], set(file_metadata)
+                )
 
-        # Step 2: Create index metadata record (with initial document count)
-        index_id = persist_postgres_metadata(
-            roadmap_id=args.roadmap,
-            model_name=args.model,
-            document_count=len(documents),
-            file_metadata=file_metadata,
-            user_id=args.user_id,
-        )
+        load_started = time.perf_counter()
+        if cache is not None:
+            # Step 1: Embed into the cache first, so the load transaction (and,
+            # when deferred, the missing vector index) only lasts while rows
+            # load, not while the API is called
+            embed_ahead(
+                stream_documents(), engine, cache, args.window, stages, copy.deepcopy(dedup), journal
+            )
+        if deferred:
+            with autocommit(pool) as conn:
+                drop_vector_index(conn, args.precision, args.dimensions)
 
-        # Step 3: Copy embeddings from LlamaIndex table to Prisma embedding_documents table
-        actual_doc_count = copy_embeddings_to_prisma_tables(
-            roadmap_id=args.roadmap,
-            index_id=index_id,
-            documents=documents,
-            file_metadata=file_metadata,
-            user_id=args.user_id,
-        )
+        try:
+            # Steps 2-4 share one transaction: readers never see the new
+            # version until its rows and document count are in place
+            with transaction(pool) as conn:
+                # Step 2: Create an inactive index metadata record (with initial document count)
+                index_id = persist_postgres_metadata(
+                    conn,
+                    roadmap_id=roadmap_id,
+                    model_name=args.model,
+                    document_count=len(file_metadata),
+                    file_metadata=file_metadata,
+                    user_id=user_id,
+                    activate=False,
+                    precision=args.precision,
+                    dimensions=args.dimensions,
+                    chunker=chunker,
+                    base_index_id=base_metadata.get("indexId"),
+                )
 
-        # Step 4: Update document count with actual number copied
-        update_index_document_count(index_id, actual_doc_count)
+                # Step 3: Write the documents' chunks straight into embedding_documents
+                actual_doc_count = write_index_to_postgres(
+                    conn,
+                    stream_documents(),
+                    roadmap_id=roadmap_id,
+                    index_id=index_id,
+                    file_metadata=file_metadata,
+                    user_id=user_id,
+                    model_name=args.model,
+                    cache=cache,
+                    engine=engine,
+                    window=args.window,
+                    dimensions=args.dimensions,
+                    stages=stages,
+                    dedup=dedup,
+                    provider=args.provider,
+                    journal=journal,
+                )
+                if dedup is not None:
+                    with conn.cursor() as cursor:
+                        referenced = record_duplicates_in_postgres(
+                            cursor, dedup, shared_ids, file_metadata
+                        )
+                        if referenced:
+                            record_shared_rows(cursor, index_id, referenced)
+
+                # Step 4: Update document count with actual number copied
+                with stages.stage("count_update"):
+                    update_index_document_count(conn, index_id, actual_doc_count)
+
+                if not activate_later:
+                    activate_index_version(conn, index_id, roadmap_id, user_id, retire=retire)
+            print(f"  Embed and load time: {time.perf_counter() - load_started:.2f}s")
+        finally:
+            # Step 5: Rebuild the vector index (even if the load failed, so
+            # queries against the previous version get their index back), or
+            # create the quantized index or a newly scoped one on first use.
+            # CREATE INDEX CONCURRENTLY must run after the load commits.
+            if activate_later or scope != current_scope:
+                with autocommit(pool) as conn, stages.stage("index_build"):
+                    index_seconds = build_vector_index(
+                        conn,
+                        maintenance_work_mem=args.maintenance_work_mem,
+                        parallel_workers=args.parallel_maintenance_workers,
+                        precision=args.precision,
+                        dimensions=args.dimensions,
+                        scope=scope,
+                    )
+                print(f"  Index build time: {index_seconds:.2f}s")
+
+        # Step 6: Switch queries to the new version only once its index is
+        # ready and its quantized recall holds
+        if activate_later:
+            with transaction(pool) as conn:
+                check_quantized_recall(
+                    load_index_vectors(conn, index_id),
+                    args.precision,
+                    min_recall=args.min_recall,
+                    rerank=True,
+                )
+                activate_index_version(conn, index_id, roadmap_id, user_id, retire=retire)
 
         print("\n✓ Embedding generation complete!")
-        print(f"Embeddings stored in Postgres for roadmap: {args.roadmap}")
+        print(f"Embeddings stored in Postgres for roadmap: {roadmap_id}")
         print(f"Total embeddings: {actual_doc_count}")
-        if args.user_id:
-            print(f"User-specific index for: {args.user_id}")
+        if user_id:
+            print(f"User-specific overlay for: {user_id}")
     else:
         # ========== JSON file backend (legacy) ==========
         output_path = args.base_path / "src/data/embeddings"
-        persist_dir = output_path / args.roadmap / "index"
+        persist_dir = output_path / roadmap_id / "index"
 
         new_files = set()
         modified_files = set()
         deleted_files = set()
+        ann_params = {
+            "type": args.ann,
+            "lists": args.ann_lists,
+            "probes": args.ann_probes,
+            "targetRecall": args.ann_recall,
+        }
+
+        incremental = persist_dir.exists() and not args.force_rebuild
+        existing_metadata = load_existing_metadata(persist_dir) if incremental else {}
+        if existing_metadata:
+            # A precision change only rewrites the binary store (see stale_json_artifacts)
+            model, dimensions, _, existing_chunker = index_settings(existing_metadata)
+            if (model, dimensions, existing_chunker) != (args.model, args.dimensions, chunker):
+                print(
+                    f"\nNote: Existing index uses {model} ({dimensions} dimensions, "
+                    f"{existing_chunker} chunks), not {args.model} ({args.dimensions} dimensions, "
+                    f"{chunker} chunks). Performing full rebuild..."
+                )
+                incremental = False
 
-        if persist_dir.exists() and not args.force_rebuild:
+        if incremental:
             print("\n--- Checking for file changes (incremental mode) ---")
-            existing_metadata = load_existing_metadata(persist_dir)
             new_files, modified_files, deleted_files = detect_changes(file_metadata, existing_metadata)
 
             total_changes = len(new_files) + len(modified_files) + len(deleted_files)
 
             if total_changes == 0:
-                print("✓ All files unchanged. No embeddings to regenerate.")
-                return
-
-            print(f"Changes detected:")
-            if new_files:
-                print(f"  New files: {', '.join(new_files)}")
-            if modified_files:
-                print(f"  Modified files: {', '.join(modified_files)}")
-            if deleted_files:
-                print(f"  Deleted files: {', '.join(deleted_files)}")
+                stale = stale_json_artifacts(
+                    persist_dir, existing_metadata, args.binary_store, args.precision, ann_params
+                )
+                if not stale:
+                    print("✓ All files unchanged. No embeddings to regenerate.")
+                    return
+                # Only files derived from the stored vectors need writing
+                print(f"Files unchanged; rewriting {', '.join(stale)} from the stored vectors")
+            else:
+                print("Changes detected:")
+                if new_files:
+                    print(f"  New files: {', '.join(new_files)}")
+                if modified_files:
+                    print(f"  Modified files: {', '.join(modified_files)}")
+                if deleted_files:
+                    print(f"  Deleted files: {', '.join(deleted_files)}")
 
             if args.dry_run:
                 print("\n[DRY RUN] Would perform the above changes.")
                 return
 
             # Load existing index and update incrementally
-            print("\nLoading existing index for incremental update...")
-            index = load_existing_index(persist_dir)
-
-            print("Updating index with changes...")
-            update_index_incremental(
-                index,
-                documents,
-                new_files,
-                modified_files,
-                deleted_files,
-                args.roadmap,
-            )
+            Settings.embed_model = make_embed_model(args.model, args.dimensions, args.provider)
+            # Taken out while it is modified, so a failed update never leaves
+            # a half-updated index in memory
+            index = indexes.pop(persist_dir, None) if indexes is not None else None
+            if index is None:
+                print("\nLoading existing index for incremental update...")
+                index = load_existing_index(persist_dir)
+
+            if dedup is not None and total_changes:
+                dependents = duplicate_dependents(
+                    (
+                        (node.metadata.get("file_name"), node.metadata.get(DUPLICATES_KEY, []))
+                        for node in index.docstore.docs.values()
+                    ),
+                    modified_files | deleted_files,
+                )
+                if dependents:
+                    print(
+                        "  Re-processing files that shared duplicate chunks: "
+                        + ", ".join(sorted(dependents))
+                    )
+                    modified_files |= dependents
+
+            if total_changes:
+                print("Updating index with changes...")
+                update_index_incremental(
+                    index,
+                    stream_documents(new_files | modified_files),
+                    new_files,
+                    modified_files,
+                    deleted_files,
+                    roadmap_id,
+                    cache=cache,
+                    engine=engine,
+                    window=args.window,
+                    stages=stages,
+                    dedup=dedup,
+                    journal=journal,
+                )
         else:
             # Full rebuild
             if args.force_rebuild:
                 print("\n--- Force rebuild mode ---")
-                print(f"Regenerating embeddings for all {len(documents)} files...")
+                print(f"Regenerating embeddings for all {len(content_files)} files...")
             else:
                 print("\n--- Creating new index ---")
 
@@ -1036,18 +2287,795 @@ def main():
                 return
 
             # Create index
-            index = create_index(documents, args.model)
+            index = create_index(
+                stream_documents(),
+                args.model,
+                cache=cache,
+                engine=engine,
+                window=args.window,
+                dimensions=args.dimensions,
+                stages=stages,
+                dedup=dedup,
+                provider=args.provider,
+                journal=journal,
+            )
 
         # Persist to disk
-        persist_index(index, args.roadmap, args.model, output_path, file_metadata)
+        with stages.stage("persist") as stage:
+            persist_index(
+                index,
+                roadmap_id,
+                args.model,
+                output_path,
+                file_metadata,
+                binary_store=args.binary_store,
+                min_recall=args.min_recall,
+                dimensions=args.dimensions,
+                chunker=chunker,
+                precision=args.precision,
+                ann=ann_params,
+            )
+            stage["rows"] = len(index.docstore.docs)
+        if indexes is not None:
+            indexes[persist_dir] = index
 
         print("\n✓ Embedding generation complete!")
         print(
-            f"\nGenerated index saved to: src/data/embeddings/{args.roadmap}/index/"
+            f"\nGenerated index saved to: src/data/embeddings/{roadmap_id}/index/"
+        )
+        print(
+            f"Source files remain at: src/data/embeddings/{roadmap_id}/ (*.md, *.pdf)"
+        )
+
+
+def watch_targets(
+    args: argparse.Namespace,
+    targets: list[tuple[str, Optional[str]]],
+    run_target,
+    failures: list[tuple[str, str]],
+    indexes: dict[Path, VectorStoreIndex],
+) -> None:
+    """Update every target whose content changes, until Ctrl-C.
+
+    A global target watches its roadmap's content directory and a user target
+    its users/<user-id>/ directory, so a user's edit only updates that
+    overlay. The engine, cache, database pool and loaded JSON indexes stay
+    resident, so an update costs change detection plus the changed files'
+    chunks.
+    """
+    roadmap_ids = sorted({roadmap_id for roadmap_id, _ in targets})
+    content_dir = args.base_path / "src/data/embeddings"
+
+    # Load JSON indexes up front, so the first change does not pay for it
+    if not args.use_postgres:
+        Settings.embed_model = make_embed_model(args.model, args.dimensions, args.provider)
+        for roadmap_id in roadmap_ids:
+            persist_dir = content_dir / roadmap_id / "index"
+            if persist_dir not in indexes and (persist_dir / "docstore.json").exists():
+                indexes[persist_dir] = load_existing_index(persist_dir)
+
+    watcher = create_watcher(
+        {
+            (roadmap_id, user_id): (
+                user_content_dir(roadmap_id, user_id, args.base_path)
+                if user_id
+                else content_dir / roadmap_id
+            )
+            for roadmap_id, user_id in targets
+        },
+        poll=args.poll,
+        poll_interval=args.poll_interval,
+    )
+    print(
+        f"\n=== Watching {len(targets)} targets ({type(watcher).__name__}); "
+        "press Ctrl-C to stop ==="
+    )
+    try:
+        for changed in watcher.batches(args.debounce):
+            started = time.perf_counter()
+            # The exit status reflects the latest update
+            failures.clear()
+            for target in targets:
+                if target in changed:
+                    run_target(target)
+            labels = sorted(
+                roadmap_id + (f" (user {user_id})" if user_id else "")
+                for roadmap_id, user_id in changed
+            )
+            print(
+                f"\n=== Updated {', '.join(labels)} in "
+                f"{time.perf_counter() - started:.2f}s; watching ==="
+            )
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        watcher.close()
+
+
+def switch_vector_index_scope(args: argparse.Namespace, pool) -> None:
+    """Rebuild the existing HNSW index for --precision/--dimensions with the
+    requested scope, before any target writes rows."""
+    with transaction(pool) as conn:
+        current_scope = current_vector_index_scope(conn, args.precision, args.dimensions)
+    # A missing index is built with the requested scope by the next full rebuild
+    if current_scope is None or current_scope == args.vector_index_scope:
+        return
+
+    print(f"\nChanging the vector index scope from {current_scope} to {args.vector_index_scope}...")
+    with autocommit(pool) as conn:
+        build_vector_index(
+            conn,
+            maintenance_work_mem=args.maintenance_work_mem,
+            parallel_workers=args.parallel_maintenance_workers,
+            precision=args.precision,
+            dimensions=args.dimensions,
+            scope=args.vector_index_scope,
+        )
+
+
+def report_index_versions(args: argparse.Namespace, targets: list[tuple[str, Optional[str]]]) -> None:
+    """Print every target's index versions and the HNSW index sizes, applying
+    --keep-versions when given."""
+    pool = create_pool(get_database_url(), max_connections=1)
+    try:
+        for roadmap_id, user_id in targets:
+            label = f"{roadmap_id}" + (f" (user {user_id})" if user_id else "")
+            if args.keep_versions:
+                print(f"\n=== {label} ===")
+                collect_index_versions(
+                    pool,
+                    roadmap_id,
+                    user_id,
+                    keep=args.keep_versions,
+                    batch_rows=args.gc_batch_rows,
+                    pause=args.gc_pause,
+                    dry_run=args.dry_run,
+                    show=True,
+                )
+                continue
+            with transaction(pool) as conn:
+                versions = version_report(conn, roadmap_id, user_id)
+            print(f"\n=== {label} ===")
+            print_version_report(versions)
+
+        with transaction(pool) as conn:
+            sizes = vector_index_sizes(conn)
+        print("\nVector indexes on embedding_documents:")
+        for name, size, valid in sizes:
+            print(f"  {name}: {format_megabytes(size)}" + ("" if valid else " (invalid)"))
+    finally:
+        pool.closeall()
+
+
+def activate_stored_versions(args: argparse.Namespace, targets: list[tuple[str, Optional[str]]]) -> None:
+    """Make an existing version active for every target (--activate-version),
+    e.g. to roll back to one kept by --keep-versions."""
+    pool = create_pool(get_database_url(), max_connections=1)
+    try:
+        for roadmap_id, user_id in targets:
+            label = f"{roadmap_id}" + (f" (user {user_id})" if user_id else "")
+            print(f"\n=== {label} ===")
+            with transaction(pool) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT id FROM embedding_indexes
+                    WHERE "roadmapId" = %s AND "userId" IS NOT DISTINCT FROM %s AND version = %s
+                    """,
+                    (roadmap_id, user_id, args.activate_version)
+                )
+                row = cursor.fetchone()
+                cursor.close()
+                if row is None:
+                    raise ValueError(f"{label} has no index version {args.activate_version}")
+                activate_index_version(conn, row[0], roadmap_id, user_id)
+    finally:
+        pool.closeall()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate LlamaIndex embeddings for roadmap content (with incremental updates)"
+    )
+    roadmap_group = parser.add_mutually_exclusive_group(required=True)
+    roadmap_group.add_argument(
+        "--roadmap",
+        nargs="+",
+        help="One or more roadmap IDs (e.g., electrician-bc)",
+    )
+    roadmap_group.add_argument(
+        "--all",
+        action="store_true",
+        help="Generate every roadmap found in src/data/embeddings/",
+    )
+    parser.add_argument(
+        "--provider",
+        choices=PROVIDERS,
+        default="openai",
+        help=(
+            "Embedding provider: the OpenAI API, a local ONNX model on the CPU (requires fastembed), "
+            "or deterministic word hashing for tests and benchmarks (default: openai)"
+        ),
+    )
+    parser.add_argument(
+        "--allow-non-openai",
+        action="store_true",
+        help=(
+            "Let a local or fake provider write to the indexes the app serves: the project's "
+            "own src/data/embeddings, or Postgres. The app embeds queries with OpenAI, so it "
+            "cannot query them"
+        ),
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help=(
+            "Embedding model (default: "
+            + ", ".join(f"{model} for {provider}" for provider, model in DEFAULT_MODELS.items())
+            + ")"
+        ),
+    )
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=None,
+        help="Shorten embeddings to this many dimensions (text-embedding-3 models only; default: model's native size)",
+    )
+    parser.add_argument(
+        "--base-path",
+        type=Path,
+        default=None,
+        help="Base project path (default: auto-detect project root)",
+    )
+    parser.add_argument(
+        "--force-rebuild",
+        action="store_true",
+        help="Force full rebuild of all embeddings (skip incremental update)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show what would be changed without making changes",
+    )
+    parser.add_argument(
+        "--use-postgres",
+        action="store_true",
+        help="Store embeddings in Postgres (pgvector) instead of JSON files",
+    )
+    parser.add_argument(
+        "--user-id",
+        nargs="+",
+        default=None,
+        help="One or more user IDs for user overlay indexes on the global index (optional, for multi-tenant support)",
+    )
+    parser.add_argument(
+        "--user-ids-file",
+        type=Path,
+        default=None,
+        help="File with one user ID per line, added to --user-id",
+    )
+    parser.add_argument(
+        "--parallel-targets",
+        type=int,
+        default=1,
+        help="Roadmap/user targets generated concurrently (default: 1)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for the persistent chunk embedding cache (default: scripts/embeddings/.cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Disable the chunk embedding cache and embed every chunk through the API "
+            "(Postgres runs stage the run's vectors in a temporary cache)"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse the chunks embedded by an interrupted run instead of embedding them again",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=DEFAULT_CHECKPOINT_EVERY,
+        help=f"Embedding requests between checkpoint flushes (default: {DEFAULT_CHECKPOINT_EVERY})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help=f"Number of concurrent embedding requests (default: {DEFAULT_CONCURRENCY} for openai, one per CPU otherwise)",
+    )
+    parser.add_argument(
+        "--batch-tokens",
+        type=int,
+        default=None,
+        help=f"Token budget per embedding request (default: {DEFAULT_BATCH_TOKENS} for openai, 8192 otherwise)",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=None,
+        help=f"Tokens-per-minute limit across all requests, 0 to disable (default: {DEFAULT_TPM} for openai, none otherwise)",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=None,
+        help=f"Requests-per-minute limit across all requests, 0 to disable (default: {DEFAULT_RPM} for openai, none otherwise)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for parsing PDF and markdown files, 0 for one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "--index-strategy",
+        choices=("inline", "deferred"),
+        default="inline",
+        help=(
+            "Postgres full rebuilds: 'inline' maintains the HNSW index row by row; "
+            "'deferred' drops it for the load and rebuilds it afterwards, one target at a time. "
+            "The index is shared by every roadmap and user with the same precision and "
+            "dimensions, and their queries run as exact scans until it is rebuilt "
+            "(default: inline)"
+        ),
+    )
+    parser.add_argument(
+        "--vector-index-scope",
+        choices=VECTOR_INDEX_SCOPES,
+        default=None,
+        help=(
+            "Rows the Postgres HNSW index covers: 'all', or 'active' to leave out the rows of "
+            "replaced versions (default: the existing index's scope, else all)"
+        ),
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=None,
+        help=(
+            "After each Postgres target, keep its active version and the N - 1 before it, "
+            "deleting older versions (default: keep every version)"
+        ),
+    )
+    parser.add_argument(
+        "--gc-batch-rows",
+        type=int,
+        default=DEFAULT_GC_BATCH_ROWS,
+        help=f"Rows deleted per transaction when collecting old versions (default: {DEFAULT_GC_BATCH_ROWS})",
+    )
+    parser.add_argument(
+        "--gc-pause",
+        type=float,
+        default=DEFAULT_GC_PAUSE,
+        help=f"Seconds between deletion batches when collecting old versions (default: {DEFAULT_GC_PAUSE})",
+    )
+    parser.add_argument(
+        "--versions",
+        action="store_true",
+        help=(
+            "List each target's Postgres index versions with their rows and bytes instead of "
+            "generating (with --keep-versions, also delete the expired ones)"
+        ),
+    )
+    parser.add_argument(
+        "--activate-version",
+        type=int,
+        default=None,
+        help="Make this existing Postgres index version active for each target instead of generating (rollback)",
+    )
+    parser.add_argument(
+        "--maintenance-work-mem",
+        default="1GB",
+        help="maintenance_work_mem for deferred HNSW builds (default: 1GB)",
+    )
+    parser.add_argument(
+        "--parallel-maintenance-workers",
+        type=int,
+        default=4,
+        help="max_parallel_maintenance_workers for deferred HNSW builds (default: 4)",
+    )
+    parser.add_argument(
+        "--binary-store",
+        choices=BINARY_STORE_DTYPES,
+        default=None,
+        help="Also write a memory-mappable vectors.npy + rows.json next to the JSON index (JSON backend only)",
+    )
+    parser.add_argument(
+        "--ann",
+        choices=ANN_TYPES,
+        default=None,
+        help=(
+            "ANN index written next to the JSON index: ivf or none "
+            "(default: the roadmap's previous setting, else ivf; JSON backend only)"
+        ),
+    )
+    parser.add_argument(
+        "--ann-lists",
+        type=int,
+        default=None,
+        help="IVF lists, 0 for about sqrt(chunks), 1 below 256 chunks (default: previous setting, else 0)",
+    )
+    parser.add_argument(
+        "--ann-probes",
+        type=int,
+        default=None,
+        help="Lists searched per query instead of tuning them for --ann-recall, 0 to tune again (default: previous setting)",
+    )
+    parser.add_argument(
+        "--ann-recall",
+        type=float,
+        default=None,
+        help="Recall@10 the IVF probes are tuned for (default: previous setting, else 0.95)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help=(
+            "Vector precision: Postgres builds its HNSW index on float16 (halfvec) or binary "
+            "(bit) casts, while rows keep their float32 vectors; the JSON backend writes it "
+            "as the binary store dtype (default: float32)"
+        ),
+    )
+    parser.add_argument(
+        "--min-recall",
+        type=float,
+        default=0.0,
+        help=f"Fail instead of activating a quantized index whose recall@{DEFAULT_RECALL_K} vs float32 is below this (default: 0, report only)",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=DEFAULT_CHUNK_TOKENS,
+        help=(
+            "Target chunk size in tokens, including embedded metadata; chunks follow "
+            f"markdown headings and PDF pages (default: {DEFAULT_CHUNK_TOKENS})"
+        ),
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEFAULT_DEDUP_THRESHOLD,
+        help=(
+            "Estimated Jaccard similarity at which a chunk counts as a near-duplicate "
+            "and is not embedded, e.g. 0.9; 1.0 removes exact duplicates only "
+            f"(default: {DEFAULT_DEDUP_THRESHOLD})"
+        ),
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Embed every chunk, including exact and near-duplicates",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="Write a JSON run report with per-stage timings and embedding API statistics",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILERS,
+        default=None,
+        help="Also profile each stage with cProfile (.prof files next to --report) or tracemalloc",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After generating, keep running and update each roadmap as its content files change",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="With --watch, poll for changes instead of using inotify (e.g. on network filesystems)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f"Seconds between scans when polling (default: {DEFAULT_POLL_INTERVAL})",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help=f"With --watch, seconds without changes before an update starts (default: {DEFAULT_DEBOUNCE})",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=DEFAULT_STREAM_WINDOW,
+        help=f"Files parsed, chunked and embedded per pipeline step (default: {DEFAULT_STREAM_WINDOW})",
+    )
+
+    args = parser.parse_args()
+
+    args.model = args.model or DEFAULT_MODELS[args.provider]
+    # Local and fake providers have no quotas: no rate limits, and smaller
+    # batches spread over every core
+    for name, value in engine_settings(args.provider).items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+
+    try:
+        args.dimensions = resolve_dimensions(args.model, args.dimensions)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.use_postgres and args.precision not in POSTGRES_PRECISIONS:
+        parser.error(f"--precision {args.precision} is not supported by pgvector; use one of {', '.join(POSTGRES_PRECISIONS)}")
+    if not args.use_postgres and args.precision != "float32":
+        if args.binary_store and args.binary_store != args.precision:
+            parser.error("--binary-store and --precision disagree")
+        args.binary_store = args.precision
+    if args.chunk_tokens < 64:
+        parser.error("--chunk-tokens must be at least 64")
+    if not 0 < args.dedup_threshold <= 1:
+        parser.error("--dedup-threshold must be in (0, 1]")
+    if args.profile and not args.report:
+        parser.error("--profile requires --report")
+    if args.profile and args.parallel_targets > 1:
+        parser.error("--profile requires --parallel-targets 1")
+    if args.ann_lists is not None and args.ann_lists < 0:
+        parser.error("--ann-lists must be at least 0")
+    if args.ann_probes is not None and args.ann_probes < 0:
+        parser.error("--ann-probes must be at least 0")
+    if args.ann_recall is not None and not 0 < args.ann_recall <= 1:
+        parser.error("--ann-recall must be in (0, 1]")
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    if args.watch and args.dry_run:
+        parser.error("--watch cannot be combined with --dry-run")
+    if not args.use_postgres:
+        for flag, value in (
+            ("--keep-versions", args.keep_versions),
+            ("--vector-index-scope", args.vector_index_scope),
+            ("--versions", args.versions),
+            ("--activate-version", args.activate_version),
+        ):
+            if value:
+                parser.error(f"{flag} requires --use-postgres")
+    if args.keep_versions is not None and args.keep_versions < 1:
+        parser.error("--keep-versions must be at least 1")
+    if args.gc_batch_rows < 1:
+        parser.error("--gc-batch-rows must be at least 1")
+    if args.gc_pause < 0:
+        parser.error("--gc-pause must be at least 0")
+    if args.versions and args.watch:
+        parser.error("--versions cannot be combined with --watch")
+    if args.activate_version is not None and (args.versions or args.watch or args.dry_run):
+        parser.error("--activate-version cannot be combined with --versions, --watch or --dry-run")
+
+    # Auto-detect project root if not specified
+    if args.base_path is None:
+        args.base_path = find_project_root()
+
+    # Load environment variables from .env at project root
+    env_path = args.base_path / ".env"
+    if env_path.exists():
+        load_dotenv(env_path)
+        print(f"Loaded environment from {env_path}")
+    
+    # Verify OpenAI API key is available
+    embeds = not args.versions and args.activate_version is None
+    # The app embeds queries with OpenAI, so other providers' vectors must
+    # not replace the indexes it serves
+    if args.provider != "openai" and embeds and not args.dry_run and not args.allow_non_openai:
+        if args.use_postgres:
+            parser.error(
+                f"--provider {args.provider} would activate Postgres versions the app cannot "
+                "query (it embeds queries with OpenAI); pass --allow-non-openai to write them anyway"
+            )
+        if args.base_path.resolve() == find_project_root().resolve():
+            parser.error(
+                f"--provider {args.provider} would overwrite the JSON indexes the app serves "
+                "(it embeds queries with OpenAI); pass --base-path with a copy of the content, "
+                "or --allow-non-openai"
+            )
+    if args.provider == "openai" and embeds and not os.getenv("OPENAI_API_KEY"):
+        raise ValueError(
+            "OPENAI_API_KEY not found in environment. "
+            "Please add it to .env file at project root."
         )
+
+    roadmap_ids = discover_roadmap_ids(args.base_path) if args.all else args.roadmap
+    user_ids: list[Optional[str]] = list(args.user_id or [])
+    if args.user_ids_file:
+        user_ids += read_user_ids(args.user_ids_file)
+    if user_ids and not args.use_postgres:
+        raise ValueError("--user-id and --user-ids-file require --use-postgres")
+    targets = [
+        (roadmap_id, user_id)
+        for roadmap_id in roadmap_ids
+        for user_id in (user_ids or [None])
+    ]
+
+    print(f"Project root: {args.base_path}")
+    print(f"Storage backend: {'Postgres (pgvector)' if args.use_postgres else 'JSON files'}")
+    print(f"Embedding provider: {args.provider} ({args.model}, {args.dimensions} dimensions)")
+    if args.provider == "local" and args.chunk_tokens > LOCAL_MAX_TOKENS:
         print(
-            f"Source files remain at: src/data/embeddings/{args.roadmap}/ (*.md, *.pdf)"
+            f"Note: local models truncate input at {LOCAL_MAX_TOKENS} tokens; "
+            f"consider --chunk-tokens {LOCAL_MAX_TOKENS}"
         )
+    print(
+        f"Targets: {len(targets)} ({len(roadmap_ids)} roadmaps"
+        + (f" x {len(user_ids)} users)" if user_ids else ")")
+    )
+
+    if args.versions:
+        report_index_versions(args, targets)
+        return
+    if args.activate_version is not None:
+        activate_stored_versions(args, targets)
+        return
+
+    # Every target chunks along markdown headings and PDF pages
+    Settings.node_parser = StructuredNodeParser(chunk_tokens=args.chunk_tokens)
+
+    # One embedding engine for the whole run, so every target draws from the
+    # same tokens-per-minute and requests-per-minute budget
+    engine = EmbeddingEngine(
+        make_embed_fn(args.provider, args.model, args.dimensions),
+        concurrency=args.concurrency,
+        batch_tokens=args.batch_tokens,
+        tpm=args.tpm or None,
+        rpm=args.rpm or None,
+    )
+
+    # Chunk embeddings are committed to the cache as soon as they are created
+    cache = None
+    scratch_cache_dir = None
+    if not args.no_cache and not args.dry_run:
+        cache = EmbeddingCache(
+            args.cache_dir, args.model, shortened_dimensions(args.model, args.dimensions)
+        )
+        print(f"Embedding cache: {cache.path}")
+    elif args.use_postgres and not args.dry_run:
+        # Postgres writes embed every chunk before their transaction opens
+        # and read the vectors back from a cache, so stage them in one that
+        # is deleted with the run
+        scratch_cache_dir = tempfile.TemporaryDirectory(prefix="embedding-cache-")
+        cache = EmbeddingCache(
+            Path(scratch_cache_dir.name),
+            args.model,
+            shortened_dimensions(args.model, args.dimensions),
+        )
+
+    parallel_targets = max(1, min(args.parallel_targets, len(targets)))
+    if args.index_strategy == "deferred" and parallel_targets > 1:
+        # Every roadmap of a precision and dimension shares one HNSW index;
+        # concurrent targets would race to drop and rebuild it
+        parser.error("--index-strategy deferred requires --parallel-targets 1")
+    jobs = args.jobs or os.cpu_count() or 1
+
+    # One pooled session serves every Postgres step of the run
+    pool = None
+    if args.use_postgres:
+        pool = create_pool(get_database_url(), max_connections=parallel_targets + 1)
+        if args.vector_index_scope and not args.dry_run:
+            switch_vector_index_scope(args, pool)
+
+    # Concurrent targets share one parse pool; spawn avoids forking a
+    # multi-threaded process
+    executor = None
+    if jobs > 1 and parallel_targets > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    report = RunReport(
+        profiler=args.profile,
+        profile_dir=args.report.parent / f"{args.report.stem}-profiles" if args.report else None,
+    )
+    failures: list[tuple[str, str]] = []
+    # Loaded JSON indexes, kept between updates in watch mode
+    indexes: Optional[dict[Path, VectorStoreIndex]] = {} if args.watch else None
+
+    def run_target(target: tuple[str, Optional[str]]) -> None:
+        roadmap_id, user_id = target
+        label = f"{roadmap_id}" + (f" (user {user_id})" if user_id else "")
+        stages = report.target(label)
+        journal = None
+        if not args.dry_run:
+            journal = RunJournal(
+                journal_path(args.cache_dir, roadmap_id, user_id),
+                args.model,
+                args.dimensions,
+                resume=args.resume,
+                checkpoint_every=args.checkpoint_every,
+            )
+        try:
+            generate_roadmap_index(
+                args,
+                roadmap_id,
+                user_id,
+                engine,
+                cache=cache,
+                pool=pool,
+                executor=executor,
+                stages=stages,
+                indexes=indexes,
+                journal=journal,
+            )
+            if journal is not None:
+                journal.complete()
+            if args.keep_versions:
+                with stages.stage("gc") as stage:
+                    _, stage["rows"] = collect_index_versions(
+                        pool,
+                        roadmap_id,
+                        user_id,
+                        keep=args.keep_versions,
+                        batch_rows=args.gc_batch_rows,
+                        pause=args.gc_pause,
+                        dry_run=args.dry_run,
+                    )
+        except Exception as e:
+            print(f"\n✗ Failed to generate {label}: {e}")
+            if journal is not None and len(journal):
+                print(f"  {len(journal)} embedded chunks are checkpointed; rerun with --resume to reuse them")
+            stages.error = str(e)
+            failures.append((label, str(e)))
+        finally:
+            if journal is not None:
+                journal.close()
+
+    try:
+        if parallel_targets > 1:
+            with ThreadPoolExecutor(max_workers=parallel_targets) as thread_pool:
+                list(thread_pool.map(run_target, targets))
+        else:
+            for target in targets:
+                run_target(target)
+
+        if args.watch:
+            # Later updates are incremental even if the first run was a rebuild
+            args.force_rebuild = False
+            watch_targets(args, targets, run_target, failures, indexes)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if pool is not None:
+            pool.closeall()
+        if cache is not None:
+            cache.close()
+        if scratch_cache_dir is not None:
+            scratch_cache_dir.cleanup()
+
+    if args.report:
+        report.write(
+            args.report,
+            settings={
+                "backend": "postgres" if args.use_postgres else "json",
+                "provider": args.provider,
+                "model": args.model,
+                "dimensions": args.dimensions,
+                "precision": args.precision,
+                "chunker": chunker_name(args.chunk_tokens),
+                "jobs": jobs,
+                "window": args.window,
+                "concurrency": args.concurrency,
+                "parallelTargets": parallel_targets,
+            },
+            engine=engine,
+            cache=cache,
+        )
+
+    if len(targets) > 1:
+        print(f"\n=== {len(targets) - len(failures)}/{len(targets)} targets generated ===")
+    if failures:
+        for label, error in failures:
+            print(f"  ✗ {label}: {error}")
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
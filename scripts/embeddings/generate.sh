@@ -7,19 +7,60 @@ PYTHON_SCRIPT="$SCRIPT_DIR/generate.py"
 
 function usage() {
     cat <<EOF
-Usage: $(basename "$0") <roadmap-id> [options]
+Usage: $(basename "$0") <roadmap-id>... [options]
+       $(basename "$0") --all [options]
 
 Generate embeddings for a roadmap using OpenAI's text-embedding-3-small model.
 Supports incremental updates: only regenerates embeddings for new/modified files.
 
 Arguments:
-    roadmap-id              The roadmap ID (e.g., electrician-bc)
+    roadmap-id              One or more roadmap IDs (e.g., electrician-bc)
+    --all                   Generate every roadmap in src/data/embeddings/
 
 Options:
-    --model MODEL           OpenAI embedding model (default: text-embedding-3-small)
+    --provider P            Embedding provider: openai, local (fastembed) or fake (default: openai)
+    --allow-non-openai      Let local/fake write to the served JSON indexes or Postgres (the app queries with OpenAI)
+    --model MODEL           Embedding model (default: text-embedding-3-small for openai)
+    --dimensions N          Shorten embeddings to N dimensions (text-embedding-3 models only)
     --setup                 Set up Python virtual environment and install dependencies
     --force-rebuild         Force full rebuild of all embeddings (skip incremental update)
     --dry-run               Show what would be changed without making changes
+    --user-id ID...         User IDs for user overlay indexes (Postgres only)
+    --user-ids-file FILE    File with one user ID per line (Postgres only)
+    --parallel-targets N    Roadmap/user targets generated concurrently (default: 1)
+    --cache-dir DIR         Chunk embedding cache directory (default: scripts/embeddings/.cache)
+    --no-cache              Embed every chunk through the API, bypassing the cache
+    --resume                Reuse the chunks embedded by an interrupted run (see .cache/journals/)
+    --checkpoint-every N    Embedding requests between checkpoint flushes (default: 8)
+    --concurrency N         Concurrent embedding requests (default: 4 for openai, one per CPU otherwise)
+    --batch-tokens N        Token budget per embedding request (default: 100000 for openai, 8192 otherwise)
+    --tpm N                 Tokens-per-minute limit, 0 to disable (default: 1000000 for openai, none otherwise)
+    --rpm N                 Requests-per-minute limit, 0 to disable (default: 3000 for openai, none otherwise)
+    --jobs N                Worker processes for parsing files, 0 for one per CPU (default: 1)
+    --index-strategy S      Postgres HNSW maintenance: inline, or deferred (drops the index every roadmap shares) (default: inline)
+    --vector-index-scope S  Rows the Postgres HNSW index covers: all or active (default: existing scope, else all)
+    --keep-versions N       Keep each target's active version and the N - 1 before it, deleting older ones
+    --gc-batch-rows N       Rows deleted per transaction when collecting old versions (default: 1000)
+    --gc-pause S            Seconds between deletion batches (default: 0.1)
+    --versions              List Postgres index versions with their rows and bytes instead of generating
+    --activate-version N    Make existing Postgres index version N active instead of generating (rollback)
+    --binary-store DTYPE    Also write vectors.npy + rows.json (float32, float16, int8 or binary)
+    --ann T                 ANN index next to the JSON index: ivf or none (default: previous, else ivf)
+    --ann-lists N           IVF lists, 0 for about sqrt(chunks) (default: previous, else 0)
+    --ann-probes N          Lists searched per query, 0 to tune for --ann-recall (default: previous, else 0)
+    --ann-recall R          Recall@10 the IVF probes are tuned for (default: previous, else 0.95)
+    --precision P           JSON binary store dtype / Postgres HNSW index precision: float32, float16, int8 or binary (default: float32)
+    --min-recall R          Fail if quantized recall@10 vs float32 is below R (default: 0, report only)
+    --window N              Files parsed, chunked and embedded per pipeline step (default: 16)
+    --chunk-tokens N        Target chunk size in tokens; chunks follow headings and PDF pages (default: 1024)
+    --dedup-threshold J     Jaccard similarity for near-duplicate chunks, e.g. 0.9 (default: 1.0, exact only)
+    --no-dedup              Embed duplicate chunks too
+    --report FILE           Write a JSON run report with per-stage timings and API statistics
+    --profile P             Also profile each stage: cprofile or tracemalloc (requires --report)
+    --watch                 Keep running and update roadmaps as their content files change
+    --poll                  With --watch, poll for changes instead of using inotify
+    --poll-interval S       Seconds between scans when polling (default: 1.0)
+    --debounce S            Seconds without changes before an update starts (default: 0.5)
     -h, --help              Show this help message
 
 Examples:
@@ -35,12 +76,18 @@ Examples:
     # Dry run to see what would change
     $(basename "$0") electrician-bc --dry-run
 
+    # Regenerate every roadmap, two at a time
+    $(basename "$0") --all --parallel-targets 2
+
+    # Update the index as content files are edited
+    $(basename "$0") electrician-bc --watch
+
     # Use a different OpenAI model
     $(basename "$0") electrician-bc --model text-embedding-3-large
 
 Requirements:
     - Python 3.8+
-    - OPENAI_API_KEY in .env file at project root
+    - OPENAI_API_KEY in .env file at project root (openai provider only)
     - Source files in src/data/embeddings/<roadmap-id>/ (*.md, *.pdf)
 
 Output:
@@ -101,8 +148,18 @@ if [ "$1" == "--setup" ]; then
     setup_venv
 fi
 
-ROADMAP_ID="$1"
-shift
+# Leading arguments up to the first option are roadmap IDs
+ROADMAP_IDS=()
+if [ "$1" == "--all" ]; then
+    shift
+    ROADMAP_ARGS=(--all)
+else
+    while [ $# -gt 0 ] && [[ "$1" != -* ]]; do
+        ROADMAP_IDS+=("$1")
+        shift
+    done
+    ROADMAP_ARGS=(--roadmap "${ROADMAP_IDS[@]}")
+fi
 
 # Check virtual environment exists
 check_venv
@@ -111,5 +168,5 @@ check_venv
 source "$VENV_DIR/bin/activate"
 
 # Run Python script with all remaining arguments
-echo "Generating embeddings for roadmap: $ROADMAP_ID"
-python "$PYTHON_SCRIPT" --roadmap "$ROADMAP_ID" "$@"
+echo "Generating embeddings for: ${ROADMAP_IDS[*]:-all roadmaps}"
+python "$PYTHON_SCRIPT" "${ROADMAP_ARGS[@]}" "$@"
@@ -0,0 +1,290 @@
+"""
+Version retention and garbage collection for Postgres indexes.
+
+Every full rebuild adds a version to embedding_indexes and leaves the rows of
+the versions it replaces in embedding_documents, where they keep growing the
+table, the HNSW graphs and vacuum work. With --keep-versions N, each target
+keeps its active version and the N - 1 versions before it; older inactive
+versions are deleted. Versions newer than the active one (a rebuild that is
+still loading, or one whose quantized recall check failed) are never
+collected, and neither are global versions that an active user overlay is
+based on. Inactive overlays cannot be served without their global version, so
+they are deleted along with it.
+
+Rows are deleted in batches of `batch_rows`, each in its own short
+transaction, with a pause between batches, so a large collection never holds
+long locks or floods the WAL, and autovacuum can keep up. The
+embedding_indexes row goes last, once its documents are gone. Every batch
+re-checks that the version is still inactive.
+
+version_report() lists a target's versions, add_version_sizes() their row
+counts and stored sizes (vector, text and metadata bytes, as TOASTed on disk),
+which are only totalled when versions are shown or some expire, and
+vector_index_sizes() the size of each HNSW index on embedding_documents.
+"""
+
+import time
+from typing import Any, Optional
+
+from postgres_session import transaction
+
+DEFAULT_GC_BATCH_ROWS = 1000
+DEFAULT_GC_PAUSE = 0.1
+
+
+def version_report(
+    conn,
+    roadmap_id: str,
+    user_id: Optional[str] = None,
+    sizes: bool = True,
+) -> list[dict[str, Any]]:
+    """Every version of a roadmap/user index, newest first, with its number of
+    active overlays and (with sizes=True) its rows and stored bytes."""
+    from psycopg2.extras import RealDictCursor
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(
+        """
+        SELECT i.id, i.version, i."isActive", i."createdAt", i."modelName",
+            i.dimensions, i."precision", i."baseIndexId",
+            (
+                SELECT COUNT(*) FROM embedding_indexes o
+                WHERE o."baseIndexId" = i.id AND o."isActive"
+            ) AS overlays
+        FROM embedding_indexes i
+        WHERE i."roadmapId" = %s AND i."userId" IS NOT DISTINCT FROM %s
+        ORDER BY i.version DESC
+        """,
+        (roadmap_id, user_id)
+    )
+    versions = [dict(row) for row in cursor.fetchall()]
+    cursor.close()
+    if sizes:
+        add_version_sizes(conn, versions)
+    return versions
+
+
+def add_version_sizes(conn, versions: list[dict[str, Any]]) -> None:
+    """Set the rows, vectorBytes and bytes of each version.
+
+    This reads every row of the versions, so it only runs when they are shown.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT d."indexId", COUNT(*),
+            SUM(pg_column_size(d.embedding)),
+            SUM(
+                pg_column_size(d.embedding) + pg_column_size(d.content)
+                + COALESCE(pg_column_size(d.metadata), 0)
+            )
+        FROM embedding_documents d
+        WHERE d."indexId" = ANY(%s)
+        GROUP BY d."indexId"
+        """,
+        ([v["id"] for v in versions],)
+    )
+    sizes = {index_id: (rows, vector_bytes, size) for index_id, rows, vector_bytes, size in cursor.fetchall()}
+    cursor.close()
+    for v in versions:
+        v["rows"], v["vectorBytes"], v["bytes"] = sizes.get(v["id"], (0, 0, 0))
+
+
+def vector_index_sizes(conn) -> list[tuple[str, int, bool]]:
+    """(name, bytes, valid) of each HNSW index on embedding_documents."""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT c.relname, pg_relation_size(c.oid), i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = 'embedding_documents'::regclass AND am.amname = 'hnsw'
+        ORDER BY c.relname
+        """
+    )
+    sizes = cursor.fetchall()
+    cursor.close()
+    return sizes
+
+
+def expired_versions(versions: list[dict[str, Any]], keep: int) -> list[dict[str, Any]]:
+    """Versions outside the retention window of `keep` versions.
+
+    The window is the active version and the keep - 1 versions before it;
+    without an active version nothing expires. Versions that active overlays
+    are based on are kept until those overlays are replaced.
+    """
+    active = [v["version"] for v in versions if v["isActive"]]
+    if not active:
+        return []
+    # Newest first, so the first keep - 1 are retained with the active version
+    older = [v for v in versions if v["version"] < max(active)]
+    return [v for v in older[keep - 1:] if not v["overlays"]]
+
+
+def format_megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.2f} MB"
+
+
+def print_version_report(
+    versions: list[dict[str, Any]],
+    expired: Optional[list[dict[str, Any]]] = None,
+) -> None:
+    expired_ids = {v["id"] for v in expired or []}
+    for v in versions:
+        status = "active" if v["isActive"] else ("expired" if v["id"] in expired_ids else "inactive")
+        created = v["createdAt"].strftime("%Y-%m-%d %H:%M") if v["createdAt"] else "-"
+        if v["baseIndexId"]:
+            sharing = f"  overlay on {v['baseIndexId']}"
+        elif v["overlays"]:
+            sharing = f"  base of {v['overlays']} active overlays"
+        else:
+            sharing = ""
+        print(
+            f"  v{v['version']:<4} {status:<8} {created}  {v['rows']:>8} rows  "
+            f"{format_megabytes(v['bytes']):>10} ({format_megabytes(v['vectorBytes'])} vectors)  "
+            f"{v['modelName']}/{v['dimensions']}/{v['precision']}{sharing}"
+        )
+    total_rows = sum(v["rows"] for v in versions)
+    total_bytes = sum(v["bytes"] for v in versions)
+    print(f"  {len(versions)} versions, {total_rows} rows, {format_megabytes(total_bytes)}")
+
+
+def delete_index_version(
+    pool,
+    index_id: str,
+    batch_rows: int = DEFAULT_GC_BATCH_ROWS,
+    pause: float = DEFAULT_GC_PAUSE,
+) -> int:
+    """Delete an inactive version's documents in throttled batches, then the
+    version itself.
+
+    Returns:
+        Number of embedding_documents rows deleted
+    """
+    deleted = 0
+    while True:
+        with transaction(pool) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                DELETE FROM embedding_documents
+                WHERE id IN (
+                    SELECT d.id FROM embedding_documents d
+                    WHERE d."indexId" = %s
+                        AND EXISTS (
+                            SELECT 1 FROM embedding_indexes i
+                            WHERE i.id = d."indexId" AND NOT i."isActive"
+                        )
+                    LIMIT %s
+                )
+                """,
+                (index_id, batch_rows)
+            )
+            batch = cursor.rowcount
+            cursor.close()
+        deleted += batch
+        if batch < batch_rows:
+            break
+        if pause > 0:
+            time.sleep(pause)
+
+    with transaction(pool) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'DELETE FROM embedding_indexes WHERE id = %s AND NOT "isActive"',
+            (index_id,)
+        )
+        cursor.close()
+    return deleted
+
+
+def inactive_overlay_ids(conn, base_index_id: str) -> list[str]:
+    """Ids of the inactive user overlays based on a global version."""
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT id FROM embedding_indexes WHERE "baseIndexId" = %s AND NOT "isActive"',
+        (base_index_id,)
+    )
+    overlay_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return overlay_ids
+
+
+def delete_inactive_overlays(
+    pool,
+    base_index_id: str,
+    batch_rows: int = DEFAULT_GC_BATCH_ROWS,
+    pause: float = DEFAULT_GC_PAUSE,
+) -> tuple[int, int]:
+    """Delete the inactive user overlays based on a global version, which
+    cannot be served once it is gone.
+
+    Returns:
+        (overlays deleted, rows deleted)
+    """
+    with transaction(pool) as conn:
+        overlay_ids = inactive_overlay_ids(conn, base_index_id)
+
+    rows = 0
+    for overlay_id in overlay_ids:
+        rows += delete_index_version(pool, overlay_id, batch_rows, pause)
+    return len(overlay_ids), rows
+
+
+def collect_index_versions(
+    pool,
+    roadmap_id: str,
+    user_id: Optional[str] = None,
+    keep: int = 1,
+    batch_rows: int = DEFAULT_GC_BATCH_ROWS,
+    pause: float = DEFAULT_GC_PAUSE,
+    dry_run: bool = False,
+    show: bool = False,
+) -> tuple[int, int]:
+    """Delete a target's versions outside its retention window.
+
+    The versions are listed when some expire, or always with show=True.
+
+    Returns:
+        (versions deleted, rows deleted); with dry_run, what would be deleted
+    """
+    with transaction(pool) as conn:
+        versions = version_report(conn, roadmap_id, user_id, sizes=False)
+        expired = expired_versions(versions, keep)
+        if expired or show:
+            add_version_sizes(conn, versions)
+
+    if expired or show:
+        print(f"\n--- Index versions (keeping {keep}) ---")
+        print_version_report(versions, expired)
+    if not expired:
+        print(f"✓ {len(versions)} index versions, none outside the {keep} kept")
+        return 0, 0
+
+    rows = sum(v["rows"] for v in expired)
+    size = format_megabytes(sum(v["bytes"] for v in expired))
+    if dry_run:
+        with transaction(pool) as conn:
+            overlays = sum(len(inactive_overlay_ids(conn, v["id"])) for v in expired)
+        overlay_note = f", and {overlays} inactive user overlays based on them" if overlays else ""
+        print(f"[DRY RUN] Would delete {len(expired)} versions ({rows} rows, {size}){overlay_note}")
+        return len(expired), rows
+
+    started = time.perf_counter()
+    deleted_rows = 0
+    for v in expired:
+        overlays, overlay_rows = delete_inactive_overlays(pool, v["id"], batch_rows, pause)
+        if overlays:
+            print(
+                f"  Deleted {overlays} inactive user overlays ({overlay_rows} rows) "
+                f"based on v{v['version']}"
+            )
+        deleted_rows += delete_index_version(pool, v["id"], batch_rows, pause)
+    elapsed = time.perf_counter() - started
+    print(
+        f"✓ Deleted {len(expired)} expired versions ({deleted_rows} rows, {size}) "
+        f"in {elapsed:.2f}s"
+    )
+    return len(expired), deleted_rows
@@ -0,0 +1,184 @@
+"""
+Single-pass markdown parsing for roadmap content files.
+
+The body is scanned once for structure with precompiled patterns. Every ATX
+heading (any title, any level) opens a section that carries its heading path,
+its text, its paragraphs and its bullet items, so nothing outside a fixed list
+of section names is dropped and cost grows with document size only. Fenced
+code blocks are kept whole: headings, bullets and blank lines inside them are
+plain text.
+
+Run as a script to benchmark the parser:
+
+    python markdown_parser.py ../../src/data/embeddings/*/*.md --synthetic-mb 1 4 16
+"""
+
+import argparse
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+import yaml
+
+FRONTMATTER_PATTERN = re.compile(r"^---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+
+# Lines that change the structure: ATX headings (groups 1-2) and code fences
+# (group 3). Matching from the newline lets the regex engine skip straight to
+# line starts, and greedy classes avoid backtracking over each title.
+STRUCTURE_PATTERN = re.compile(r"\n {0,3}(?:(#{1,6})[ \t]+([^\n]*\S)|(`{3,}|~{3,})[^\n]*)")
+CLOSING_HASHES_PATTERN = re.compile(r"[ \t]+#+$")
+PARAGRAPH_BREAK_PATTERN = re.compile(r"\n[ \t]*(?:\n[ \t]*)+")
+BULLET_PATTERN = re.compile(r"\n[ \t]*(?:[-*+]|\d+[.)])[ \t]+([^\n]*\S)")
+
+
+@dataclass
+class MarkdownSection:
+    """Text under one heading, up to the next heading of any level."""
+
+    level: int  # 0 for text before the first heading
+    path: tuple[str, ...]  # Heading titles from the top level down to this one
+    paragraphs: list[str] = field(default_factory=list)
+    bullets: list[str] = field(default_factory=list)
+
+    @property
+    def title(self) -> str:
+        return self.path[-1] if self.path else ""
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(self.paragraphs)
+
+
+def parse_frontmatter(content: str) -> tuple[dict[str, Any], str]:
+    """Parse YAML frontmatter from markdown content."""
+    match = FRONTMATTER_PATTERN.match(content)
+
+    if match:
+        frontmatter = yaml.safe_load(match.group(1)) or {}
+        return frontmatter, content[match.end() :]
+
+    return {}, content
+
+
+def iter_markdown_sections(content: str) -> Iterator[MarkdownSection]:
+    """Yield the sections of a markdown body in document order.
+
+    One scan finds the heading and fence lines; the text between them is
+    split into paragraphs and bullets once, so every character is visited a
+    constant number of times however many sections there are.
+    """
+    # Every line, the first included, starts after a newline
+    content = "\n" + content
+    path: list[tuple[int, str]] = []
+    section = MarkdownSection(0, ())
+    position = 0
+    fence, fence_start = "", 0
+
+    def add_text(text: str) -> None:
+        section.paragraphs.extend(
+            paragraph.strip()
+            for paragraph in PARAGRAPH_BREAK_PATTERN.split(text)
+            if paragraph.strip()
+        )
+        section.bullets.extend(BULLET_PATTERN.findall(text))
+
+    for match in STRUCTURE_PATTERN.finditer(content):
+        marker = match.group(3)
+        if fence:
+            # Only a matching fence at least as long closes the block
+            if marker and marker[0] == fence[0] and len(marker) >= len(fence):
+                section.paragraphs.append(content[fence_start : match.end()].strip())
+                fence, position = "", match.end()
+            continue
+
+        add_text(content[position : match.start()])
+        position = match.end()
+        if marker:
+            fence, fence_start = marker, match.start()
+            continue
+
+        if section.level or section.paragraphs:
+            yield section
+        level, title = len(match.group(1)), match.group(2)
+        if title.endswith("#"):
+            title = CLOSING_HASHES_PATTERN.sub("", title)
+        while path and path[-1][0] >= level:
+            path.pop()
+        path.append((level, title))
+        section = MarkdownSection(level, tuple(title for _, title in path))
+
+    if fence:
+        section.paragraphs.append(content[fence_start:].strip())
+    else:
+        add_text(content[position:])
+    if section.level or section.paragraphs:
+        yield section
+
+
+def split_markdown_sections(content: str) -> list[MarkdownSection]:
+    """Split markdown into sections along its heading hierarchy."""
+    return list(iter_markdown_sections(content))
+
+
+def synthetic_markdown(size_mb: float) -> str:
+    """A roadmap-like document of roughly size_mb, with nested headings and lists.
+
+    Sections average about 1 KB, like the roadmap reference files.
+    """
+    paragraph = (
+        "Most institutions require Grade 11 Math with a minimum C grade, accepting "
+        "various streams including Foundations of Math 11 or Pre-Calculus 11. Mature "
+        "students may gain admission with some deficiencies in formal education.\n\n"
+    )
+    block = (
+        "## Entry requirements\n\n"
+        + paragraph * 3
+        + "### Documents\n\n"
+        "- Proof of age\n- Transcripts\n* Safety boots and glasses\n1. Apply online\n\n"
+        + paragraph
+        + "```\n# not a heading\n- not a bullet\n```\n\n"
+    )
+    repeat = max(1, int(size_mb * 1024 * 1024 / len(block)))
+    return "# Synthetic roadmap\n\n" + block * repeat
+
+
+def benchmark(name: str, content: str, repeat: int) -> None:
+    """Print the best-of-`repeat` time and throughput of parsing content."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, body = parse_frontmatter(content)
+        sections = split_markdown_sections(body)
+        best = min(best, time.perf_counter() - started)
+
+    size_mb = len(content.encode("utf-8")) / 1024 / 1024
+    bullets = sum(len(s.bullets) for s in sections)
+    print(
+        f"{name}: {size_mb * 1024:,.0f} KB, {len(sections)} sections, {bullets} bullets, "
+        f"{best * 1000:.2f} ms ({size_mb / best:,.1f} MB/s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the markdown section parser")
+    parser.add_argument("files", nargs="*", type=Path, help="Markdown files to parse")
+    parser.add_argument(
+        "--synthetic-mb",
+        type=float,
+        nargs="*",
+        default=[],
+        help="Also parse generated documents of these sizes in MB",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per input, best is reported (default: 5)")
+    args = parser.parse_args()
+
+    for path in args.files:
+        benchmark(path.name, path.read_text(encoding="utf-8"), args.repeat)
+    for size_mb in args.synthetic_mb:
+        benchmark(f"synthetic-{size_mb:g}mb", synthetic_markdown(size_mb), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
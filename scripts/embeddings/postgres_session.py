@@ -0,0 +1,60 @@
+"""
+Pooled Postgres connections for one generate.py run.
+
+Every Postgres step of a run borrows a connection from one pool, so managed
+Postgres only pays the TLS and auth handshake once per pooled connection
+instead of once per step. Transactions are owned by the caller: helpers in
+generate.py take a connection and never commit themselves.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+def get_database_url() -> str:
+    """Return DATABASE_URL from the environment."""
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError(
+            "DATABASE_URL not found in environment. "
+            "Please add it to .env file at project root."
+        )
+    return database_url
+
+
+def create_pool(database_url: str, max_connections: int = 4):
+    """Create a thread-safe pool that opens connections lazily."""
+    from psycopg2.pool import ThreadedConnectionPool
+
+    return ThreadedConnectionPool(0, max_connections, database_url)
+
+
+@contextmanager
+def transaction(pool) -> Iterator:
+    """Borrow a connection and run one transaction on it.
+
+    Commits when the block exits normally and rolls back if it raises.
+    """
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+@contextmanager
+def autocommit(pool) -> Iterator:
+    """Borrow a connection in autocommit mode, for statements such as
+    CREATE INDEX CONCURRENTLY that cannot run inside a transaction block."""
+    conn = pool.getconn()
+    conn.autocommit = True
+    try:
+        yield conn
+    finally:
+        conn.autocommit = False
+        pool.putconn(conn)
@@ -0,0 +1,138 @@
+"""
+Quantized embedding precisions and recall verification.
+
+The JSON binary store can hold embeddings below float32 precision, and
+Postgres can index them below it (its rows keep float32 vectors):
+
+- float16: half precision, 2x smaller
+- int8: symmetric per-vector scaling to [-127, 127], 4x smaller (file store only;
+  pgvector has no int8 vector type)
+- binary: one sign bit per dimension, 32x smaller, compared by Hamming distance
+
+Cosine ranking is unaffected by a positive per-vector scale, so int8 rows are
+searched as-is without storing their scales.
+
+recall_at_k() measures how much of the exact float32 top-k a precision keeps,
+using the roadmap's own chunks as queries, so a quantized index can be checked
+against full precision before it is activated.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8", "binary")
+
+# pgvector stores and indexes these; int8 is only available in the file store
+POSTGRES_PRECISIONS = ("float32", "float16", "binary")
+
+# Binary candidates fetched per result before re-ranking at full precision
+BINARY_RERANK_FACTOR = 4
+
+DEFAULT_RECALL_K = 10
+DEFAULT_RECALL_QUERIES = 200
+
+
+def quantize(vectors: np.ndarray, precision: str) -> np.ndarray:
+    """Convert a float matrix to the storage representation of `precision`.
+
+    Binary rows are packed 8 dimensions per byte (most significant bit first),
+    matching numpy.packbits and pgvector's binary_quantize().
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    if precision == "float32":
+        return vectors
+    if precision == "float16":
+        return vectors.astype(np.float16)
+    if precision == "int8":
+        scale = np.abs(vectors).max(axis=1, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+        return np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    if precision == "binary":
+        return np.packbits(vectors > 0, axis=1)
+
+    raise ValueError(f"Unsupported precision: {precision}")
+
+
+def cosine_scores(matrix: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every query (rows) against every matrix row (columns)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    matrix_norms = np.linalg.norm(matrix, axis=1)
+    query_norms = np.linalg.norm(queries, axis=1)
+    matrix_norms[matrix_norms == 0] = 1.0
+    query_norms[query_norms == 0] = 1.0
+    return (queries @ matrix.T) / query_norms[:, None] / matrix_norms[None, :]
+
+
+def sign_scores(packed: np.ndarray, queries: np.ndarray, dimensions: int) -> np.ndarray:
+    """Similarity of packed sign bits, 1 - 2 * hamming / dimensions."""
+    rows = np.unpackbits(packed, axis=1)[:, :dimensions].astype(np.float32) * 2 - 1
+    query_bits = np.where(np.asarray(queries) > 0, 1.0, -1.0).astype(np.float32)
+    return (query_bits @ rows.T) / dimensions
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of each row's k highest scores, best first."""
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, candidates, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def recall_at_k(
+    vectors: np.ndarray,
+    precision: str,
+    k: int = DEFAULT_RECALL_K,
+    sample: int = DEFAULT_RECALL_QUERIES,
+    rerank: bool = False,
+    seed: int = 0,
+) -> Optional[float]:
+    """Fraction of the exact float32 top-k that `precision` returns.
+
+    Up to `sample` stored vectors are used as queries; each query's own row is
+    excluded from both rankings. With rerank=True, binary search fetches
+    k * BINARY_RERANK_FACTOR candidates and re-ranks them at full precision,
+    as the Postgres query does.
+
+    Returns:
+        Mean recall in [0, 1], or None when there are too few vectors
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    count = len(vectors)
+    if count < 2:
+        return None
+    k = min(k, count - 1)
+
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(count, size=min(sample, count), replace=False)
+    queries = vectors[query_rows]
+    own_row = (np.arange(len(query_rows)), query_rows)
+
+    exact = cosine_scores(vectors, queries)
+    exact[own_row] = -np.inf
+    expected = top_k(exact, k)
+
+    stored = quantize(vectors, precision)
+    if precision == "binary":
+        approximate = sign_scores(stored, queries, vectors.shape[1])
+    elif precision == "float16":
+        approximate = cosine_scores(stored, queries.astype(np.float16))
+    else:
+        approximate = cosine_scores(stored, queries)
+    approximate[own_row] = -np.inf
+
+    if precision == "binary" and rerank:
+        candidates = top_k(approximate, k * BINARY_RERANK_FACTOR)
+        reranked = np.take_along_axis(exact, candidates, axis=1)
+        order = reranked.argsort(axis=1)[:, ::-1][:, :k]
+        found = np.take_along_axis(candidates, order, axis=1)
+    else:
+        found = top_k(approximate, k)
+
+    hits = sum(
+        len(set(expected_row) & set(found_row))
+        for expected_row, found_row in zip(expected.tolist(), found.tolist())
+    )
+    return hits / (len(query_rows) * k)
@@ -0,0 +1,161 @@
+"""
+Append-only checkpoint journal of embedded chunks, for resuming failed runs.
+
+Each target records the chunks it embeds in
+`<cache-dir>/journals/<roadmap-id>.journal` (`<roadmap-id>--<user-id>.journal`
+for user indexes) as each embedding request completes. The file is a JSON
+header line naming the model and dimensions, followed by fixed-size records:
+the SHA-256 digest of the chunk text, then its float32 vector. Records are
+flushed to disk every `checkpoint_every` requests and at the end of each
+window, so a crash or eviction loses at most that many requests. A torn record
+at the end of the file is dropped when it is read back.
+
+With --resume, an interrupted target's journal is loaded and its vectors are
+used instead of embedding those chunks again. Unlike the chunk embedding cache,
+which is written once per window, the journal keeps progress within a window,
+and it is also written with --no-cache. It is deleted once the target
+completes.
+"""
+
+import hashlib
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Optional, Sequence
+
+JOURNAL_VERSION = 1
+DEFAULT_CHECKPOINT_EVERY = 8
+
+DIGEST_SIZE = 32
+
+
+def journal_path(cache_dir: Path, roadmap_id: str, user_id: Optional[str] = None) -> Path:
+    """Location of a target's journal inside the cache directory."""
+    name = roadmap_id if user_id is None else f"{roadmap_id}--{user_id}"
+    return cache_dir / "journals" / f"{name}.journal"
+
+
+def digest_text(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class RunJournal:
+    """Checkpointed chunk embeddings of one target's run.
+
+    The file is only created once the first request completes, so runs with
+    nothing to embed leave no journal behind.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        model_name: str,
+        dimensions: int,
+        resume: bool = False,
+        checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    ):
+        self.path = path
+        self.header = {"version": JOURNAL_VERSION, "model": model_name, "dimensions": dimensions}
+        self.record_size = DIGEST_SIZE + 4 * dimensions
+        self.checkpoint_every = max(1, checkpoint_every)
+        # Vectors of an interrupted run, by chunk text digest
+        self.vectors: dict[bytes, bytes] = {}
+        self.resumed = 0
+        self.recorded = 0
+
+        self._file = None
+        self._unflushed = 0
+        # Byte length of the valid journal to append to, when resuming
+        self._valid_size: Optional[int] = None
+
+        if resume:
+            self._load()
+        elif path.exists():
+            print(f"  Discarding the checkpoint of an earlier run ({path.name}); use --resume to reuse it")
+
+    def __len__(self) -> int:
+        return len(self.vectors) + self.recorded
+
+    def _load(self) -> None:
+        try:
+            with self.path.open("rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+                header_size = f.tell() - len(body)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            print(f"  Ignoring unreadable checkpoint {self.path.name}")
+            return
+
+        if header != self.header:
+            print(
+                f"  Ignoring checkpoint {self.path.name}: it was written for "
+                f"{header.get('model')} ({header.get('dimensions')} dimensions)"
+            )
+            return
+
+        count = len(body) // self.record_size
+        for start in range(0, count * self.record_size, self.record_size):
+            self.vectors[body[start : start + DIGEST_SIZE]] = body[
+                start + DIGEST_SIZE : start + self.record_size
+            ]
+        self._valid_size = header_size + count * self.record_size
+        print(f"  Resuming from checkpoint {self.path.name}: {len(self.vectors)} embedded chunks")
+
+    def get_many(self, texts: Sequence[str]) -> list[Optional[list[float]]]:
+        """Vectors of texts embedded by the interrupted run, None for the others."""
+        results: list[Optional[list[float]]] = []
+        for text in texts:
+            blob = self.vectors.get(digest_text(text)) if self.vectors else None
+            if blob is None:
+                results.append(None)
+                continue
+            vector = array("f")
+            vector.frombytes(blob)
+            results.append(vector.tolist())
+        self.resumed += sum(1 for vector in results if vector is not None)
+        return results
+
+    def append(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Record one completed request; flushed every `checkpoint_every` calls."""
+        if self._file is None:
+            self._open()
+        for text, vector in zip(texts, vectors):
+            self._file.write(digest_text(text) + array("f", vector).tobytes())
+        self.recorded += len(texts)
+        self._unflushed += 1
+        if self._unflushed >= self.checkpoint_every:
+            self.flush()
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self._valid_size is not None:
+            self._file = self.path.open("r+b")
+            # Drop a record torn by the crash before appending
+            self._file.truncate(self._valid_size)
+            self._file.seek(self._valid_size)
+        else:
+            self._file = self.path.open("wb")
+            self._file.write(json.dumps(self.header).encode("utf-8") + b"\n")
+
+    def flush(self) -> None:
+        """Make every recorded request durable."""
+        if self._file is not None and self._unflushed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unflushed = 0
+
+    def close(self) -> None:
+        """Flush and close, keeping the journal for a later --resume."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def complete(self) -> None:
+        """Delete the journal once the target's index has been written."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.vectors.clear()
@@ -0,0 +1,212 @@
+"""
+Per-stage profiling and the machine-readable run report.
+
+Each roadmap/user target gets a StageRecorder that accumulates wall time, CPU
+time, rows and peak RSS per pipeline stage (discover, hash, pdf_extract,
+markdown_parse, chunk, embed, persist, copy, count_update, index_build, gc).
+Stages of the streaming pipeline run once per window, so a stage's figures are
+the sum over all of its calls.
+
+CPU time is the calling thread's, so concurrent targets do not count each
+other's work. Parse stages report the CPU time of the worker that parsed the
+file. Embedding requests wait in the engine's own threads, so the embed stage
+is mostly wall time; request counts, tokens, retries and latencies come from
+the engine itself. Peak RSS is the process high-water mark when a stage last
+finished (parse workers are not included).
+
+With a profiler, every call of a stage is also profiled: "cprofile" writes one
+.prof file per target and stage, and "tracemalloc" adds the peak traced Python
+allocation to the stage. Profilers are process-wide, so they are only
+meaningful with one target running at a time.
+"""
+
+import cProfile
+import json
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+PROFILERS = ("cprofile", "tracemalloc")
+
+# Upper bounds (seconds) of the embedding request latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def peak_rss_mb() -> float:
+    """The process's peak resident set size so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def latency_summary(latencies: list[float]) -> dict[str, Any]:
+    """Count, percentiles and a cumulative histogram of latencies in seconds."""
+    if not latencies:
+        return {"count": 0}
+
+    values = np.asarray(latencies)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    histogram = {f"le{bound:g}": int((values <= bound).sum()) for bound in LATENCY_BUCKETS}
+    histogram["inf"] = len(values)
+    return {
+        "count": len(values),
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(values.max()), 4),
+        "histogram": histogram,
+    }
+
+
+class StageRecorder:
+    """Stage timings for one roadmap/user target."""
+
+    def __init__(
+        self,
+        label: str = "",
+        profiler: Optional[str] = None,
+        profile_dir: Optional[Path] = None,
+    ):
+        self.label = label
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.error: Optional[str] = None
+        self.stages: dict[str, dict[str, Any]] = {}
+        self._profiles: dict[str, cProfile.Profile] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, wall: float, cpu: float, rows: int = 0, **extra: float) -> None:
+        """Add one call of a stage measured elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            stage = self.stages.setdefault(
+                name, {"calls": 0, "wallSeconds": 0.0, "cpuSeconds": 0.0, "rows": 0}
+            )
+            stage["calls"] += 1
+            stage["wallSeconds"] += wall
+            stage["cpuSeconds"] += cpu
+            stage["rows"] += rows
+            stage["peakRssMb"] = round(peak_rss_mb(), 1)
+            for key, value in extra.items():
+                stage[key] = max(stage.get(key, 0.0), value)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict[str, int]]:
+        """Time a block as one call of `name`.
+
+        Yields a dict whose "rows" entry the block can set to the number of
+        rows (files, chunks or database rows) it processed.
+        """
+        counters = {"rows": 0}
+        profile = None
+        if self.profiler == "cprofile":
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+        elif self.profiler == "tracemalloc":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield counters
+        finally:
+            wall = time.perf_counter() - wall_started
+            cpu = time.thread_time() - cpu_started
+            extra = {}
+            if profile is not None:
+                profile.disable()
+            elif self.profiler == "tracemalloc":
+                extra["tracedPeakMb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            self.record(name, wall, cpu, counters["rows"], **extra)
+
+    def dump_profiles(self) -> list[Path]:
+        """Write each stage's cProfile stats to profile_dir, for pstats or snakeviz."""
+        if not self._profiles or self.profile_dir is None:
+            return []
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        safe_label = self.label.replace("/", "_").replace(" ", "_")
+        paths = []
+        for name, profile in self._profiles.items():
+            path = self.profile_dir / f"{safe_label}.{name}.prof"
+            profile.dump_stats(str(path))
+            paths.append(path)
+        return paths
+
+    def to_dict(self) -> dict[str, Any]:
+        stages = {}
+        for name, stage in self.stages.items():
+            wall = stage["wallSeconds"]
+            stages[name] = {
+                **stage,
+                "wallSeconds": round(wall, 4),
+                "cpuSeconds": round(stage["cpuSeconds"], 4),
+                "rowsPerSecond": round(stage["rows"] / wall, 1) if wall > 0 else None,
+            }
+            if "tracedPeakMb" in stage:
+                stages[name]["tracedPeakMb"] = round(stage["tracedPeakMb"], 1)
+
+        report = {"target": self.label, "status": "failed" if self.error else "ok", "stages": stages}
+        if self.error:
+            report["error"] = self.error
+        return report
+
+
+class RunReport:
+    """Collects every target's stages plus run-wide embedding statistics."""
+
+    def __init__(self, profiler: Optional[str] = None, profile_dir: Optional[Path] = None):
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._targets: list[StageRecorder] = []
+        self._lock = threading.Lock()
+
+    def target(self, label: str) -> StageRecorder:
+        """Create and register the recorder for one target."""
+        recorder = StageRecorder(label, self.profiler, self.profile_dir)
+        with self._lock:
+            self._targets.append(recorder)
+        return recorder
+
+    def to_dict(self, settings: dict[str, Any], engine=None, cache=None) -> dict[str, Any]:
+        report = {
+            "startedAt": self.started_at.isoformat(),
+            "finishedAt": datetime.now(timezone.utc).isoformat(),
+            "wallSeconds": round(time.perf_counter() - self._started, 3),
+            "peakRssMb": round(peak_rss_mb(), 1),
+            "command": sys.argv,
+            "settings": settings,
+            "targets": [recorder.to_dict() for recorder in self._targets],
+        }
+        if engine is not None:
+            report["embedding"] = {
+                "requests": engine.requests,
+                "tokens": engine.tokens,
+                "retries": engine.retries,
+                "latencySeconds": latency_summary(engine.latencies),
+            }
+        if cache is not None:
+            report["cache"] = {"hits": cache.hits, "misses": cache.misses}
+        return report
+
+    def write(self, path: Path, settings: dict[str, Any], engine=None, cache=None) -> None:
+        """Write the JSON report, plus any cProfile stats, and say where they went."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(self.to_dict(settings, engine, cache), f, indent=2)
+        print(f"Run report: {path}")
+
+        for recorder in self._targets:
+            for profile_path in recorder.dump_profiles():
+                print(f"  Profile: {profile_path}")
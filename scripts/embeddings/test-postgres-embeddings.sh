@@ -153,13 +153,7 @@ SELECT
   'embedding_indexes' as table_name,
   pg_size_pretty(pg_total_relation_size('embedding_indexes')) as total_size,
   pg_size_pretty(pg_relation_size('embedding_indexes')) as table_size,
-  pg_size_pretty(pg_indexes_size('embedding_indexes')) as indexes_size
-UNION ALL
-SELECT
-  'data_llamaindex_embeddings' as table_name,
-  pg_size_pretty(pg_total_relation_size('data_llamaindex_embeddings')) as total_size,
-  pg_size_pretty(pg_relation_size('data_llamaindex_embeddings')) as table_size,
-  pg_size_pretty(pg_indexes_size('data_llamaindex_embeddings')) as indexes_size;
+  pg_size_pretty(pg_indexes_size('embedding_indexes')) as indexes_size;
 "
 
 echo ""
@@ -0,0 +1,63 @@
+"""
+Tests for chunk deduplication bookkeeping.
+
+Run from the repository root:
+    python -m unittest discover -s scripts/embeddings -p "test_*.py"
+"""
+
+import unittest
+
+from chunk_dedup import ChunkDeduplicator, duplicate_dependents
+
+
+def duplicates_by_file(records: dict[str, list[str]]):
+    """(representative's file, duplicate records) pairs, as stored in chunk metadata."""
+    return [
+        (file_name, [{"file_name": duplicate} for duplicate in duplicates])
+        for file_name, duplicates in records.items()
+    ]
+
+
+class DuplicateDependentsTest(unittest.TestCase):
+    def test_direct_dependents(self):
+        records = duplicates_by_file({"a.md": ["b.md"], "c.md": ["d.md"]})
+        self.assertEqual(duplicate_dependents(records, {"a.md"}), {"b.md"})
+
+    def test_removed_files_are_not_dependents(self):
+        records = duplicates_by_file({"a.md": ["b.md"], "b.md": ["a.md"]})
+        self.assertEqual(duplicate_dependents(records, {"a.md", "b.md"}), set())
+
+    def test_chain_of_dependents(self):
+        # a.md has X; d.md has X and Y; e.md has Y. d.md's X is a duplicate
+        # of a.md's, and e.md's Y a duplicate of d.md's. Re-processing d.md
+        # for a.md re-embeds its Y and drops e.md's record, so e.md must be
+        # re-processed too.
+        dedup = ChunkDeduplicator(threshold=1.0)
+        chunks = [
+            ("a-0", "a.md", "chunk x"),
+            ("d-0", "d.md", "chunk x"),
+            ("d-1", "d.md", "chunk y"),
+            ("e-0", "e.md", "chunk y"),
+        ]
+        file_names = {chunk_id: file_name for chunk_id, file_name, _ in chunks}
+        records: dict[str, list[str]] = {}
+        for chunk_id, file_name, text in chunks:
+            representative = dedup.add(chunk_id, text)
+            if representative is not None:
+                records.setdefault(file_names[representative], []).append(file_name)
+        self.assertEqual(records, {"a.md": ["d.md"], "d.md": ["e.md"]})
+
+        dependents = duplicate_dependents(duplicates_by_file(records), {"a.md"})
+        self.assertEqual(dependents, {"d.md", "e.md"})
+
+    def test_cycle_terminates(self):
+        records = duplicates_by_file({"a.md": ["b.md"], "b.md": ["c.md"], "c.md": ["b.md"]})
+        self.assertEqual(duplicate_dependents(records, {"a.md"}), {"b.md", "c.md"})
+
+    def test_records_without_file_names_are_ignored(self):
+        records = [(None, [{"file_name": "b.md"}]), ("a.md", [{"id": "b-0"}])]
+        self.assertEqual(duplicate_dependents(records, {"a.md"}), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
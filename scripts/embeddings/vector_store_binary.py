@@ -0,0 +1,107 @@
+"""
+Binary, memory-mappable vector store for the JSON backend.
+
+Embeddings are written as one contiguous row-major `.npy` matrix (float32,
+float16, int8 or packed sign bits; see quantization.py) next to
+`metadata.json`, with a compact `rows.json` sidecar holding the dtype, the
+unpacked width and each matrix row's node id. Readers can memory-map the
+matrix instead of parsing a JSON array per vector, so load time and RSS stay
+flat as roadmaps grow.
+
+The LlamaIndex JSON files are still written alongside, since incremental
+updates load the index from them. A row's text and metadata are read from
+its node in `docstore.json` when a search returns it, rather than being
+copied into the sidecar.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+
+from quantization import PRECISIONS, quantize
+
+VECTORS_FILE = "vectors.npy"
+ROWS_FILE = "rows.json"
+BINARY_STORE_DTYPES = PRECISIONS
+
+
+def _replace_atomically(path: Path, write) -> None:
+    """Write to a temporary file and rename it, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_binary_store(
+    persist_dir: Path,
+    vectors: Sequence[Sequence[float]],
+    ids: list[str],
+    dtype: str = "float32",
+) -> int:
+    """Write the vector matrix and its row sidecar to persist_dir.
+
+    `ids[i]` is the docstore node id of `vectors[i]`. For dtype "binary" the
+    matrix holds packed bits, and the sidecar's `dimensions` is the unpacked
+    width. Returns the number of bytes written.
+    """
+    if dtype not in BINARY_STORE_DTYPES:
+        raise ValueError(f"Unsupported binary store dtype: {dtype}")
+    if len(vectors) != len(ids):
+        raise ValueError(f"Got {len(vectors)} vectors for {len(ids)} rows")
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(ids), -1)
+    dimensions = matrix.shape[1]
+    matrix = np.ascontiguousarray(quantize(matrix, dtype))
+
+    sidecar = {
+        "dtype": dtype,
+        "count": matrix.shape[0],
+        "dimensions": dimensions,
+        "ids": ids,
+    }
+    sidecar_bytes = json.dumps(sidecar, separators=(",", ":")).encode("utf-8")
+
+    vectors_path = persist_dir / VECTORS_FILE
+    rows_path = persist_dir / ROWS_FILE
+    _replace_atomically(vectors_path, lambda f: np.save(f, matrix, allow_pickle=False))
+    _replace_atomically(rows_path, lambda f: f.write(sidecar_bytes))
+
+    return vectors_path.stat().st_size + rows_path.stat().st_size
+
+
+def remove_binary_store(persist_dir: Path) -> None:
+    """Delete a previously written binary store so it cannot go stale."""
+    for name in (VECTORS_FILE, ROWS_FILE):
+        (persist_dir / name).unlink(missing_ok=True)
+
+
+def load_binary_store(persist_dir: Path) -> tuple[np.ndarray, dict[str, Any]]:
+    """Memory-map the vector matrix and load its row sidecar.
+
+    The returned matrix is read-only and backed by the file, so only the pages
+    a query touches are read into memory.
+    """
+    matrix = np.load(persist_dir / VECTORS_FILE, mmap_mode="r", allow_pickle=False)
+    with (persist_dir / ROWS_FILE).open("r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    return matrix, sidecar
+
+
+def has_current_binary_store(persist_dir: Path) -> bool:
+    """Whether persist_dir has a binary store with an id-only sidecar.
+
+    Sidecars written before that format carry every row's text and metadata,
+    and are rewritten.
+    """
+    try:
+        with (persist_dir / ROWS_FILE).open("r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    return "ids" in sidecar and (persist_dir / VECTORS_FILE).exists()
@@ -0,0 +1,194 @@
+"""
+Content directory watching for `generate.py --watch`.
+
+Each target's content directory is watched for markdown and PDF changes:
+src/data/embeddings/<roadmap-id>/ for a roadmap's global index, and
+src/data/embeddings/<roadmap-id>/users/<user-id>/ for a user's overlay.
+On Linux the watcher uses inotify directly through libc, so a save is noticed
+immediately without extra dependencies; elsewhere, when the inotify watch
+limit is reached, when a directory does not exist yet, or with --poll, it
+falls back to comparing stat signatures every poll interval.
+
+Editors save in bursts (temporary file, rename, chmod), and authors save
+repeatedly, so changes are debounced: a batch of changed targets is only
+handed out once no event has arrived for the debounce interval. Only the
+top level of each directory is watched, so writes to a roadmap's index/ and
+users/ subdirectories do not wake its global target.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Hashable, Iterator, Optional
+
+from file_manifest import stat_signature
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_POLL_INTERVAL = 1.0
+
+CONTENT_SUFFIXES = (".md", ".pdf")
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_content_file(name: str) -> bool:
+    return name.endswith(CONTENT_SUFFIXES) and not name.startswith(".")
+
+
+class ContentWatcher(ABC):
+    """Reports which targets' content changed, in debounced batches."""
+
+    def __init__(self, directories: dict[Hashable, Path]):
+        # target -> content directory
+        self.directories = directories
+
+    @abstractmethod
+    def wait(self, timeout: Optional[float]) -> set[Hashable]:
+        """Block up to `timeout` seconds (forever if None) for changes.
+
+        Returns the targets that changed, or an empty set on timeout.
+        """
+
+    def close(self) -> None:
+        pass
+
+    def batches(self, debounce: float = DEFAULT_DEBOUNCE) -> Iterator[set[Hashable]]:
+        """Yield sets of changed targets once changes have settled."""
+        pending: set[Hashable] = set()
+        while True:
+            changed = self.wait(debounce if pending else None)
+            if changed:
+                pending |= changed
+            elif pending:
+                yield pending
+                pending = set()
+
+
+class InotifyWatcher(ContentWatcher):
+    """Watches content directories with Linux inotify."""
+
+    def __init__(self, directories: dict[Hashable, Path]):
+        super().__init__(directories)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # A directory that does not exist yet (a user without content of
+        # their own) cannot be watched; create_watcher then polls instead
+        self.targets: dict[int, Hashable] = {}
+        try:
+            for target, directory in directories.items():
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, f"Cannot watch {directory}: {os.strerror(errno)}")
+                self.targets[wd] = target
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def wait(self, timeout: Optional[float]) -> set[Hashable]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length]
+            name = os.fsdecode(name.rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: re-check everything
+                changed.update(self.directories)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                print(f"  Warning: stopped watching {self.directories.get(self.targets.get(wd))}")
+            elif wd in self.targets and is_content_file(name):
+                changed.add(self.targets[wd])
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(ContentWatcher):
+    """Watches content directories by comparing stat signatures periodically."""
+
+    def __init__(self, directories: dict[Hashable, Path], interval: float = DEFAULT_POLL_INTERVAL):
+        super().__init__(directories)
+        self.interval = interval
+        self.snapshots = {target: self._snapshot(d) for target, d in directories.items()}
+
+    @staticmethod
+    def _snapshot(directory: Path) -> dict[str, dict[str, int]]:
+        snapshot = {}
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return {}
+        for entry in entries:
+            if entry.is_file() and is_content_file(entry.name):
+                try:
+                    snapshot[entry.name] = stat_signature(entry.stat())
+                except FileNotFoundError:
+                    continue
+        return snapshot
+
+    def wait(self, timeout: Optional[float]) -> set[Hashable]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            sleep = self.interval
+            if deadline is not None:
+                sleep = max(0.0, min(sleep, deadline - time.monotonic()))
+            time.sleep(sleep)
+
+            changed = set()
+            for target, directory in self.directories.items():
+                snapshot = self._snapshot(directory)
+                if snapshot != self.snapshots[target]:
+                    self.snapshots[target] = snapshot
+                    changed.add(target)
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+def create_watcher(
+    directories: dict[Hashable, Path],
+    poll: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> ContentWatcher:
+    """Create an inotify watcher, or a polling one when inotify is unavailable."""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {poll_interval}s")
+    return PollingWatcher(directories, poll_interval)
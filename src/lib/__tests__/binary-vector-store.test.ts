@@ -0,0 +1,191 @@
+import { describe, it, expect } from "vitest";
+import {
+  createBinaryVectorStore,
+  float16ToFloat32,
+  parseDocstoreRows,
+  parseNpy,
+  searchBinaryVectorStore,
+} from "../binary-vector-store";
+
+function buildNpy(
+  descr: "<f4" | "<f2" | "|i1" | "|u1",
+  shape: [number, number],
+  values: number[],
+): Buffer {
+  let header = `{'descr': '${descr}', 'fortran_order': False, 'shape': (${shape[0]}, ${shape[1]}), }`;
+  // numpy pads the header with spaces so the data starts on a 64-byte boundary
+  const unpadded = 10 + header.length + 1;
+  header = header.padEnd(header.length + ((64 - (unpadded % 64)) % 64)) + "\n";
+
+  const preamble = Buffer.alloc(10);
+  preamble.write("\x93NUMPY", 0, "latin1");
+  preamble.writeUInt8(1, 6);
+  preamble.writeUInt8(0, 7);
+  preamble.writeUInt16LE(header.length, 8);
+
+  let data: Buffer;
+  if (descr === "<f4") {
+    data = Buffer.from(new Float32Array(values).buffer);
+  } else if (descr === "|i1") {
+    data = Buffer.from(new Int8Array(values).buffer);
+  } else if (descr === "|u1") {
+    data = Buffer.from(new Uint8Array(values).buffer);
+  } else {
+    // Only exact small values are used in tests: encode via known bit patterns
+    const halves = values.map((value) => {
+      if (value === 0) return 0;
+      const sign = value < 0 ? 0x8000 : 0;
+      const exponent = Math.floor(Math.log2(Math.abs(value)));
+      const fraction = Math.abs(value) / 2 ** exponent - 1;
+      return sign | ((exponent + 15) << 10) | Math.round(fraction * 1024);
+    });
+    data = Buffer.from(new Uint16Array(halves).buffer);
+  }
+
+  return Buffer.concat([preamble, Buffer.from(header, "latin1"), data]);
+}
+
+describe("Binary vector store", () => {
+  describe("parseNpy", () => {
+    it("should parse a float32 matrix", () => {
+      const matrix = parseNpy(buildNpy("<f4", [2, 3], [1, 2, 3, 4, 5, 6]));
+
+      expect(matrix.shape).toEqual([2, 3]);
+      expect(Array.from(matrix.data)).toEqual([1, 2, 3, 4, 5, 6]);
+    });
+
+    it("should widen a float16 matrix to float32", () => {
+      const matrix = parseNpy(buildNpy("<f2", [2, 2], [0.5, -2, 1.5, 0]));
+
+      expect(matrix.shape).toEqual([2, 2]);
+      expect(Array.from(matrix.data)).toEqual([0.5, -2, 1.5, 0]);
+    });
+
+    it("should parse int8 and uint8 matrices without copying", () => {
+      const int8 = parseNpy(buildNpy("|i1", [1, 3], [-127, 0, 64]));
+      const uint8 = parseNpy(buildNpy("|u1", [1, 2], [0b10100000, 255]));
+
+      expect(int8.data).toBeInstanceOf(Int8Array);
+      expect(Array.from(int8.data)).toEqual([-127, 0, 64]);
+      expect(uint8.data).toBeInstanceOf(Uint8Array);
+      expect(Array.from(uint8.data)).toEqual([0b10100000, 255]);
+    });
+
+    it("should reject files that are not .npy", () => {
+      expect(() => parseNpy(Buffer.from("not a matrix"))).toThrow(
+        "Not a .npy file",
+      );
+    });
+
+    it("should reject unsupported dtypes", () => {
+      const buffer = buildNpy("<f4", [1, 1], [1]);
+      buffer.write("<f8", buffer.indexOf("<f4"), "latin1");
+
+      expect(() => parseNpy(buffer)).toThrow("Unsupported .npy dtype: <f8");
+    });
+  });
+
+  describe("float16ToFloat32", () => {
+    it("should decode special values", () => {
+      const decoded = float16ToFloat32(
+        new Uint16Array([0x7c00, 0xfc00, 0x3c00]),
+      );
+
+      expect(Array.from(decoded)).toEqual([Infinity, -Infinity, 1]);
+    });
+  });
+
+  describe("searchBinaryVectorStore", () => {
+    const ids = ["a", "b", "c"];
+    const store = createBinaryVectorStore(
+      parseNpy(buildNpy("<f4", [3, 2], [1, 0, 0, 1, 1, 1])),
+      ids,
+    );
+
+    it("should rank rows by cosine similarity", () => {
+      const results = searchBinaryVectorStore(store, [0, 2], 2);
+
+      expect(results.map((result) => result.id)).toEqual(["b", "c"]);
+      expect(results[0]!.score).toBeCloseTo(1);
+      expect(results[1]!.score).toBeCloseTo(Math.SQRT1_2);
+    });
+
+    it("should reject queries with the wrong dimensions", () => {
+      expect(() => searchBinaryVectorStore(store, [1, 0, 0], 1)).toThrow(
+        "Query has 3 dimensions, index has 2",
+      );
+    });
+
+    it("should rank int8 rows by cosine similarity", () => {
+      const int8Store = createBinaryVectorStore(
+        parseNpy(buildNpy("|i1", [3, 2], [127, 0, 0, 127, 90, 90])),
+        ids,
+        "int8",
+      );
+
+      const results = searchBinaryVectorStore(int8Store, [0, 2], 2);
+
+      expect(results.map((result) => result.id)).toEqual(["b", "c"]);
+      expect(results[0]!.score).toBeCloseTo(1);
+    });
+
+    it("should rank binary rows by sign agreement", () => {
+      // Rows packed from 10 dimensions: a = all positive, b = all negative,
+      // c = first half positive
+      const binaryStore = createBinaryVectorStore(
+        parseNpy(
+          buildNpy("|u1", [3, 2], [0xff, 0xc0, 0x00, 0x00, 0xf8, 0x00]),
+        ),
+        ids,
+        "binary",
+        10,
+      );
+      const query = [1, 1, 1, 1, 1, 1, 1, 1, -1, -1];
+
+      const results = searchBinaryVectorStore(binaryStore, query, 3);
+
+      expect(results.map((result) => result.id)).toEqual(["a", "c", "b"]);
+      expect(results[0]!.score).toBeCloseTo(0.6);
+      expect(results[2]!.score).toBeCloseTo(-0.6);
+    });
+
+    it("should reject a row count that does not match the matrix", () => {
+      expect(() =>
+        createBinaryVectorStore(
+          parseNpy(buildNpy("<f4", [1, 2], [1, 0])),
+          ids,
+        ),
+      ).toThrow("Binary vector store has 1 vectors but 3 rows");
+    });
+  });
+
+  describe("parseDocstoreRows", () => {
+    it("should index node text and metadata by id", () => {
+      const rows = parseDocstoreRows({
+        "docstore/data": {
+          a: {
+            __data__: {
+              text: "text a",
+              metadata: { node_id: "node-a" },
+              relationships: { "1": { node_id: "doc-a" } },
+            },
+            __type__: "1",
+          },
+          b: {
+            __data__: JSON.stringify({ text: "text b", metadata: {} }),
+            __type__: "1",
+          },
+        },
+      });
+
+      expect(rows.get("a")).toEqual({
+        id: "a",
+        refDocId: "doc-a",
+        text: "text a",
+        metadata: { node_id: "node-a" },
+      });
+      expect(rows.get("b")?.text).toBe("text b");
+      expect(rows.get("b")?.refDocId).toBeNull();
+    });
+  });
+});
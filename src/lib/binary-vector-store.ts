@@ -0,0 +1,383 @@
+import { readFile } from "fs/promises";
+import path from "path";
+
+/**
+ * Reader for the binary vector store written by
+ * scripts/embeddings/vector_store_binary.py: a row-major `vectors.npy`
+ * matrix (float32, float16, int8 or packed sign bits) plus a `rows.json`
+ * sidecar holding each row's node id.
+ *
+ * Node has no mmap, so the matrix file is read into memory once and used in
+ * place as a typed-array view over that buffer, instead of parsing a JSON
+ * array per vector. Row text and metadata stay in the index's
+ * `docstore.json`, which is only read once a search needs them.
+ */
+
+export const VECTORS_FILE = "vectors.npy";
+export const ROWS_FILE = "rows.json";
+export const DOCSTORE_FILE = "docstore.json";
+
+export interface BinaryStoreRow {
+  id: string;
+  refDocId?: string | null;
+  text: string;
+  metadata: Record<string, unknown>;
+}
+
+export type VectorPrecision = "float32" | "float16" | "int8" | "binary";
+
+export interface BinaryVectorStore {
+  precision: VectorPrecision;
+  /** float16 is widened to Float32Array; binary rows are packed 8 bits per byte */
+  vectors: Float32Array | Int8Array | Uint8Array;
+  norms: Float32Array;
+  dimensions: number;
+  /** Docstore node id of each matrix row */
+  ids: string[];
+}
+
+export interface BinarySearchResult {
+  id: string;
+  score: number;
+}
+
+interface NpyMatrix {
+  shape: [number, number];
+  data: Float32Array | Int8Array | Uint8Array;
+}
+
+const NPY_MAGIC = "\x93NUMPY";
+
+/**
+ * Convert IEEE 754 half-precision values to float32
+ */
+export function float16ToFloat32(halves: Uint16Array): Float32Array {
+  const out = new Float32Array(halves.length);
+  for (let i = 0; i < halves.length; i++) {
+    const h = halves[i]!;
+    const sign = h & 0x8000 ? -1 : 1;
+    const exponent = (h >> 10) & 0x1f;
+    const fraction = h & 0x03ff;
+
+    if (exponent === 0) {
+      out[i] = sign * 2 ** -14 * (fraction / 1024);
+    } else if (exponent === 0x1f) {
+      out[i] = fraction ? NaN : sign * Infinity;
+    } else {
+      out[i] = sign * 2 ** (exponent - 15) * (1 + fraction / 1024);
+    }
+  }
+  return out;
+}
+
+/**
+ * Parse a 2-D little-endian float32/float16/int8/uint8 `.npy` file.
+ *
+ * float32 data is returned as a view over the buffer when it is aligned;
+ * float16 data is widened to float32 once at load time. int8 and uint8 data
+ * are always views.
+ */
+export function parseNpy(buffer: Buffer): NpyMatrix {
+  if (buffer.toString("latin1", 0, 6) !== NPY_MAGIC) {
+    throw new Error("Not a .npy file");
+  }
+
+  const major = buffer.readUInt8(6);
+  const headerLength =
+    major === 1 ? buffer.readUInt16LE(8) : buffer.readUInt32LE(8);
+  const headerStart = major === 1 ? 10 : 12;
+  const dataOffset = headerStart + headerLength;
+  const header = buffer.toString("latin1", headerStart, dataOffset);
+
+  const descr = /'descr':\s*'([^']+)'/.exec(header)?.[1];
+  const fortranOrder = /'fortran_order':\s*True/.test(header);
+  const shapeMatch = /'shape':\s*\((\d+),\s*(\d+)\)/.exec(header);
+
+  if (fortranOrder) {
+    throw new Error("Fortran-ordered .npy matrices are not supported");
+  }
+  if (!shapeMatch) {
+    throw new Error(`Expected a 2-D matrix, got header: ${header.trim()}`);
+  }
+
+  const rows = Number(shapeMatch[1]);
+  const columns = Number(shapeMatch[2]);
+  const length = rows * columns;
+  const absoluteOffset = buffer.byteOffset + dataOffset;
+
+  let data: Float32Array | Int8Array | Uint8Array;
+  if (descr === "|i1") {
+    data = new Int8Array(buffer.buffer, absoluteOffset, length);
+  } else if (descr === "|u1") {
+    data = new Uint8Array(buffer.buffer, absoluteOffset, length);
+  } else if (descr === "<f4") {
+    data =
+      absoluteOffset % 4 === 0
+        ? new Float32Array(buffer.buffer, absoluteOffset, length)
+        : new Float32Array(
+            buffer.buffer.slice(absoluteOffset, absoluteOffset + length * 4),
+          );
+  } else if (descr === "<f2") {
+    const halves =
+      absoluteOffset % 2 === 0
+        ? new Uint16Array(buffer.buffer, absoluteOffset, length)
+        : new Uint16Array(
+            buffer.buffer.slice(absoluteOffset, absoluteOffset + length * 2),
+          );
+    data = float16ToFloat32(halves);
+  } else {
+    throw new Error(`Unsupported .npy dtype: ${descr}`);
+  }
+
+  return { shape: [rows, columns], data };
+}
+
+function computeNorms(
+  vectors: Float32Array | Int8Array,
+  dimensions: number,
+): Float32Array {
+  const count = dimensions ? vectors.length / dimensions : 0;
+  const norms = new Float32Array(count);
+  for (let row = 0; row < count; row++) {
+    let sum = 0;
+    const offset = row * dimensions;
+    for (let i = 0; i < dimensions; i++) {
+      const value = vectors[offset + i]!;
+      sum += value * value;
+    }
+    norms[row] = Math.sqrt(sum);
+  }
+  return norms;
+}
+
+/**
+ * Build a store from an already-parsed matrix and its row ids.
+ *
+ * For binary stores, `dimensions` is the unpacked width recorded in the
+ * sidecar (the matrix has one byte per 8 dimensions).
+ */
+export function createBinaryVectorStore(
+  matrix: NpyMatrix,
+  ids: string[],
+  precision: VectorPrecision = "float32",
+  dimensions: number = matrix.shape[1],
+): BinaryVectorStore {
+  const [count] = matrix.shape;
+  if (count !== ids.length) {
+    throw new Error(
+      `Binary vector store has ${count} vectors but ${ids.length} rows`,
+    );
+  }
+  if (precision === "binary") {
+    if (!(matrix.data instanceof Uint8Array)) {
+      throw new Error("Binary precision requires a uint8 matrix");
+    }
+    return {
+      precision,
+      vectors: matrix.data,
+      norms: new Float32Array(0),
+      dimensions,
+      ids,
+    };
+  }
+  if (matrix.data instanceof Uint8Array) {
+    throw new Error(`A uint8 matrix cannot be read as ${precision}`);
+  }
+  return {
+    precision,
+    vectors: matrix.data,
+    norms: computeNorms(matrix.data, dimensions),
+    dimensions,
+    ids,
+  };
+}
+
+/**
+ * Load a binary vector store from an index directory.
+ * Returns null when the directory has no binary store.
+ */
+export async function loadBinaryVectorStore(
+  indexPath: string,
+): Promise<BinaryVectorStore | null> {
+  let vectorsBuffer: Buffer;
+  let rowsText: string;
+  try {
+    [vectorsBuffer, rowsText] = await Promise.all([
+      readFile(path.join(indexPath, VECTORS_FILE)),
+      readFile(path.join(indexPath, ROWS_FILE), "utf-8"),
+    ]);
+  } catch (error) {
+    if ((error as NodeJS.ErrnoException).code === "ENOENT") {
+      return null;
+    }
+    throw error;
+  }
+
+  const sidecar = JSON.parse(rowsText) as {
+    dtype?: VectorPrecision;
+    dimensions?: number;
+    ids?: string[];
+  };
+  if (!sidecar.ids) {
+    // Written before the sidecar held only ids; regenerating rewrites it
+    throw new Error(`${ROWS_FILE} has no row ids`);
+  }
+  const matrix = parseNpy(vectorsBuffer);
+  return createBinaryVectorStore(
+    matrix,
+    sidecar.ids,
+    sidecar.dtype ?? "float32",
+    sidecar.dimensions ?? matrix.shape[1],
+  );
+}
+
+interface DocstoreNode {
+  text?: string;
+  metadata?: Record<string, unknown>;
+  relationships?: Record<string, { node_id?: string } | undefined>;
+}
+
+/**
+ * Index a persisted LlamaIndex docstore's nodes by id, as binary store rows
+ */
+export function parseDocstoreRows(
+  docstore: unknown,
+): Map<string, BinaryStoreRow> {
+  const data =
+    (docstore as { "docstore/data"?: Record<string, { __data__: unknown }> })[
+      "docstore/data"
+    ] ?? {};
+  const rows = new Map<string, BinaryStoreRow>();
+  for (const [id, entry] of Object.entries(data)) {
+    // Some docstore writers store node data as a JSON string
+    const node = (
+      typeof entry.__data__ === "string"
+        ? JSON.parse(entry.__data__)
+        : entry.__data__
+    ) as DocstoreNode;
+    rows.set(id, {
+      id,
+      // "1" is the SOURCE relationship: the document the node came from
+      refDocId: node.relationships?.["1"]?.node_id ?? null,
+      text: node.text ?? "",
+      metadata: node.metadata ?? {},
+    });
+  }
+  return rows;
+}
+
+/**
+ * Load the text and metadata of an index directory's rows from its docstore
+ */
+export async function loadDocstoreRows(
+  indexPath: string,
+): Promise<Map<string, BinaryStoreRow>> {
+  const docstoreText = await readFile(
+    path.join(indexPath, DOCSTORE_FILE),
+    "utf-8",
+  );
+  return parseDocstoreRows(JSON.parse(docstoreText));
+}
+
+// Number of set bits in each byte value
+const POPCOUNT = Uint8Array.from({ length: 256 }, (_, byte) => {
+  let bits = 0;
+  for (let value = byte; value; value >>= 1) {
+    bits += value & 1;
+  }
+  return bits;
+});
+
+/**
+ * Pack the query's sign bits the way numpy.packbits does (first dimension
+ * in the most significant bit)
+ */
+function packSignBits(query: ArrayLike<number>): Uint8Array {
+  const packed = new Uint8Array(Math.ceil(query.length / 8));
+  for (let i = 0; i < query.length; i++) {
+    if (query[i]! > 0) {
+      packed[i >> 3] = packed[i >> 3]! | (0x80 >> (i & 7));
+    }
+  }
+  return packed;
+}
+
+/**
+ * Score every row by the similarity of its sign bits to the query's:
+ * 1 - 2 * hamming / dimensions, which approximates cosine similarity
+ */
+function scoreBinaryRows(
+  store: BinaryVectorStore,
+  query: ArrayLike<number>,
+): Float32Array {
+  const { vectors, dimensions, ids } = store;
+  const packedQuery = packSignBits(query);
+  const bytesPerRow = packedQuery.length;
+  const scores = new Float32Array(ids.length);
+
+  for (let row = 0; row < ids.length; row++) {
+    const offset = row * bytesPerRow;
+    let hamming = 0;
+    for (let i = 0; i < bytesPerRow; i++) {
+      hamming += POPCOUNT[(vectors[offset + i]! ^ packedQuery[i]!) & 0xff]!;
+    }
+    scores[row] = 1 - (2 * hamming) / dimensions;
+  }
+  return scores;
+}
+
+/**
+ * Return the ids of the topK rows by cosine similarity to the query vector
+ */
+export function searchBinaryVectorStore(
+  store: BinaryVectorStore,
+  query: ArrayLike<number>,
+  topK: number,
+): BinarySearchResult[] {
+  const { vectors, norms, dimensions, ids } = store;
+  if (query.length !== dimensions) {
+    throw new Error(
+      `Query has ${query.length} dimensions, index has ${dimensions}`,
+    );
+  }
+
+  const scores =
+    store.precision === "binary"
+      ? scoreBinaryRows(store, query)
+      : scoreFloatRows(vectors, norms, dimensions, ids.length, query);
+
+  return Array.from(scores.keys())
+    .sort((a, b) => scores[b]! - scores[a]!)
+    .slice(0, topK)
+    .map((row) => ({ id: ids[row]!, score: scores[row]! }));
+}
+
+/**
+ * Cosine similarity of every row to the query. int8 rows are scaled per
+ * vector, which cosine similarity ignores, so they are scored as-is.
+ */
+function scoreFloatRows(
+  vectors: Float32Array | Int8Array | Uint8Array,
+  norms: Float32Array,
+  dimensions: number,
+  count: number,
+  query: ArrayLike<number>,
+): Float32Array {
+  let queryNorm = 0;
+  for (let i = 0; i < dimensions; i++) {
+    queryNorm += query[i]! * query[i]!;
+  }
+  queryNorm = Math.sqrt(queryNorm);
+
+  const scores = new Float32Array(count);
+  for (let row = 0; row < count; row++) {
+    const offset = row * dimensions;
+    let dot = 0;
+    for (let i = 0; i < dimensions; i++) {
+      dot += vectors[offset + i]! * query[i]!;
+    }
+    const denominator = norms[row]! * queryNorm;
+    scores[row] = denominator ? dot / denominator : 0;
+  }
+  return scores;
+}
@@ -1,4 +1,5 @@
 import { OpenAI } from "openai";
+import { Prisma } from "@prisma/client";
 import { db as prisma } from "@/server/db";
 import { env } from "@/env";
 import { logger } from "@/lib/logger";
@@ -12,6 +13,18 @@ import { generateNodeUrl, extractNodeInfo } from "./url-utils";
 const DEFAULT_ROADMAP_ID = "electrician-bc";
 const CACHE_TTL_MS = 5 * 60 * 1000; // 5 minutes
 
+// Binary candidates fetched per result before re-ranking at full precision
+// (matches BINARY_RERANK_FACTOR in scripts/embeddings/quantization.py)
+const BINARY_RERANK_FACTOR = 4;
+
+interface SimilarDocumentRow {
+  id: string;
+  nodeId: string | null;
+  content: string;
+  metadata: unknown;
+  distance: number;
+}
+
 interface CachedQueryResult {
   response: QueryResponse;
   timestamp: number;
@@ -20,20 +33,87 @@ interface CachedQueryResult {
 // Simple in-memory cache for query results
 const queryCache = new Map<string, CachedQueryResult>();
 
+interface ActiveIndex {
+  id: string;
+  documentCount: number;
+  modelName: string;
+  dimensions: number;
+  precision: string;
+  baseIndexId: string | null;
+}
+
 /**
- * Generate an embedding vector for a query using OpenAI
+ * Find the active index version for a roadmap/user
  */
-async function generateQueryEmbedding(query: string): Promise<number[]> {
+async function getActiveIndex(
+  roadmapId: string,
+  userId?: string,
+): Promise<ActiveIndex> {
+  const activeIndex = await prisma.embeddingIndex.findFirst({
+    where: {
+      roadmapId,
+      userId: userId ?? null,
+      isActive: true,
+    },
+    select: {
+      id: true,
+      documentCount: true,
+      modelName: true,
+      dimensions: true,
+      precision: true,
+      baseIndexId: true,
+    },
+  });
+
+  if (!activeIndex) {
+    throw new Error(
+      `No active embedding index found for roadmap: ${roadmapId}${userId ? ` user: ${userId}` : ""}`,
+    );
+  }
+
+  if (
+    !Number.isInteger(activeIndex.dimensions) ||
+    activeIndex.dimensions <= 0
+  ) {
+    throw new Error(
+      `Invalid dimensions for embedding index ${activeIndex.id}: ${activeIndex.dimensions}`,
+    );
+  }
+
+  logger.info("Found active index", {
+    indexId: activeIndex.id,
+    documentCount: activeIndex.documentCount,
+    modelName: activeIndex.modelName,
+    dimensions: activeIndex.dimensions,
+    precision: activeIndex.precision,
+    baseIndexId: activeIndex.baseIndexId,
+  });
+
+  return activeIndex;
+}
+
+/**
+ * Generate an embedding vector for a query using OpenAI, with the model and
+ * dimensions the index was built with
+ */
+async function generateQueryEmbedding(
+  query: string,
+  activeIndex: ActiveIndex,
+): Promise<number[]> {
   const openai = new OpenAI({
     apiKey: env.OPENAI_API_KEY,
   });
 
   logger.info("Generating query embedding", { queryLength: query.length });
 
+  // Only text-embedding-3 models accept a dimensions parameter
   const response = await openai.embeddings.create({
-    model: "text-embedding-3-small",
+    model: activeIndex.modelName,
     input: query,
     encoding_format: "float",
+    ...(activeIndex.modelName.startsWith("text-embedding-3")
+      ? { dimensions: activeIndex.dimensions }
+      : {}),
   });
 
   const embedding = response.data[0]?.embedding;
@@ -45,14 +125,97 @@ async function generateQueryEmbedding(query: string): Promise<number[]> {
   return embedding;
 }
 
+/**
+ * Nearest rows of one index version, with their cosine distances. With
+ * overlayId, rows from the global files that overlay replaces are left out.
+ */
+function nearestRowsSql(
+  activeIndex: ActiveIndex,
+  indexId: string,
+  embeddingString: string,
+  topK: number,
+  overlayId?: string,
+): Prisma.Sql {
+  // Type modifiers can't be bind parameters; dimensions is a validated integer
+  const dimensions = Prisma.raw(String(activeIndex.dimensions));
+  const replaced = overlayId
+    ? Prisma.sql`AND NOT EXISTS (
+        SELECT 1 FROM embedding_indexes o
+        WHERE o.id = ${overlayId}
+          AND (o."overlayFiles" -> (metadata->>'file_name')) IS NOT NULL
+      )`
+    : Prisma.empty;
+
+  // Using <=> operator for cosine distance (lower is more similar). Each
+  // ORDER BY and the vector_dims() predicate match the partial HNSW index
+  // built for the index's precision and dimensions, so it is used instead of
+  // a sequential scan. Rows of the active version are never retired, and the
+  // extra predicate lets an HNSW index scoped to active rows match too.
+  if (activeIndex.precision === "float16") {
+    return Prisma.sql`
+      SELECT
+        id,
+        "nodeId",
+        content,
+        metadata,
+        embedding::halfvec(${dimensions}) <=> ${embeddingString}::halfvec(${dimensions}) as distance
+      FROM embedding_documents
+      WHERE "indexId" = ${indexId}
+        AND vector_dims(embedding) = ${dimensions}
+        AND NOT retired
+        ${replaced}
+      ORDER BY embedding::halfvec(${dimensions}) <=> ${embeddingString}::halfvec(${dimensions})
+      LIMIT ${topK}
+    `;
+  }
+  if (activeIndex.precision === "binary") {
+    // Hamming distance over sign bits selects candidates; full-precision
+    // cosine distance re-ranks them
+    return Prisma.sql`
+      SELECT
+        id,
+        "nodeId",
+        content,
+        metadata,
+        embedding <=> ${embeddingString}::vector as distance
+      FROM (
+        SELECT id, "nodeId", content, metadata, embedding
+        FROM embedding_documents
+        WHERE "indexId" = ${indexId}
+          AND vector_dims(embedding) = ${dimensions}
+          AND NOT retired
+          ${replaced}
+        ORDER BY binary_quantize(embedding)::bit(${dimensions}) <~> binary_quantize(${embeddingString}::vector)
+        LIMIT ${topK * BINARY_RERANK_FACTOR}
+      ) candidates
+      ORDER BY distance
+      LIMIT ${topK}
+    `;
+  }
+  return Prisma.sql`
+    SELECT
+      id,
+      "nodeId",
+      content,
+      metadata,
+      embedding::vector(${dimensions}) <=> ${embeddingString}::vector(${dimensions}) as distance
+    FROM embedding_documents
+    WHERE "indexId" = ${indexId}
+      AND vector_dims(embedding) = ${dimensions}
+      AND NOT retired
+      ${replaced}
+    ORDER BY embedding::vector(${dimensions}) <=> ${embeddingString}::vector(${dimensions})
+    LIMIT ${topK}
+  `;
+}
+
 /**
  * Perform vector similarity search using pgvector
  */
 async function searchSimilarDocuments(
-  roadmapId: string,
+  activeIndex: ActiveIndex,
   queryEmbedding: number[],
   topK: number,
-  userId?: string,
 ): Promise<
   Array<{
     id: string;
@@ -62,76 +225,41 @@ async function searchSimilarDocuments(
     distance: number;
   }>
 > {
-  logger.info("Searching similar documents", { roadmapId, topK, userId });
-
-  // Get the active index ID for this roadmap/user
-  const activeIndex = await prisma.embeddingIndex.findFirst({
-    where: {
-      roadmapId,
-      userId: userId ?? null,
-      isActive: true,
-    },
-    select: {
-      id: true,
-      documentCount: true,
-    },
-  });
-
-  if (!activeIndex) {
-    throw new Error(
-      `No active embedding index found for roadmap: ${roadmapId}${userId ? ` user: ${userId}` : ""}`,
-    );
-  }
-
-  logger.info("Found active index", {
+  logger.info("Searching similar documents", {
     indexId: activeIndex.id,
-    documentCount: activeIndex.documentCount,
+    baseIndexId: activeIndex.baseIndexId,
+    topK,
   });
 
   // Convert embedding to pgvector format string
   const embeddingString = `[${queryEmbedding.join(",")}]`;
 
-  // Perform vector similarity search using raw SQL with pgvector
-  // Using <=> operator for cosine distance (lower is more similar)
-  const results = await prisma.$queryRaw<
-    Array<{
-      id: string;
-      nodeId: string | null;
-      content: string;
-      metadata: unknown;
-      distance: number;
-    }>
-  >`
-    SELECT
-      id,
-      "nodeId",
-      content,
-      metadata,
-      embedding <=> ${embeddingString}::vector as distance
-    FROM embedding_documents
-    WHERE "indexId" = ${activeIndex.id}
-    ORDER BY embedding <=> ${embeddingString}::vector
-    LIMIT ${topK}
-  `;
+  // A user overlay only stores the user's own chunks: merge its top k with
+  // the top k of the global index it is stacked on
+  const query = activeIndex.baseIndexId
+    ? Prisma.sql`
+        SELECT id, "nodeId", content, metadata, distance
+        FROM (
+          (${nearestRowsSql(activeIndex, activeIndex.id, embeddingString, topK)})
+          UNION ALL
+          (${nearestRowsSql(activeIndex, activeIndex.baseIndexId, embeddingString, topK, activeIndex.id)})
+        ) merged
+        ORDER BY distance
+        LIMIT ${topK}
+      `
+    : nearestRowsSql(activeIndex, activeIndex.id, embeddingString, topK);
+  const results = await prisma.$queryRaw<SimilarDocumentRow[]>(query);
 
   logger.info("Vector search completed", { resultsFound: results.length });
 
-  return results.map(
-    (row: {
-      id: string;
-      nodeId: string | null;
-      content: string;
-      metadata: unknown;
-      distance: number;
-    }) => ({
-      ...row,
-      nodeId: row.nodeId,
-      metadata:
-        typeof row.metadata === "object" && row.metadata !== null
-          ? (row.metadata as Record<string, unknown>)
-          : {},
-    }),
-  );
+  return results.map((row: SimilarDocumentRow) => ({
+    ...row,
+    nodeId: row.nodeId,
+    metadata:
+      typeof row.metadata === "object" && row.metadata !== null
+        ? (row.metadata as Record<string, unknown>)
+        : {},
+  }));
 }
 
 /**
@@ -231,18 +359,23 @@ export async function queryEmbeddings(
   }
 
   try {
-    // Step 1: Generate embedding for the query
-    const queryEmbedding = await generateQueryEmbedding(request.query);
+    // Step 1: Find the active index, which determines how queries are embedded
+    const activeIndex = await getActiveIndex(roadmapId, userId);
 
-    // Step 2: Search for similar documents using pgvector
+    // Step 2: Generate embedding for the query
+    const queryEmbedding = await generateQueryEmbedding(
+      request.query,
+      activeIndex,
+    );
+
+    // Step 3: Search for similar documents using pgvector
     const results = await searchSimilarDocuments(
-      roadmapId,
+      activeIndex,
       queryEmbedding,
       topK,
-      userId,
     );
 
-    // Step 3: Build response
+    // Step 4: Build response
     const sources: SourceDocument[] = [];
     const contextParts: string[] = [];
 
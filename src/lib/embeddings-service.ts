@@ -4,9 +4,17 @@ import {
   storageContextFromDefaults,
   VectorStoreIndex,
 } from "llamaindex";
+import { readFile } from "fs/promises";
 import path from "path";
 import { env } from "@/env";
 import { logger } from "@/lib/logger";
+import {
+  loadBinaryVectorStore,
+  loadDocstoreRows,
+  searchBinaryVectorStore,
+  type BinaryStoreRow,
+  type BinaryVectorStore,
+} from "./binary-vector-store";
 import { generateNodeUrl, extractNodeInfo } from "./url-utils";
 
 export interface SourceDocument {
@@ -44,6 +52,134 @@ interface CachedIndex {
 
 const indexCache = new Map<string, CachedIndex>();
 
+interface CachedBinaryStore {
+  store: BinaryVectorStore | null;
+  /** Row text and metadata, read from docstore.json on the first search */
+  rows?: Promise<Map<string, BinaryStoreRow>>;
+  timestamp: number;
+}
+
+const binaryStoreCache = new Map<string, CachedBinaryStore>();
+
+interface IndexEmbeddingSettings {
+  model: string;
+  dimensions?: number;
+}
+
+const DEFAULT_EMBEDDING_SETTINGS: IndexEmbeddingSettings = {
+  model: "text-embedding-3-small",
+};
+
+interface CachedEmbeddingSettings {
+  settings: IndexEmbeddingSettings;
+  timestamp: number;
+}
+
+const embeddingSettingsCache = new Map<string, CachedEmbeddingSettings>();
+
+/**
+ * Read the model and dimensions a roadmap's index was generated with from its
+ * metadata.json, so queries are embedded into the same space
+ */
+async function loadEmbeddingSettings(
+  roadmapId: string,
+): Promise<IndexEmbeddingSettings> {
+  const cached = embeddingSettingsCache.get(roadmapId);
+  const now = Date.now();
+
+  if (cached && now - cached.timestamp < INDEX_CACHE_TTL_MS) {
+    return cached.settings;
+  }
+
+  const metadataPath = path.join(
+    EMBEDDINGS_BASE_PATH,
+    roadmapId,
+    "index",
+    "metadata.json",
+  );
+  let settings = DEFAULT_EMBEDDING_SETTINGS;
+  try {
+    const metadata = JSON.parse(await readFile(metadataPath, "utf-8")) as {
+      model?: string;
+      dimensions?: number;
+    };
+    settings = {
+      model: metadata.model ?? DEFAULT_EMBEDDING_SETTINGS.model,
+      dimensions: metadata.dimensions,
+    };
+  } catch (error) {
+    logger.warn("Failed to read index metadata, using default model", {
+      roadmapId,
+      error: error instanceof Error ? error.message : String(error),
+    });
+  }
+
+  embeddingSettingsCache.set(roadmapId, { settings, timestamp: now });
+  return settings;
+}
+
+function createEmbedModel(
+  settings: IndexEmbeddingSettings = DEFAULT_EMBEDDING_SETTINGS,
+): OpenAIEmbedding {
+  // Only text-embedding-3 models accept a dimensions parameter
+  return new OpenAIEmbedding({
+    model: settings.model,
+    apiKey: env.OPENAI_API_KEY,
+    ...(settings.dimensions && settings.model.startsWith("text-embedding-3")
+      ? { dimensions: settings.dimensions }
+      : {}),
+  });
+}
+
+/**
+ * Load the binary vector store (vectors.npy + rows.json) for a roadmap, if
+ * the generator wrote one. Returns null so callers fall back to the
+ * LlamaIndex JSON index.
+ */
+async function loadBinaryStore(
+  roadmapId: string,
+): Promise<BinaryVectorStore | null> {
+  const cached = binaryStoreCache.get(roadmapId);
+  const now = Date.now();
+
+  if (cached && now - cached.timestamp < INDEX_CACHE_TTL_MS) {
+    return cached.store;
+  }
+
+  const indexPath = path.join(EMBEDDINGS_BASE_PATH, roadmapId, "index");
+  const store = await loadBinaryVectorStore(indexPath);
+
+  if (store) {
+    logger.info("Binary vector store loaded and cached", {
+      roadmapId,
+      vectors: store.ids.length,
+      dimensions: store.dimensions,
+    });
+  }
+
+  binaryStoreCache.set(roadmapId, { store, timestamp: now });
+  return store;
+}
+
+/**
+ * Text and metadata of a roadmap's binary store rows, read from its
+ * docstore.json once a search needs them rather than at load time
+ */
+function loadBinaryStoreRows(
+  roadmapId: string,
+): Promise<Map<string, BinaryStoreRow>> {
+  const cached = binaryStoreCache.get(roadmapId)!;
+  if (!cached.rows) {
+    const indexPath = path.join(EMBEDDINGS_BASE_PATH, roadmapId, "index");
+    cached.rows = loadDocstoreRows(indexPath).catch((error) => {
+      // Let the next search try again
+      cached.rows = undefined;
+      throw error;
+    });
+  }
+  return cached.rows;
+}
+
 async function loadIndex(roadmapId: string): Promise<VectorStoreIndex> {
   const cached = indexCache.get(roadmapId);
   const now = Date.now();
@@ -56,11 +192,9 @@ async function loadIndex(roadmapId: string): Promise<VectorStoreIndex> {
 
   logger.info("Loading embeddings index", { roadmapId, indexPath });
 
-  const embedModel = new OpenAIEmbedding({
-    model: "text-embedding-3-small",
-    apiKey: env.OPENAI_API_KEY,
-  });
-  Settings.embedModel = embedModel;
+  Settings.embedModel = createEmbedModel(
+    await loadEmbeddingSettings(roadmapId),
+  );
 
   const storageContext = await storageContextFromDefaults({
     persistDir: indexPath,
@@ -77,11 +211,13 @@ async function loadIndex(roadmapId: string): Promise<VectorStoreIndex> {
   return index;
 }
 
+interface RetrievedNode {
+  node: { metadata: Record<string, unknown>; text?: string };
+  score?: number;
+}
+
 function buildSourceDocument(
-  nodeWithScore: {
-    node: { metadata: Record<string, unknown>; text?: string };
-    score?: number;
-  },
+  nodeWithScore: RetrievedNode,
   roadmapId: string,
 ): SourceDocument {
   const node = nodeWithScore.node;
@@ -121,13 +257,46 @@ function buildSourceDocument(
   };
 }
 
-export async function queryEmbeddings(
-  request: QueryRequest,
-): Promise<QueryResponse> {
-  const roadmapId = request.roadmap_id ?? DEFAULT_ROADMAP_ID;
-  const topK = request.top_k ?? 5;
+async function retrieveNodes(
+  roadmapId: string,
+  query: string,
+  topK: number,
+): Promise<RetrievedNode[]> {
+  const binaryStore = await loadBinaryStore(roadmapId).catch((error) => {
+    logger.warn("Failed to load binary vector store, using JSON index", {
+      roadmapId,
+      error: error instanceof Error ? error.message : String(error),
+    });
+    return null;
+  });
 
-  logger.info("Querying embeddings", { roadmapId, topK, query: request.query });
+  if (binaryStore) {
+    const queryEmbedding = await createEmbedModel(
+      await loadEmbeddingSettings(roadmapId),
+    )
+      .getTextEmbedding(query)
+      .catch((error) => {
+        logger.error("Failed to embed query", error, { roadmapId });
+        throw new Error(
+          `Failed to embed query: ${error instanceof Error ? error.message : String(error)}`,
+        );
+      });
+
+    const results = searchBinaryVectorStore(binaryStore, queryEmbedding, topK);
+    const rows = await loadBinaryStoreRows(roadmapId).catch((error) => {
+      logger.error("Failed to load binary store rows", error, { roadmapId });
+      throw new Error(
+        `Failed to load binary store rows: ${error instanceof Error ? error.message : String(error)}`,
+      );
+    });
+    return results.map(({ id, score }) => {
+      const row = rows.get(id);
+      return {
+        node: { metadata: row?.metadata ?? {}, text: row?.text ?? "" },
+        score,
+      };
+    });
+  }
 
   const index = await loadIndex(roadmapId).catch((error) => {
     logger.error("Failed to load embeddings index", error, { roadmapId });
@@ -137,14 +306,23 @@ export async function queryEmbeddings(
   });
 
   const retriever = index.asRetriever({ similarityTopK: topK });
-  const nodes = await retriever
-    .retrieve({ query: request.query })
-    .catch((error) => {
-      logger.error("Failed to retrieve embeddings", error, { roadmapId });
-      throw new Error(
-        `Failed to retrieve embeddings: ${error instanceof Error ? error.message : String(error)}`,
-      );
-    });
+  return retriever.retrieve({ query }).catch((error) => {
+    logger.error("Failed to retrieve embeddings", error, { roadmapId });
+    throw new Error(
+      `Failed to retrieve embeddings: ${error instanceof Error ? error.message : String(error)}`,
+    );
+  });
+}
+
+export async function queryEmbeddings(
+  request: QueryRequest,
+): Promise<QueryResponse> {
+  const roadmapId = request.roadmap_id ?? DEFAULT_ROADMAP_ID;
+  const topK = request.top_k ?? 5;
+
+  logger.info("Querying embeddings", { roadmapId, topK, query: request.query });
+
+  const nodes = await retrieveNodes(roadmapId, request.query, topK);
 
   const sources: SourceDocument[] = [];
   const contextParts: string[] = [];